@@ -0,0 +1,151 @@
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from waitress.server import BaseWSGIServer, MultiSocketServer
+
+from dexcom_browser_source.accounts import AccountSettings, configured_accounts
+from dexcom_browser_source.config import AppConfig
+from dexcom_browser_source.fake_share import FakeShareServer
+from dexcom_browser_source.load_test import CLIENT_CHART_SIZES, SimulatedClient, get_json, percentile, routes, wait_until_serving
+from dexcom_browser_source.server import create_app, create_waitress_server, shutdown_app, stop_waitress_server
+from dexcom_browser_source.server_settings import SERVER_DEFAULT_THREADS
+
+try:
+    import resource
+except ImportError:
+    # windows, peak rss is reported as null
+    resource = None
+
+
+def peak_rss_mb(who: int) -> float | None:
+    if resource is None:
+        return None
+    # kilobytes on linux, bytes on macos
+    divisor: int = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss / divisor
+
+
+def run(arguments: argparse.Namespace) -> dict[str, object]:
+    share: FakeShareServer = FakeShareServer(interval=arguments.interval, latency=arguments.latency, error_rate=arguments.error_rate)
+    share.start()
+    with tempfile.TemporaryDirectory() as config_path:
+        app_config: AppConfig = AppConfig(custom_config_path=Path(config_path))
+        app_config.config['dexcom']['account'] = {"username": "benchmark", "password": "benchmark"}
+        app_config.config['dexcom']['share_url'] = share.url
+        # the default account plus named ones, the clients are spread over all of them
+        app_config.config['accounts'] = {
+            f"benchmark-{index}": {"username": f"benchmark-{index}", "password": "benchmark"} for index in range(2, arguments.accounts + 1)}
+        accounts: list[AccountSettings] = list(configured_accounts(app_config=app_config).values())
+
+        started: float = time.perf_counter()
+        app = create_app(app_config=app_config)
+        waitress_server: MultiSocketServer | BaseWSGIServer = create_waitress_server(app=app, host="127.0.0.1", port=0, threads=arguments.threads)
+        port: int = waitress_server.effective_port
+        server_thread: threading.Thread = threading.Thread(target=waitress_server.run, daemon=True)
+        server_thread.start()
+        try:
+            wait_until_serving(port=port, timeout=arguments.ready_timeout)
+            first_reading_ms: float = (time.perf_counter() - started) * 1000
+
+            client_routes: list[dict[str, str]] = [
+                routes(hours=arguments.hours, app_config=app_config, url_prefix=account.url_prefix) for account in accounts]
+            deadline: float = time.perf_counter() + arguments.duration
+            clients: list[SimulatedClient] = [
+                SimulatedClient(port=port, routes=client_routes[index % len(accounts)],
+                                chart_size=CLIENT_CHART_SIZES[index % len(CLIENT_CHART_SIZES)], deadline=deadline)
+                for index in range(arguments.clients)]
+            load_started: float = time.perf_counter()
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed: float = time.perf_counter() - load_started
+
+            renderer: dict[str, object] = get_json(port=port, path="/api/renderer")
+            cache: dict[str, object] = get_json(port=port, path="/api/cache")
+        finally:
+            _ = stop_waitress_server(app=app, waitress_server=waitress_server, loop_thread=server_thread, timeout=5.0)
+            shutdown_app(app)
+        share.stop()
+
+    results_by_route: dict[str, dict[str, object]] = {}
+    for name in client_routes[0]:
+        latencies: list[float] = [latency for client in clients for latency in client.latencies[name]]
+        statuses: dict[int, int] = {}
+        for client in clients:
+            for status, count in client.statuses[name].items():
+                statuses[status] = statuses.get(status, 0) + count
+        results_by_route[name] = {
+            "requests": len(latencies),
+            "throughput_rps": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+            "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+            "mean_ms": statistics.fmean(latencies) * 1000 if latencies else None,
+            "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        }
+
+    total_requests: int = sum(int(route["requests"]) for route in results_by_route.values())
+    return {
+        "clients": arguments.clients,
+        "accounts": arguments.accounts,
+        "threads": arguments.threads,
+        "duration_s": elapsed,
+        "share_latency_s": arguments.latency,
+        "share_error_rate": arguments.error_rate,
+        "first_reading_ms": first_reading_ms,
+        "total_requests": total_requests,
+        "throughput_rps": total_requests / elapsed,
+        "routes": results_by_route,
+        "chart_render": renderer,
+        "chart_cache": cache,
+        "upstream": share.stats(),
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF) if resource is not None else None,
+        # the chart render processes, counted once they have exited
+        "peak_rss_children_mb": peak_rss_mb(resource.RUSAGE_CHILDREN) if resource is not None else None,
+    }
+
+
+# percentage change of each route's p50 and p99 against an earlier run's json
+def compare(results: dict[str, object], baseline: dict[str, object]) -> dict[str, dict[str, float | None]]:
+    changes: dict[str, dict[str, float | None]] = {}
+    for name, route in results["routes"].items():
+        before: dict[str, object] | None = baseline.get("routes", {}).get(name)
+        changes[name] = {}
+        for metric in ("p50_ms", "p99_ms", "throughput_rps"):
+            old: float | None = before.get(metric) if before is not None else None
+            new: float | None = route.get(metric)
+            changes[name][metric] = (new - old) / old * 100 if old and new is not None else None
+    return changes
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Load test Dexcom Browser Source against a fake Dexcom Share")
+    _ = parser.add_argument("--clients", type=int, default=16, help="simulated obs browser sources")
+    _ = parser.add_argument("--accounts", type=int, default=1, help="dexcom accounts served, each under its own /u/<name>")
+    _ = parser.add_argument("--threads", type=int, default=SERVER_DEFAULT_THREADS, help="waitress worker threads")
+    _ = parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    _ = parser.add_argument("--hours", type=int, default=3, help="hours of history the chart routes ask for")
+    _ = parser.add_argument("--interval", type=float, default=300.0, help="seconds between fake readings")
+    _ = parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake share takes to answer")
+    _ = parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake share requests that fail")
+    _ = parser.add_argument("--ready-timeout", type=float, default=120.0, help="seconds to wait for the first reading, share failures back off")
+    _ = parser.add_argument("--output", type=Path, help="write the results as json to this file")
+    _ = parser.add_argument("--baseline", type=Path, help="an earlier --output to compare p50, p99 and throughput against")
+    arguments: argparse.Namespace = parser.parse_args()
+
+    results: dict[str, object] = run(arguments=arguments)
+    if arguments.baseline is not None:
+        results["change_percent"] = compare(results=results, baseline=json.loads(arguments.baseline.read_text()))
+    print(json.dumps(results, indent=2))
+    if arguments.output is not None:
+        _ = arguments.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# modules that must stay out of the gui's startup path, they are only needed once the server thread runs
+HEAVY_MODULES: list[str] = ["flask", "waitress", "pydexcom", "matplotlib", "numpy"]
+
+# runs in a fresh interpreter each time so nothing is already imported or cached in memory
+TRAY_PROBE: str = """
+import json, sys, time
+started = time.perf_counter()
+from PySide6.QtCore import QTimer
+from PySide6.QtWidgets import QApplication, QSystemTrayIcon
+from dexcom_browser_source.config import AppConfig
+from dexcom_browser_source.system_tray import SystemTrayIcon
+imported = time.perf_counter()
+if {assume_tray}:
+    QSystemTrayIcon.isSystemTrayAvailable = staticmethod(lambda: True)
+app = QApplication(sys.argv)
+app_config = AppConfig(custom_config_path={config_path!r})
+system_tray_icon = SystemTrayIcon(parent=app, app=app, app_config=app_config)
+system_tray_icon.show()
+result = {{}}
+def report():
+    result.update(
+        import_ms=(imported - started) * 1000,
+        tray_ms=(time.perf_counter() - started) * 1000,
+        heavy_modules=sorted(name for name in {heavy_modules!r} if name in sys.modules),
+    )
+    app.quit()
+# fires on the first pass through the event loop, i.e. once the tray icon can actually be shown
+QTimer.singleShot(0, report)
+app.exec()
+print(json.dumps(result))
+"""
+
+
+def probe(assume_tray: bool, config_path: str) -> dict[str, float | list[str]]:
+    code: str = TRAY_PROBE.format(assume_tray=assume_tray, config_path=config_path, heavy_modules=HEAVY_MODULES)
+    environment: dict[str, str] = dict(os.environ)
+    if assume_tray:
+        environment.setdefault("QT_QPA_PLATFORM", "offscreen")
+    completed: subprocess.CompletedProcess[str] = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=environment, timeout=120)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Measure import time and time-to-tray-icon of Dexcom Browser Source")
+    _ = parser.add_argument("--runs", type=int, default=5)
+    _ = parser.add_argument("--assume-tray", action="store_true", help="pretend a system tray exists and use the offscreen qt platform, for ci")
+    _ = parser.add_argument("--output", type=Path, help="write the results as json to this file")
+    _ = parser.add_argument("--max-tray-ms", type=float, help="exit with an error when the median time-to-tray is above this")
+    arguments: argparse.Namespace = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as config_path:
+        # the first run warms the os file cache, it is not counted
+        _ = probe(assume_tray=arguments.assume_tray, config_path=config_path)
+        runs: list[dict[str, float | list[str]]] = [
+            probe(assume_tray=arguments.assume_tray, config_path=config_path) for _ in range(arguments.runs)]
+
+    results: dict[str, float | int | list[str]] = {
+        "runs": arguments.runs,
+        "import_ms_median": statistics.median(float(run["import_ms"]) for run in runs),
+        "tray_ms_median": statistics.median(float(run["tray_ms"]) for run in runs),
+        "tray_ms_max": max(float(run["tray_ms"]) for run in runs),
+        "heavy_modules_at_tray": sorted({name for run in runs for name in run["heavy_modules"]}),
+    }
+    print(json.dumps(results, indent=2))
+    if arguments.output is not None:
+        _ = arguments.output.write_text(json.dumps(results, indent=2))
+
+    if len(results["heavy_modules_at_tray"]) > 0:
+        sys.exit(f"heavy modules imported before the tray icon was shown: {', '.join(results['heavy_modules_at_tray'])}")
+    if arguments.max_tray_ms is not None and results["tray_ms_median"] > arguments.max_tray_ms:
+        sys.exit(f"median time-to-tray {results['tray_ms_median']:.1f} ms is above {arguments.max_tray_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
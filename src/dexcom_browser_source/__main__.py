@@ -0,0 +1,62 @@
+import argparse
+import sys
+from pathlib import Path
+
+from dexcom_browser_source.config import AppConfig
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        prog="dexcom-browser-source", description="Browser Source for OBS to display Dexcom Glucose Monitor readings")
+    _ = parser.add_argument("--headless", action="store_true", help="only run the browser source server, without qt or a system tray")
+    _ = parser.add_argument("--self-test", action="store_true", help="load test the configured server settings and report whether they saturate")
+    _ = parser.add_argument("--config-path", type=Path, default=None, help="directory holding the dexcom-browser-source config directory")
+    # anything not recognized here is handed on to qt, e.g. -platform offscreen
+    arguments, qt_arguments = parser.parse_known_args()
+    app_config: AppConfig = AppConfig(custom_config_path=arguments.config_path)
+
+    if arguments.self_test:
+        sys.exit(run_self_test(app_config=app_config))
+    if arguments.headless:
+        from dexcom_browser_source.headless import run_headless
+        sys.exit(run_headless(app_config=app_config))
+    run_gui(app_config=app_config, qt_arguments=[sys.argv[0], *qt_arguments])
+
+
+def run_self_test(app_config: AppConfig) -> int:
+    import json
+    from dexcom_browser_source.load_test import format_self_test, self_test
+    from dexcom_browser_source.server_settings import ServerSettings
+
+    results: dict[str, object] = self_test(server_settings=ServerSettings.from_config(app_config=app_config))
+    print(json.dumps(results, indent=2))
+    print(format_self_test(results=results))
+    return 1 if results["saturated"] else 0
+
+
+def run_gui(app_config: AppConfig, qt_arguments: list[str]) -> None:
+    from PySide6.QtWidgets import QApplication
+    from dexcom_browser_source.first_run_wizard import FirstRunWizard
+    from dexcom_browser_source.system_tray import SystemTrayIcon
+    from _version import version
+
+    app: QApplication = QApplication(qt_arguments)
+
+    app.setApplicationName("dexcom-browser-source")
+    app.setApplicationDisplayName("Dexcom Browser Source")
+    app.setApplicationVersion(version)
+
+    system_tray_icon: SystemTrayIcon = SystemTrayIcon(parent=app, app=app, app_config=app_config)
+    system_tray_icon.show()
+    app_config.start_watching()
+
+    if app_config.first_run:
+        _ = FirstRunWizard(app=app, app_config=app_config, system_tray_icon=system_tray_icon)
+
+    app.setQuitOnLastWindowClosed(False)
+    sys.exit(app.exec())
+
+
+# chart render processes import this package too, only the launching process may start the gui
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import logging
+import re
+from typing import NamedTuple
+
+from dexcom_browser_source.config import AppConfig
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# [dexcom.account], served at the root the way it was before there were named accounts
+DEFAULT_ACCOUNT: str = "default"
+# [accounts.<name>] tables are served under /u/<name>/api, /u/<name>/glucose and so on
+ACCOUNT_URL_PREFIX: str = "/u"
+# names end up in urls, blueprint names and history file names
+ACCOUNT_NAME_PATTERN: re.Pattern[str] = re.compile(r"[A-Za-z0-9_-]+")
+
+
+# one person's dexcom share login, what a poller and its history are built for
+class AccountSettings(NamedTuple):
+    name: str
+    username: str
+    password: str
+    share_url: str | None = None
+
+    @property
+    def url_prefix(self) -> str:
+        return "" if self.name == DEFAULT_ACCOUNT else f"{ACCOUNT_URL_PREFIX}/{self.name}"
+
+    # the default account keeps the history file it had before named accounts
+    @property
+    def history_file_name(self) -> str:
+        return "history.sqlite3" if self.name == DEFAULT_ACCOUNT else f"history-{self.name}.sqlite3"
+
+    # a new password is the same person, a new username or share server is someone else's readings
+    def same_person(self, other: "AccountSettings") -> bool:
+        return (self.username, self.share_url) == (other.username, other.share_url)
+
+
+# the default account first, then the named ones in config order. a named account without its own share_url uses
+# dexcom.share_url. any account without credentials, the default one before the first run wizard has filled it in
+# included, is left out rather than logged in as "None", as is one with an unusable name. logged when warn is set
+def configured_accounts(app_config: AppConfig, warn: bool = False) -> dict[str, AccountSettings]:
+    share_url: object = app_config.config['dexcom'].get('share_url')
+    account: object = app_config.config['dexcom'].get('account')
+    accounts: dict[str, AccountSettings] = {}
+    if isinstance(account, dict) and account.get('username') and account.get('password'):
+        accounts[DEFAULT_ACCOUNT] = AccountSettings(
+            name=DEFAULT_ACCOUNT, username=str(account['username']), password=str(account['password']),
+            share_url=str(share_url) if share_url else None)
+    for name, section in (app_config.config.get('accounts') or {}).items():
+        if name == DEFAULT_ACCOUNT or ACCOUNT_NAME_PATTERN.fullmatch(name) is None:
+            if warn:
+                logger.warning("skipping account %r, names may only use letters, digits, - and _ and %r is taken", name, DEFAULT_ACCOUNT)
+            continue
+        if not isinstance(section, dict) or not section.get('username') or not section.get('password'):
+            if warn:
+                logger.warning("skipping account %r, it needs a username and a password", name)
+            continue
+        account_share_url: object = section.get('share_url') or share_url
+        accounts[name] = AccountSettings(
+            name=name, username=str(section['username']), password=str(section['password']),
+            share_url=str(account_share_url) if account_share_url else None)
+    return accounts
@@ -1,198 +1,264 @@
-import base64
-from datetime import datetime
-from flask import Blueprint, Flask
-from io import BytesIO
-from typing import override
-from matplotlib.axes import Subplot
-from waitress.server import create_server
-from waitress.server import BaseWSGIServer, MultiSocketServer
-from pydexcom.dexcom import Dexcom
-from pydexcom.glucose_reading import GlucoseReading
-from PySide6.QtCore import QThread, Qt
-from PySide6.QtWidgets import QApplication, QDialog, QHBoxLayout, QLabel, QPushButton, QVBoxLayout, QWidget
-from flask.views import ft
-from matplotlib.figure import Figure
-from matplotlib.dates import DateFormatter, HourLocator
-
-from dexcom_browser_source.config import AppConfig
+import threading
+from enum import Enum
+from typing import TYPE_CHECKING, override
+from PySide6.QtCore import QThread, QTimer, Qt, Signal
+from PySide6.QtGui import QHideEvent, QShowEvent
+from PySide6.QtWidgets import QApplication, QDialog, QFormLayout, QGroupBox, QHBoxLayout, QLabel, QPushButton, QVBoxLayout, QWidget
+
+from dexcom_browser_source.accounts import configured_accounts
+from dexcom_browser_source.config import AppConfig, touches
+from dexcom_browser_source.server_settings import RESTART_CONFIG_KEYS, ServerSettings
+
+# how often the performance panel is refreshed while the dialog is open
+METRICS_REFRESH_INTERVAL_MS: int = 1000
+# how long the requests in flight get to finish when waitress is stopped, before their connections are closed
+WAITRESS_SHUTDOWN_TIMEOUT: float = 5.0
+# how often a running WaitressThread checks its loop is still alive
+WAITRESS_WATCH_INTERVAL: float = 1.0
+# on quit the gui thread waits this much longer than the shutdown timeout for the server thread to finish
+QUIT_WAIT_MARGIN_MS: int = 2000
+
+# flask, waitress, pydexcom and matplotlib are only imported once the server thread starts
+if TYPE_CHECKING:
+    from flask import Flask
+    from waitress.server import BaseWSGIServer, MultiSocketServer
+    from dexcom_browser_source.context import ServerContext
 
 
 class WaitressThread(QThread):
+    serving: Signal = Signal()
+    failed: Signal = Signal(str)
+
     def __init__(self, app_config: AppConfig):
         self._app_config: AppConfig = app_config
-        self._waitress_server: MultiSocketServer | BaseWSGIServer = create_server(
-            application=create_app(app_config=self._app_config))
+        self._lock: threading.Lock = threading.Lock()
+        self._stop_event: threading.Event = threading.Event()
+        # the dexcom sessions, readings and rendered charts, kept across runs so a restart comes back warm
+        self._context: ServerContext | None = None
+        self._app: Flask | None = None
+        # the accounts the latest app has urls for, None before the first one is created
+        self._served_accounts: frozenset[str] | None = None
         super().__init__()
 
+    # the thread is started again for every run, only the flask app and waitress server are rebuilt
+    def start_serving(self) -> None:
+        self._stop_event.clear()
+        self.start()
+
+    # returns straight away, finished is emitted once the requests in flight are done or the shutdown timed out
+    def request_stop(self) -> None:
+        self._stop_event.set()
+
     @override
     def run(self, /) -> None:
-        self._waitress_server.run()
+        # the heavy imports and the dexcom login happen here, off the gui thread and after the tray icon is up
+        from dexcom_browser_source.context import ServerContext
+        from dexcom_browser_source.server import create_app, create_waitress_server, shutdown_app, stop_waitress_server
+
+        app: Flask | None = None
+        try:
+            # accounts added since the last run are started by create_app, the others keep what was fetched so far
+            if self._context is None:
+                self._context = ServerContext(app_config=self._app_config)
+            app = create_app(app_config=self._app_config, context=self._context)
+            with self._lock:
+                self._served_accounts = frozenset(app.extensions['accounts'])
+            waitress_server: MultiSocketServer | BaseWSGIServer = create_waitress_server(
+                app=app, **ServerSettings.from_config(app_config=self._app_config).waitress_options())
+        except Exception as e:
+            if app is not None:
+                shutdown_app(app)
+            self.failed.emit(str(e))
+            return
+
+        # waitress' loop gets a thread of its own so this one stays free to drain and close it
+        loop_thread: threading.Thread = threading.Thread(target=waitress_server.run, name="WaitressLoop", daemon=True)
+        loop_thread.start()
+        with self._lock:
+            self._app = app
+        if not self._stop_event.is_set():
+            self.serving.emit()
+        while not self._stop_event.wait(timeout=WAITRESS_WATCH_INTERVAL):
+            if not loop_thread.is_alive():
+                self.failed.emit("Waitress stopped unexpectedly")
+                break
+
+        with self._lock:
+            self._app = None
+        # the blueprints and listeners are detached even if draining fails, or the next app could not register them
+        try:
+            _ = stop_waitress_server(app=app, waitress_server=waitress_server, loop_thread=loop_thread, timeout=WAITRESS_SHUTDOWN_TIMEOUT)
+        finally:
+            shutdown_app(app)
+
+    # only once the thread has finished, when the application quits
+    def close_context(self) -> None:
+        if self._context is not None:
+            self._context.close()
+            self._context = None
+
+    def served_accounts(self) -> frozenset[str] | None:
+        with self._lock:
+            return self._served_accounts
+
+    # None until the server is up
+    def metrics_summary(self) -> dict[str, str] | None:
+        with self._lock:
+            app: Flask | None = self._app
+        if app is None:
+            return None
+        from dexcom_browser_source.server import metrics_summary
+        return metrics_summary(app=app)
+
+
+class WaitressState(Enum):
+    OFFLINE = "Offline"
+    STARTING = "Starting"
+    ONLINE = "Online"
+    STOPPING = "Stopping"
+    FAILED = "Failed"
+
+
+WAITRESS_STATE_COLORS: dict[WaitressState, str] = {
+    WaitressState.OFFLINE: "red",
+    WaitressState.STARTING: "orange",
+    WaitressState.ONLINE: "green",
+    WaitressState.STOPPING: "orange",
+    WaitressState.FAILED: "red",
+}
 
-    @override
-    def quit(self, /) -> None:
-        self._waitress_server.close()
-        super().quit()
 
 class BrowserSourceDetailsDialog(QDialog):
+    # config changes arrive on whichever thread saved or reloaded the config, this hands them to the gui thread
+    config_changed: Signal = Signal(frozenset)
+
     def __init__(self, app: QApplication, app_config: AppConfig, parent: QWidget | None = None):
         self._app: QApplication = app
         self._app_config: AppConfig = app_config
         self._waitress_thread: WaitressThread = WaitressThread(app_config=self._app_config)
+        self._waitress_error: str | None = None
+        self._waitress_state: WaitressState = WaitressState.OFFLINE
+        # set by restart, the thread is started again as soon as the running one has finished
+        self._restart_pending: bool = False
         self._layout: QVBoxLayout = QVBoxLayout()
         self._button_layout: QHBoxLayout = QHBoxLayout()
         self._waitress_status_label: QLabel = QLabel()
         self._waitress_start_button: QPushButton = QPushButton("Start Waitress")
         self._waitress_stop_button: QPushButton = QPushButton("Stop Waitress")
+        self._metrics_group: QGroupBox = QGroupBox("Performance")
+        self._metrics_layout: QFormLayout = QFormLayout()
+        self._metrics_labels: dict[str, QLabel] = {}
+        self._metrics_timer: QTimer = QTimer()
         super().__init__(parent)
         self.setWindowTitle("Browser Source Details - Dexcom Browser Source")
         _ = self._waitress_start_button.clicked.connect(self.start_waitress)
         _ = self._waitress_stop_button.clicked.connect(self.stop_waitress)
+        # the thread is reused for every start, so these are connected once
+        _ = self._waitress_thread.started.connect(self.on_waitress_start)
+        _ = self._waitress_thread.serving.connect(self.on_waitress_serving)
+        _ = self._waitress_thread.failed.connect(self.on_waitress_failed)
+        _ = self._waitress_thread.finished.connect(self.on_waitress_finish)
+        _ = self._app.aboutToQuit.connect(self.on_app_quit)
+        _ = self.config_changed.connect(self.on_config_changed)
+        self._app_config.add_change_listener(self.config_changed.emit)
 
-        self._waitress_status_label.setText("# Waitress is Offline")
-        self._waitress_status_label.setStyleSheet("QLabel { color: red; }")
         self._waitress_status_label.setTextFormat(Qt.TextFormat.MarkdownText)
         self._waitress_status_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self._layout.addWidget(self._waitress_status_label)
         self._button_layout.addWidget(self._waitress_start_button)
-        self._waitress_stop_button.setEnabled(False)
         self._button_layout.addWidget(self._waitress_stop_button)
         self._layout.addLayout(self._button_layout)
+        self._metrics_group.setLayout(self._metrics_layout)
+        self._metrics_group.setVisible(False)
+        self._layout.addWidget(self._metrics_group)
         self.setLayout(self._layout)
+        self.set_waitress_state(WaitressState.OFFLINE)
 
-        self.start_waitress()
+        # only polled while the dialog is visible, the full numbers are on /metrics
+        self._metrics_timer.setInterval(METRICS_REFRESH_INTERVAL_MS)
+        _ = self._metrics_timer.timeout.connect(self.update_metrics)
 
+        # start once the event loop is running so the tray icon shows up without waiting on the server
+        QTimer.singleShot(0, self.start_waitress)
 
+    # also restarts, nothing here waits on the thread so the gui stays responsive while waitress drains
     def start_waitress(self):
-        if self._waitress_thread.isFinished():
-            self._waitress_thread = WaitressThread(app_config=self._app_config)
-        _ = self._app.aboutToQuit.connect(self.stop_waitress)
-        _ = self._waitress_thread.started.connect(self.on_waitress_start)
-        _ = self._waitress_thread.finished.connect(self.on_waitress_finish)
-        self._waitress_thread.start()
+        if self._waitress_thread.isRunning():
+            self._restart_pending = True
+            self._waitress_thread.request_stop()
+            self.set_waitress_state(WaitressState.STOPPING)
+            return
+        self._waitress_thread.start_serving()
 
-    def stop_waitress(self):
-        self._waitress_thread.quit()
-        _ = self._waitress_thread.wait()
+    @override
+    def showEvent(self, event: QShowEvent, /) -> None:
+        super().showEvent(event)
+        self.update_metrics()
+        self._metrics_timer.start()
 
-    def on_waitress_start(self):
-        self._waitress_start_button.setText("Restart Waitress")
-        self._waitress_stop_button.setEnabled(True)
+    @override
+    def hideEvent(self, event: QHideEvent, /) -> None:
+        super().hideEvent(event)
+        self._metrics_timer.stop()
 
-        self._waitress_status_label.setText("# Waitress is Online")
-        self._waitress_status_label.setStyleSheet("QLabel { color: green; }")
+    def update_metrics(self):
+        summary: dict[str, str] | None = self._waitress_thread.metrics_summary()
+        self._metrics_group.setVisible(summary is not None)
+        if summary is None:
+            return
+        for name, value in summary.items():
+            label: QLabel | None = self._metrics_labels.get(name)
+            if label is None:
+                label = self._metrics_labels[name] = QLabel()
+                self._metrics_layout.addRow(f"{name}:", label)
+            label.setText(value)
 
-    def on_waitress_finish(self):
-        self._waitress_start_button.setText("Start Waitress")
-        self._waitress_stop_button.setEnabled(False)
+    # everything else is picked up by the running server itself, new credentials for an account included
+    def on_config_changed(self, changes: frozenset[str]):
+        if not self._waitress_thread.isRunning():
+            return
+        served_accounts: frozenset[str] | None = self._waitress_thread.served_accounts()
+        # None while the first app is being created, which picks the accounts up by itself
+        if (touches(changes=changes, keys=RESTART_CONFIG_KEYS)
+                or (served_accounts is not None and frozenset(configured_accounts(app_config=self._app_config)) != served_accounts)):
+            self.start_waitress()
 
-        self._waitress_status_label.setText("# Waitress is Offline")
-        self._waitress_status_label.setStyleSheet("QLabel { color: red; }")
+    def stop_waitress(self):
+        self._restart_pending = False
+        if self._waitress_thread.isRunning():
+            self._waitress_thread.request_stop()
+            self.set_waitress_state(WaitressState.STOPPING)
 
-class DexcomAPIBlueprint(Blueprint):
-    def __init__(self, app_config: AppConfig) -> None:
-        super().__init__(name="dexcomapi", import_name=__name__, url_prefix='/api')
-        self._app_config: AppConfig = app_config
-        self._dexcom: Dexcom = Dexcom(
-            username=str(app_config.config['dexcom']['account']['username']),
-            password=str(app_config.config['dexcom']['account']['password'])
-        )
-
-        self.add_url_rule(rule='/current/trend_arrow', view_func=self.serve_current_glucose_reading_trend_arrow)
-        self.add_url_rule(rule='/current/mg_dl', view_func=self.serve_current_glucose_reading_mg_dl)
-        self.add_url_rule(rule='/current/mmol_l', view_func=self.serve_current_glucose_reading_mmol_l)
-        self.add_url_rule(rule='/current', view_func=self.serve_current_glucose_reading)
-        self.add_url_rule(rule='/last/<int:hours>', view_func=self.serve_last_readings_graph)
-        self.add_url_rule(rule='/last', view_func=self.serve_last_readings_graph, defaults={"hours": self._app_config.config['graph']['last_hours']})
-
-    def serve_current_glucose_reading(self) -> ft.ResponseReturnValue:
-        if self._app_config.config['app']['metric']:
-            return self.serve_current_glucose_reading_mmol_l()
+    # the one place the gui thread waits, bounded by the shutdown timeout
+    def on_app_quit(self):
+        self.stop_waitress()
+        if self._waitress_thread.wait(int(WAITRESS_SHUTDOWN_TIMEOUT * 1000) + QUIT_WAIT_MARGIN_MS):
+            self._waitress_thread.close_context()
+
+    def set_waitress_state(self, state: WaitressState):
+        self._waitress_state = state
+        running: bool = state in (WaitressState.STARTING, WaitressState.ONLINE)
+        self._waitress_start_button.setText("Restart Waitress" if running else "Start Waitress")
+        self._waitress_stop_button.setEnabled(running)
+        if state == WaitressState.FAILED:
+            self._waitress_status_label.setText(f"# Waitress Failed to Start\n\n{self._waitress_error}")
         else:
-            return self.serve_current_glucose_reading_mg_dl()
-
-    def serve_current_glucose_reading_mg_dl(self) -> ft.ResponseReturnValue:
-        glucose_reading: GlucoseReading | None = self._dexcom.get_current_glucose_reading()
-        if glucose_reading is None:
-            return '--', 404
-        return f'<span hx-get="/api/current" hx-trigger="load delay:1m" hx-swap="outerHTML">{glucose_reading.mg_dl}</span>', 200
-
-    def serve_current_glucose_reading_mmol_l(self) -> ft.ResponseReturnValue:
-        glucose_reading: GlucoseReading | None = self._dexcom.get_current_glucose_reading()
-        if glucose_reading is None:
-            return '--', 404
-        return f'<span hx-get="/api/current" hx-trigger="load delay:1m" hx-swap="outerHTML">{glucose_reading.mmol_l}</span>', 200
-
-    def serve_current_glucose_reading_trend_arrow(self) -> ft.ResponseReturnValue:
-        glucose_reading: GlucoseReading | None = self._dexcom.get_current_glucose_reading()
-        if glucose_reading is None:
-            return '--', 404
-        return f'<span hx-get="/api/current/trend_arrow" hx-trigger="load delay:1m" hx-swap="outerHTML">{glucose_reading.trend_arrow}</span>', 200
-
-    def serve_last_readings_graph(self, hours: int) -> ft.ResponseReturnValue:
-        metric: bool = bool(self._app_config.config['app']['metric'])
-        hyperglycemia: float | int = self._app_config.config['dexcom']['hyperglycemia_level']
-        hypoglycemia: float | int = self._app_config.config['dexcom']['hypoglycemia_level']
-        ybound_up: float | int = self._app_config.config['graph']['height_limit']
-        ybound_low: float | int = 3.9 if metric else 40
-        tick_color: str = "white" if self._app_config.config['graph']['colors']['appearance'] == "dark" else "black"
-        glucose_readings: list[GlucoseReading] = self._dexcom.get_glucose_readings(minutes=(60 * hours))
-
-        chart_figure: Figure = Figure()
-        chart_axis: Subplot = chart_figure.subplots()
-
-        x: list[datetime] = []
-        y: list[float | int] = []
-        for reading in glucose_readings:
-            glucose: float | int = reading.mmol_l if metric else reading.mg_dl
-            time: datetime = reading.datetime
-            x.append(time)
-            y.append(glucose)
-        x.reverse()
-        y.reverse()
-
-        _ = chart_axis.spines['top'].set_visible(False)
-        _ = chart_axis.spines['right'].set_visible(False)
-        _ = chart_axis.spines['bottom'].set_visible(False)
-        _ = chart_axis.spines['left'].set_visible(False)
-        _ = chart_axis.xaxis.set_major_locator(locator=HourLocator(byhour=range(0, 25, round(hours / 4))))
-        _ = chart_axis.xaxis.set_major_formatter(formatter=DateFormatter(fmt='%I %p', tz=x[0].tzinfo))
-        _ = chart_axis.yaxis.set_ticks(ticks=[ybound_low, hypoglycemia, hyperglycemia, ybound_up])
-        _ = chart_axis.set_xlim(left=x[0], right=x[-1])
-        _ = chart_axis.yaxis.set_ticks_position('right')
-        _ = chart_axis.set_ybound(lower=ybound_low, upper=ybound_up)
-        _ = chart_axis.set_autoscaley_on(False)
-        _ = chart_axis.axhspan(ymin=(hypoglycemia + 4), ymax=(hyperglycemia - 4), facecolor=self._app_config.config['graph']['colors']['normal'], alpha=0.25)
-        _ = chart_axis.axhspan(ymin=hyperglycemia, ymax=ybound_up, facecolor=self._app_config.config['graph']['colors']['hyperglycemia'], alpha=0.5)
-        _ = chart_axis.axhspan(ymin=ybound_low, ymax=hypoglycemia, facecolor=self._app_config.config['graph']['colors']['hypoglycemia'], alpha=0.5)
-        _ = chart_axis.tick_params(colors=tick_color)
-        _ = chart_axis.plot(x, y, color=tick_color, marker='o', markersize=2, linewidth=0)
-
-        chart_buffer: BytesIO = BytesIO()
-        chart_figure.savefig(fname=chart_buffer, format="png", transparent=True)
-        data: str = base64.b64encode(chart_buffer.getbuffer()).decode("ascii")
-        chart_buffer.close()
-        return f'<img src="data:image/png;base64,{data}" hx-get="/api/last" hx-trigger="load delay:1m" hx-swap="outerHTML" />', 200
-
-class StaticBlueprint(Blueprint):
-    def __init__(self, name: str, url_prefix: str, app: Flask, app_config: AppConfig) -> None:
-        super().__init__(name=name, import_name=__name__, url_prefix=url_prefix)
-        self._app: Flask = app
-        self._app_config: AppConfig = app_config
+            self._waitress_status_label.setText(f"# Waitress is {state.value}")
+        self._waitress_status_label.setStyleSheet(f"QLabel {{ color: {WAITRESS_STATE_COLORS[state]}; }}")
 
-        self.add_url_rule(rule="/<path:_path>", view_func=self.serve_static_html)
-        self.add_url_rule(rule="", view_func=self.serve_static_html, defaults={'_path': ''})
+    def on_waitress_start(self):
+        self._waitress_error = None
+        self.set_waitress_state(WaitressState.STARTING)
 
-    def serve_static_html(self, _path: str) -> ft.ResponseReturnValue:
-        return self._app.send_static_file(filename=f'{self.name}.html')
+    def on_waitress_serving(self):
+        self.set_waitress_state(WaitressState.ONLINE)
 
-# flask app for waitress to serve
-def create_app(app_config: AppConfig) -> Flask:
-    app: Flask = Flask(__name__)
+    def on_waitress_failed(self, error: str):
+        self._waitress_error = error
 
-    dexcom_api_blueprint: DexcomAPIBlueprint = DexcomAPIBlueprint(app_config=app_config)
-    glucose_blueprint: StaticBlueprint = StaticBlueprint(app=app, app_config=app_config, name='glucose', url_prefix='/glucose')
-    chart_blueprint: StaticBlueprint = StaticBlueprint(app=app, app_config=app_config, name='chart', url_prefix='/chart')
-    app.register_blueprint(blueprint=dexcom_api_blueprint)
-    app.register_blueprint(blueprint=glucose_blueprint)
-    app.register_blueprint(blueprint=chart_blueprint)
-    return app
\ No newline at end of file
+    def on_waitress_finish(self):
+        if self._restart_pending:
+            self._restart_pending = False
+            self._waitress_thread.start_serving()
+            return
+        self.set_waitress_state(WaitressState.FAILED if self._waitress_error is not None else WaitressState.OFFLINE)
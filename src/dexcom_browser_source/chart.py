@@ -0,0 +1,504 @@
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta, tzinfo
+from io import BytesIO
+from typing import NamedTuple, Self
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.dates import DateFormatter, DayLocator, HourLocator
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.ticker import Formatter, Locator
+from pydexcom.const import MMOL_L_CONVERSION_FACTOR
+
+from dexcom_browser_source.config import AppConfig
+from dexcom_browser_source.history import HISTORY_RETENTION
+from dexcom_browser_source.metrics import Histogram
+from dexcom_browser_source.stats import ambulatory_glucose_profile
+
+# a handful of windows times a few distinct configs is plenty for an overlay
+CHART_CACHE_MAX_ENTRIES: int = 32
+# every account's cached charts together, a few hundred typical overlay pngs
+CHART_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+CHART_MIMETYPES: dict[str, str] = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+# matplotlib's default 6.4in x 4.8in figure at 100 dpi
+CHART_DEFAULT_WIDTH: int = 640
+CHART_DEFAULT_HEIGHT: int = 480
+CHART_DEFAULT_DPI: int = 100
+# keep a single request from asking for an absurdly large render
+CHART_MAX_PIXELS: int = 3840
+CHART_DPI_RANGE: range = range(50, 601)
+# one renderer per distinct style and size, each owning a figure that is reused between renders
+CHART_MAX_RENDERERS: int = 4
+MILLISECONDS_PER_DAY: int = 86_400_000
+# as far back as ReadingHistory keeps readings
+CHART_MAX_HOURS: int = int(HISTORY_RETENTION / timedelta(hours=1))
+CHART_VIEWS: tuple[str, ...] = ("line", "agp")
+# readings are drawn as dots up to this window and as a line beyond it
+CHART_DOTS_MAX_HOURS: int = 24
+# readings further apart than this are not joined up
+CHART_GAP_MILLISECONDS: int = 15 * 60_000
+CHART_HOURLY_TICKS_MAX_HOURS: int = 48
+CHART_TARGET_TICKS: int = 5
+# agg holds the gil while it draws, so charts are rendered in a separate process to keep waitress responsive
+CHART_RENDER_WORKERS: int = 1
+# a render still unfinished after this is given up on, and its render process replaced when it had started drawing
+CHART_RENDER_TIMEOUT: float = 15.0
+
+
+class ChartRenderTimeout(TimeoutError):
+    def __init__(self, timeout: float):
+        super().__init__(f"Chart was not rendered within {timeout:.0f} seconds")
+        self.timeout: float = timeout
+
+
+class ChartSpec(NamedTuple):
+    hours: int
+    image_format: str = "png"
+    width: int = CHART_DEFAULT_WIDTH
+    height: int = CHART_DEFAULT_HEIGHT
+    dpi: int = CHART_DEFAULT_DPI
+    view: str = "line"
+
+    def is_valid(self) -> bool:
+        return (0 < self.hours <= CHART_MAX_HOURS and self.image_format in CHART_MIMETYPES and 0 < self.width <= CHART_MAX_PIXELS
+                and 0 < self.height <= CHART_MAX_PIXELS and self.dpi in CHART_DPI_RANGE and self.view in CHART_VIEWS)
+
+    # query string that asks for the same size again, used when linking to the image endpoint
+    def size_query(self) -> str:
+        return f"width={self.width}&height={self.height}&dpi={self.dpi}"
+
+
+# the config keys ChartStyle is read from, a change to any of them makes every rendered chart outdated
+CHART_CONFIG_KEYS: tuple[str, ...] = ("app.metric", "dexcom.hypoglycemia_level", "dexcom.hyperglycemia_level", "graph.height_limit", "graph.colors")
+
+
+# everything from the config a chart is drawn with
+class ChartStyle(NamedTuple):
+    metric: bool
+    hypoglycemia: float | int
+    hyperglycemia: float | int
+    height_limit: float | int
+    appearance: str
+    normal_color: str
+    hypoglycemia_color: str
+    hyperglycemia_color: str
+
+    @classmethod
+    def from_config(cls, app_config: AppConfig) -> Self:
+        return cls(
+            metric=bool(app_config.config['app']['metric']),
+            hypoglycemia=app_config.config['dexcom']['hypoglycemia_level'],
+            hyperglycemia=app_config.config['dexcom']['hyperglycemia_level'],
+            height_limit=app_config.config['graph']['height_limit'],
+            appearance=str(app_config.config['graph']['colors']['appearance']),
+            normal_color=str(app_config.config['graph']['colors']['normal']),
+            hypoglycemia_color=str(app_config.config['graph']['colors']['hypoglycemia']),
+            hyperglycemia_color=str(app_config.config['graph']['colors']['hyperglycemia']),
+        )
+
+
+def style_axis(axis: Axes, style: ChartStyle) -> str:
+    ybound_low: float | int = 3.9 if style.metric else 40
+    tick_color: str = "white" if style.appearance == "dark" else "black"
+    _ = axis.spines['top'].set_visible(False)
+    _ = axis.spines['right'].set_visible(False)
+    _ = axis.spines['bottom'].set_visible(False)
+    _ = axis.spines['left'].set_visible(False)
+    _ = axis.yaxis.set_ticks(ticks=[ybound_low, style.hypoglycemia, style.hyperglycemia, style.height_limit])
+    _ = axis.yaxis.set_ticks_position('right')
+    _ = axis.set_ybound(lower=ybound_low, upper=style.height_limit)
+    _ = axis.set_autoscaley_on(False)
+    _ = axis.axhspan(ymin=(style.hypoglycemia + 4), ymax=(style.hyperglycemia - 4), facecolor=style.normal_color, alpha=0.25)
+    _ = axis.axhspan(ymin=style.hyperglycemia, ymax=style.height_limit, facecolor=style.hyperglycemia_color, alpha=0.5)
+    _ = axis.axhspan(ymin=ybound_low, ymax=style.hypoglycemia, facecolor=style.hypoglycemia_color, alpha=0.5)
+    _ = axis.tick_params(colors=tick_color)
+    return tick_color
+
+
+def to_display_units(mg_dl: np.ndarray, metric: bool) -> np.ndarray:
+    return np.round(mg_dl * MMOL_L_CONVERSION_FACTOR, 1) if metric else mg_dl.astype(np.float64)
+
+
+# at most two points, the lowest and the highest, per time bucket, so a 90 day window costs the same to draw as a
+# 24 hour one. unlike averaging or lttb this never hides a low, which is the thing the chart is for
+def min_max_downsample(timestamps: np.ndarray, values: np.ndarray, buckets: int) -> tuple[np.ndarray, np.ndarray]:
+    if len(timestamps) <= 2 * buckets:
+        return timestamps, values
+    span: int = int(timestamps[-1] - timestamps[0]) + 1
+    bucket_of: np.ndarray = (timestamps - timestamps[0]) * buckets // span
+    # timestamps are sorted, so each bucket is one contiguous run and sorting by (bucket, value) keeps the runs in place
+    order: np.ndarray = np.lexsort((values, bucket_of))
+    run_starts: np.ndarray = np.flatnonzero(np.diff(bucket_of, prepend=-1))
+    run_ends: np.ndarray = np.append(run_starts[1:], len(timestamps)) - 1
+    picked: np.ndarray = np.union1d(order[run_starts], order[run_ends])
+    return timestamps[picked], values[picked]
+
+
+# nan between points further apart than the gap, so a line is broken where there were no readings
+def break_gaps(x: np.ndarray, y: np.ndarray, gap: float) -> tuple[np.ndarray, np.ndarray]:
+    breaks: np.ndarray = np.flatnonzero(np.diff(x) > gap) + 1
+    if len(breaks) == 0:
+        return x, y
+    return np.insert(x, breaks, np.nan), np.insert(y, breaks, np.nan)
+
+
+# ticks on whole local hours for a day or two, on local midnights beyond that, about four to six of them either way
+def date_axis(hours: int, chart_timezone: tzinfo) -> tuple[Locator, Formatter]:
+    if hours <= CHART_HOURLY_TICKS_MAX_HOURS:
+        step: int = next(step for step in (1, 2, 3, 4, 6, 12, 24) if step * CHART_TARGET_TICKS >= hours)
+        return HourLocator(byhour=range(0, 24, step), tz=chart_timezone), DateFormatter(fmt='%I %p', tz=chart_timezone)
+    days: int = max(1, round(hours / 24 / CHART_TARGET_TICKS))
+    return DayLocator(interval=days, tz=chart_timezone), DateFormatter(fmt='%b %d', tz=chart_timezone)
+
+
+# builds the figure, axes and range bands once and afterwards only swaps the plotted data
+class ChartRenderer:
+    def __init__(self, style: ChartStyle, width: int, height: int, dpi: int):
+        self._style: ChartStyle = style
+        self._width: int = width
+        self._lock: threading.Lock = threading.Lock()
+
+        self._figure: Figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        self._canvas: FigureCanvasAgg = FigureCanvasAgg(figure=self._figure)
+        self._axis: Axes = self._figure.subplots()
+        tick_color: str = style_axis(axis=self._axis, style=style)
+        self._line: Line2D = self._axis.plot([], [], color=tick_color, marker='o', markersize=2, linewidth=0)[0]
+        self._hours: int | None = None
+        self._timezone: tzinfo | None = None
+
+    # timestamps are epoch milliseconds, oldest first
+    def render(self, timestamps: np.ndarray, mg_dl: np.ndarray, chart_timezone: tzinfo, hours: int, image_format: str) -> bytes:
+        timestamps, mg_dl = min_max_downsample(timestamps=timestamps, values=mg_dl, buckets=self._width)
+        # matplotlib date numbers are days since the unix epoch
+        x: np.ndarray = timestamps / MILLISECONDS_PER_DAY
+        y: np.ndarray = to_display_units(mg_dl=mg_dl, metric=self._style.metric)
+        dots: bool = hours <= CHART_DOTS_MAX_HOURS
+        if not dots:
+            gap: float = max(CHART_GAP_MILLISECONDS, 2 * hours * 3_600_000 / self._width) / MILLISECONDS_PER_DAY
+            x, y = break_gaps(x=x, y=y, gap=gap)
+
+        with self._lock:
+            if hours != self._hours or chart_timezone != self._timezone:
+                locator, formatter = date_axis(hours=hours, chart_timezone=chart_timezone)
+                _ = self._axis.xaxis.set_major_locator(locator=locator)
+                _ = self._axis.xaxis.set_major_formatter(formatter=formatter)
+                # single readings as dots while they can be told apart, a line once they can't
+                self._line.set_marker('o' if dots else 'None')
+                self._line.set_linewidth(0 if dots else 1)
+                self._hours = hours
+                self._timezone = chart_timezone
+            self._line.set_data(x, y)
+            # always the whole window, ending at the newest reading, so a gap at the start shows as one and an empty
+            # history does not leave the previous render's axis behind
+            right: float = x[-1] if len(x) > 0 else time.time() * 1000 / MILLISECONDS_PER_DAY
+            _ = self._axis.set_xlim(left=right - hours / 24, right=right)
+            return save_figure(figure=self._figure, image_format=image_format)
+
+
+# the ambulatory glucose profile, percentile bands of every day in the window drawn over one 24 hour day
+class AgpRenderer:
+    def __init__(self, style: ChartStyle, width: int, height: int, dpi: int):
+        self._style: ChartStyle = style
+        self._lock: threading.Lock = threading.Lock()
+
+        self._figure: Figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        self._canvas: FigureCanvasAgg = FigureCanvasAgg(figure=self._figure)
+        self._axis: Axes = self._figure.subplots()
+        self._tick_color: str = style_axis(axis=self._axis, style=style)
+        _ = self._axis.set_xlim(left=0, right=24)
+        _ = self._axis.xaxis.set_ticks(ticks=range(0, 25, 6), labels=["12 AM", "06 AM", "12 PM", "06 PM", "12 AM"])
+        self._median: Line2D = self._axis.plot([], [], color=self._tick_color, linewidth=2)[0]
+        self._bands: list[PolyCollection] = []
+
+    def render(self, timestamps: np.ndarray, mg_dl: np.ndarray, chart_timezone: tzinfo, hours: int, image_format: str) -> bytes:
+        offset: timedelta | None = chart_timezone.utcoffset(None)
+        utc_offset_ms: int = int(offset.total_seconds() * 1000) if offset is not None else 0
+        bin_hours, profile = ambulatory_glucose_profile(timestamps=timestamps, mg_dl=mg_dl, utc_offset_ms=utc_offset_ms)
+        # centre each bin and wrap one bin around either end so the bands run edge to edge across midnight
+        half: float = 12 / len(bin_hours)
+        x: np.ndarray = np.concatenate(([-half], bin_hours + half, [24 + half]))
+        p5, p25, p50, p75, p95 = (
+            to_display_units(mg_dl=np.concatenate(([row[-1]], row, [row[0]])), metric=self._style.metric) for row in profile)
+
+        with self._lock:
+            for band in self._bands:
+                band.remove()
+            self._bands = [
+                self._axis.fill_between(x, p5, p95, color=self._tick_color, alpha=0.15, linewidth=0),
+                self._axis.fill_between(x, p25, p75, color=self._tick_color, alpha=0.35, linewidth=0),
+            ]
+            self._median.set_data(x, p50)
+            return save_figure(figure=self._figure, image_format=image_format)
+
+
+def save_figure(figure: Figure, image_format: str) -> bytes:
+    chart_buffer: BytesIO = BytesIO()
+    figure.savefig(fname=chart_buffer, format=image_format, dpi=figure.dpi, transparent=True)
+    chart: bytes = chart_buffer.getvalue()
+    chart_buffer.close()
+    return chart
+
+
+CHART_RENDERERS: dict[str, type[ChartRenderer] | type[AgpRenderer]] = {
+    "line": ChartRenderer,
+    "agp": AgpRenderer,
+}
+
+_renderers_lock: threading.Lock = threading.Lock()
+_renderers: OrderedDict[tuple[ChartStyle, str, int, int, int], ChartRenderer | AgpRenderer] = OrderedDict()
+
+
+# reuses the renderer for this view, style and size, building a fresh one only when the graph config changes
+def render_chart(style: ChartStyle, chart_spec: ChartSpec, timestamps: np.ndarray, mg_dl: np.ndarray, chart_timezone: tzinfo) -> bytes:
+    key: tuple[ChartStyle, str, int, int, int] = (style, chart_spec.view, chart_spec.width, chart_spec.height, chart_spec.dpi)
+    with _renderers_lock:
+        renderer: ChartRenderer | AgpRenderer | None = _renderers.get(key)
+        if renderer is None:
+            renderer = CHART_RENDERERS[chart_spec.view](style=style, width=chart_spec.width, height=chart_spec.height, dpi=chart_spec.dpi)
+            _renderers[key] = renderer
+            while len(_renderers) > CHART_MAX_RENDERERS:
+                _ = _renderers.popitem(last=False)
+        _renderers.move_to_end(key)
+    return renderer.render(timestamps=timestamps, mg_dl=mg_dl, chart_timezone=chart_timezone, hours=chart_spec.hours, image_format=chart_spec.image_format)
+
+
+# runs in the render process, where the module level renderers above persist between calls
+def render_chart_timed(style: ChartStyle, chart_spec: ChartSpec, timestamps: np.ndarray, mg_dl: np.ndarray, chart_timezone: tzinfo) -> tuple[bytes, float]:
+    started: float = time.perf_counter()
+    chart: bytes = render_chart(style=style, chart_spec=chart_spec, timestamps=timestamps, mg_dl=mg_dl, chart_timezone=chart_timezone)
+    return chart, time.perf_counter() - started
+
+
+class ChartRenderPool:
+    def __init__(self, workers: int = CHART_RENDER_WORKERS, timeout: float = CHART_RENDER_TIMEOUT):
+        self._workers: int = workers
+        self._timeout: float = timeout
+        self._lock: threading.Lock = threading.Lock()
+        self._executor: ProcessPoolExecutor = self._create_executor()
+        # renders waiting for or in a render process right now
+        self.queued: int = 0
+        # the only record of finished renders, read by both /api/renderer and /metrics. render_time is the time spent
+        # drawing in the render process, wait_time the whole render including queueing and pickling
+        self.render_time: Histogram = Histogram()
+        self.wait_time: Histogram = Histogram()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn rather than fork, forking a process that is running qt and waitress threads is not safe
+        return ProcessPoolExecutor(max_workers=self._workers, mp_context=multiprocessing.get_context("spawn"))
+
+    # the executor to use instead of one that failed, only the first caller to notice replaces it
+    def _replace_executor(self, executor: ProcessPoolExecutor) -> tuple[ProcessPoolExecutor, bool]:
+        with self._lock:
+            replaced: bool = self._executor is executor
+            if replaced:
+                self._executor = self._create_executor()
+            return self._executor, replaced
+
+    def _submit(self, executor: ProcessPoolExecutor, style: ChartStyle, chart_spec: ChartSpec, timestamps: np.ndarray,
+                mg_dl: np.ndarray, chart_timezone: tzinfo) -> tuple[bytes, float]:
+        future: Future[tuple[bytes, float]] = executor.submit(render_chart_timed, style, chart_spec, timestamps, mg_dl, chart_timezone)
+        try:
+            return future.result(timeout=self._timeout)
+        except TimeoutError:
+            # one still queued behind other renders is just dropped, one that started drawing has a stuck render process
+            if not future.cancel():
+                _, replaced = self._replace_executor(executor=executor)
+                if replaced:
+                    kill_executor(executor=executor)
+            raise ChartRenderTimeout(timeout=self._timeout) from None
+
+    def render(self, style: ChartStyle, chart_spec: ChartSpec, timestamps: np.ndarray, mg_dl: np.ndarray, chart_timezone: tzinfo) -> bytes:
+        with self._lock:
+            self.queued += 1
+            executor: ProcessPoolExecutor = self._executor
+        started: float = time.perf_counter()
+        try:
+            try:
+                chart, seconds = self._submit(executor=executor, style=style, chart_spec=chart_spec, timestamps=timestamps, mg_dl=mg_dl, chart_timezone=chart_timezone)
+            except BrokenProcessPool:
+                # the render process died (crash, killed by the os or after a timeout), start a new one and try once more
+                executor, _ = self._replace_executor(executor=executor)
+                chart, seconds = self._submit(executor=executor, style=style, chart_spec=chart_spec, timestamps=timestamps, mg_dl=mg_dl, chart_timezone=chart_timezone)
+        finally:
+            with self._lock:
+                self.queued -= 1
+
+        self.render_time.observe(seconds)
+        self.wait_time.observe(time.perf_counter() - started)
+        return chart
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict[str, int | float]:
+        _, render_seconds, renders = self.render_time.cumulative()
+        _, wait_seconds, waits = self.wait_time.cumulative()
+        return {
+            "queued": self.queued,
+            "renders": renders,
+            "average_render_ms": round(render_seconds / renders * 1000, 3) if renders > 0 else 0.0,
+            "average_wait_ms": round(wait_seconds / waits * 1000, 3) if waits > 0 else 0.0,
+        }
+
+
+# ProcessPoolExecutor.shutdown leaves a render that is already running to finish, which a stuck one never does.
+# python 3.14 has terminate_workers for this, until then the processes are killed through the executor's own table
+def kill_executor(executor: ProcessPoolExecutor) -> None:
+    processes: list[multiprocessing.Process] = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.kill()
+
+
+# the memory every account's ChartCache may use between them, the least recently used chart of any account goes first
+class ChartCacheBudget:
+    def __init__(self, max_bytes: int = CHART_CACHE_MAX_BYTES):
+        self._max_bytes: int = max_bytes
+        self._lock: threading.Lock = threading.Lock()
+        self._entries: OrderedDict[tuple[ChartCache, Hashable], int] = OrderedDict()
+        self._bytes: int = 0
+
+    # the entries to evict to make room, the caches are told outside of this lock so neither lock is held while taking the other
+    def charge(self, cache: "ChartCache", key: Hashable, size: int) -> list[tuple["ChartCache", Hashable]]:
+        with self._lock:
+            self._bytes += size - self._entries.pop((cache, key), 0)
+            self._entries[(cache, key)] = size
+            evicted: list[tuple[ChartCache, Hashable]] = []
+            # the newest chart stays even when it alone is over budget
+            while self._bytes > self._max_bytes and len(self._entries) > 1:
+                entry, entry_size = self._entries.popitem(last=False)
+                self._bytes -= entry_size
+                evicted.append(entry)
+            return evicted
+
+    def touch(self, cache: "ChartCache", key: Hashable) -> None:
+        with self._lock:
+            if (cache, key) in self._entries:
+                self._entries.move_to_end((cache, key))
+
+    def release(self, cache: "ChartCache", key: Hashable) -> None:
+        with self._lock:
+            self._bytes -= self._entries.pop((cache, key), 0)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+            }
+
+
+class ChartCache:
+    def __init__(self, max_entries: int = CHART_CACHE_MAX_ENTRIES, budget: ChartCacheBudget | None = None,
+                 timeout: float = CHART_RENDER_TIMEOUT):
+        self._max_entries: int = max_entries
+        # how long a caller waits for somebody else's render of the same chart
+        self._timeout: float = timeout
+        # shared with the other accounts' caches, each cache alone is only bounded by max_entries without one
+        self._budget: ChartCacheBudget | None = budget
+        self._lock: threading.Lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, bytes] = OrderedDict()
+        self._pending: dict[Hashable, Future[bytes]] = {}
+        # bumped by clear(), a render started before it finishes for its own callers but is not cached
+        self._generation: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get_or_render(self, key: Hashable, render: Callable[[], bytes]) -> bytes:
+        with self._lock:
+            chart: bytes | None = self._entries.get(key)
+            if chart is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                pending: Future[bytes] | None = self._pending.get(key)
+                if pending is None:
+                    future: Future[bytes] = Future()
+                    self._pending[key] = future
+                    generation: int = self._generation
+        if chart is not None:
+            if self._budget is not None:
+                self._budget.touch(cache=self, key=key)
+            return chart
+
+        # somebody is already rendering this chart, wait for theirs instead of queueing another render
+        if pending is not None:
+            try:
+                return pending.result(timeout=self._timeout)
+            except ChartRenderTimeout:
+                raise
+            except TimeoutError:
+                raise ChartRenderTimeout(timeout=self._timeout) from None
+
+        # render outside of the lock so cache hits for other keys are never held up by Agg
+        try:
+            chart = render()
+        except BaseException as exception:
+            with self._lock:
+                self._finish_pending(key=key, future=future)
+            future.set_exception(exception)
+            raise
+        overflow: list[Hashable] = []
+        with self._lock:
+            self._finish_pending(key=key, future=future)
+            cached: bool = generation == self._generation
+            if cached:
+                self._entries[key] = chart
+                self._entries.move_to_end(key)
+                while len(self._entries) > self._max_entries:
+                    overflow.append(self._entries.popitem(last=False)[0])
+        future.set_result(chart)
+        if self._budget is not None and cached:
+            for overflow_key in overflow:
+                self._budget.release(cache=self, key=overflow_key)
+            for cache, evicted_key in self._budget.charge(cache=self, key=key, size=len(chart)):
+                cache.discard(key=evicted_key)
+        return chart
+
+    # after a clear() the key may already belong to a newer render
+    def _finish_pending(self, key: Hashable, future: Future[bytes]) -> None:
+        if self._pending.get(key) is future:
+            del self._pending[key]
+
+    # for entries the budget evicted, releasing as well keeps the two in step when the chart was put back in the meantime
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            _ = self._entries.pop(key, None)
+        if self._budget is not None:
+            self._budget.release(cache=self, key=key)
+
+    # renders in flight were started with the old config or account, later requests render again rather than wait for them
+    def clear(self) -> None:
+        with self._lock:
+            keys: list[Hashable] = list(self._entries)
+            self._entries.clear()
+            self._pending.clear()
+            self._generation += 1
+        if self._budget is not None:
+            for key in keys:
+                self._budget.release(cache=self, key=key)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": sum(len(chart) for chart in self._entries.values()),
+                "max_entries": self._max_entries,
+            }
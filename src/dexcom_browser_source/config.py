@@ -1,16 +1,52 @@
+import copy
+import logging
+import os
+import tempfile
+import threading
+from collections.abc import Callable
 from pathlib import Path
+from typing import override
 
-from PySide6.QtGui import QIcon
-from PySide6.QtWidgets import QApplication, QDialog, QGroupBox, QWidget
 import platformdirs
 import toml
 
+from dexcom_browser_source.server_settings import ServerSettings
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# how often config.toml's modification time is checked for edits made while the app runs
+CONFIG_WATCH_INTERVAL: float = 1.0
+
+
+# {"graph": {"colors": {"normal": "grey"}}} becomes {"graph.colors.normal": "grey"}
+def flatten_config(config: dict[str, object], prefix: str = "") -> dict[str, object]:
+    flat: dict[str, object] = {}
+    for key, value in config.items():
+        if isinstance(value, dict):
+            flat.update(flatten_config(value, prefix=f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+# the dotted keys whose values differ, a key only one side has counts as changed
+def diff_config(old: dict[str, object], new: dict[str, object]) -> frozenset[str]:
+    old_flat: dict[str, object] = flatten_config(old)
+    new_flat: dict[str, object] = flatten_config(new)
+    return frozenset(key for key in old_flat.keys() | new_flat.keys()
+                     if key not in old_flat or key not in new_flat or old_flat[key] != new_flat[key])
+
+
+# whether any changed key is one of the given keys or inside one of the given sections
+def touches(changes: frozenset[str], keys: tuple[str, ...]) -> bool:
+    return any(change == key or change.startswith(f"{key}.") for change in changes for key in keys)
+
 
 class AppConfig:
     def __init__(self, custom_config_path: Path | None = None):
         self._config_path: Path = Path(custom_config_path if custom_config_path is not None else platformdirs.user_config_path(), "dexcom-browser-source")
         self._config_file_path: Path = Path(self._config_path, "config.toml")
-        self.config: dict[str, dict[str, str | bool | int | float | dict[str, str | bool | int | float | None] | None]] = {
+        self.config: dict[str, dict[str, str | bool | int | float | list[str] | dict[str, str | bool | int | float | None] | None]] = {
             "app": {
                 "metric": False,
             },
@@ -32,9 +68,20 @@ class AppConfig:
                     "username": None,
                     "password": None,
                 },
-            }
+            },
+            # see server_settings.ServerSettings
+            "server": ServerSettings().to_config(),
+            # more people besides dexcom.account, see accounts.configured_accounts
+            "accounts": {},
         }
 
+        self._lock: threading.Lock = threading.Lock()
+        # held from writing or reading config.toml until the config and its modification time match it
+        self._file_lock: threading.Lock = threading.Lock()
+        self._modified: int | None = None
+        self._listeners: list[Callable[[frozenset[str]], None]] = []
+        self._watcher: ConfigWatcher | None = None
+
         # assume if the config file doesn't exist then this is the first run
         self.first_run: bool = False
         if not self._config_path.exists():
@@ -45,23 +92,96 @@ class AppConfig:
             self.first_run = True
         else:
             self.load()
+        # what the change listeners were last told about
+        self._applied: dict[str, object] = copy.deepcopy(self.config)
+
+    @property
+    def config_path(self) -> Path:
+        return self._config_path
 
     def load(self):
+        self._modified = self._config_file_path.stat().st_mtime_ns
         self.config = toml.load(f=self._config_file_path)
 
+    # listeners are called with the changed keys on whichever thread saved or reloaded the config
+    def add_change_listener(self, listener: Callable[[frozenset[str]], None]) -> None:
+        self._listeners.append(listener)
+
+    def remove_change_listener(self, listener: Callable[[frozenset[str]], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    # picks up edits to config.toml, a file that does not parse (half saved, a typo) is skipped until the next edit
+    def reload(self) -> frozenset[str]:
+        with self._file_lock:
+            try:
+                modified: int = self._config_file_path.stat().st_mtime_ns
+            except FileNotFoundError:
+                return frozenset()
+            if modified == self._modified:
+                return frozenset()
+            self._modified = modified
+            try:
+                config: dict[str, object] = toml.load(f=self._config_file_path)
+            except (OSError, toml.TomlDecodeError) as e:
+                logger.warning("ignoring %s until it is fixed: %s", self._config_file_path, e)
+                return frozenset()
+            # swapped in one assignment, requests in flight keep reading the config they started with and never wait
+            self.config = config
+        return self.apply_changes()
+
+    # tells the listeners which keys differ from what they were last told, after an in-place edit or a reload
+    def apply_changes(self) -> frozenset[str]:
+        with self._lock:
+            changes: frozenset[str] = diff_config(self._applied, self.config)
+            self._applied = copy.deepcopy(self.config)
+        if len(changes) > 0:
+            logger.info("config changed: %s", ", ".join(sorted(changes)))
+            for listener in list(self._listeners):
+                try:
+                    listener(changes)
+                except Exception:
+                    logger.exception("config change listener failed")
+        return changes
+
+    def start_watching(self, interval: float = CONFIG_WATCH_INTERVAL) -> None:
+        if self._watcher is None:
+            self._watcher = ConfigWatcher(app_config=self, interval=interval)
+            self._watcher.start()
+
+    def stop_watching(self) -> None:
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    # written next to config.toml and renamed over it, so neither the watcher nor an editor sees it half written
     def save(self):
-        with self._config_file_path.open(mode='w') as f:
-            _ = toml.dump(self.config, f)
+        with self._file_lock:
+            fd, temp_path = tempfile.mkstemp(dir=self._config_path, prefix=".config-", suffix=".toml")
+            try:
+                with os.fdopen(fd, mode='w') as f:
+                    _ = toml.dump(self.config, f)
+                os.replace(temp_path, self._config_file_path)
+            except BaseException:
+                Path(temp_path).unlink(missing_ok=True)
+                raise
+            # the watcher would otherwise reload what was just written
+            self._modified = self._config_file_path.stat().st_mtime_ns
+        _ = self.apply_changes()
+
 
-class SettingsDialog(QDialog):
-    def __init__(self, app: QApplication, app_config: AppConfig, parent: QWidget | None = None):
-        self._app: QApplication = app
+# polls rather than relying on file system notifications, which editors that save by renaming tend to defeat
+class ConfigWatcher(threading.Thread):
+    def __init__(self, app_config: AppConfig, interval: float):
+        super().__init__(name="ConfigWatcher", daemon=True)
         self._app_config: AppConfig = app_config
-        super().__init__(parent)
-        self._app_icon: QIcon = QIcon("assets/icon.svg")
-        self._app_group: QGroupBox = QGroupBox("General")
-        self._dexcom_group: QGroupBox = QGroupBox("Dexcom")
-        self._graph_group: QGroupBox = QGroupBox("Glucose Reading and Graph")
-        self.resize(self.minimumSize())
-        self.setFixedSize(self.minimumSize())
-        self.setWindowTitle("Dexcom Browser Source - Settings")
\ No newline at end of file
+        self._interval: float = interval
+        self._stop_event: threading.Event = threading.Event()
+
+    @override
+    def run(self, /) -> None:
+        while not self._stop_event.wait(timeout=self._interval):
+            _ = self._app_config.reload()
+
+    def stop(self) -> None:
+        self._stop_event.set()
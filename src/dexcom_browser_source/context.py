@@ -0,0 +1,107 @@
+import logging
+import threading
+from pathlib import Path
+
+from dexcom_browser_source.accounts import AccountSettings, configured_accounts
+from dexcom_browser_source.chart import CHART_CONFIG_KEYS, ChartCache, ChartCacheBudget, ChartRenderPool
+from dexcom_browser_source.config import AppConfig, touches
+from dexcom_browser_source.dexcom_client import DexcomClient
+from dexcom_browser_source.glucose_poller import GlucosePoller, PollScheduler
+from dexcom_browser_source.history import ReadingHistory
+from dexcom_browser_source.metrics import RequestMetrics
+from dexcom_browser_source.stream import ReadingStream
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+# one person's poller, readings, stream and rendered charts
+class AccountContext:
+    def __init__(self, account: AccountSettings, config_path: Path, poll_scheduler: PollScheduler, chart_cache_budget: ChartCacheBudget):
+        self.account: AccountSettings = account
+        # shared by every request for this account and its only caller of dexcom share. the client logs in on
+        # the poller's first fetch, so the server comes up even while share is down
+        self.glucose_poller: GlucosePoller = GlucosePoller(
+            dexcom=DexcomClient(username=account.username, password=account.password, base_url=account.share_url),
+            history=ReadingHistory(database_path=Path(config_path, account.history_file_name)),
+            scheduler=poll_scheduler,
+        )
+        self.reading_stream: ReadingStream = ReadingStream()
+        self.chart_cache: ChartCache = ChartCache(budget=chart_cache_budget)
+        self.glucose_poller.start()
+
+    # the switch itself happens on a poller thread so no request waits for a login
+    def change_account(self, account: AccountSettings) -> None:
+        if account == self.account:
+            return
+        new_account: bool = not account.same_person(self.account)
+        self.account = account
+        self.glucose_poller.change_account(
+            username=account.username, password=account.password, base_url=account.share_url, new_account=new_account)
+        if new_account:
+            self.chart_cache.clear()
+
+    def close(self) -> None:
+        self.reading_stream.close()
+        # a fetch in flight writes to the history when it finishes, so it gets to finish before the database is closed
+        if not self.glucose_poller.stop():
+            logger.warning("closing the history of account %r while its poller is still fetching", self.account.name)
+        self.glucose_poller.history.close()
+        self.chart_cache.clear()
+
+
+# everything that is expensive to rebuild, the dexcom sessions, the readings and the rendered charts, kept apart from
+# the flask app and waitress server so restarting those is a matter of milliseconds and nothing has to be fetched again.
+# the scheduler, render pool and cache budget are shared by all accounts, so a process serves dozens of them
+class ServerContext:
+    def __init__(self, app_config: AppConfig):
+        self._app_config: AppConfig = app_config
+        self._lock: threading.Lock = threading.Lock()
+        self.poll_scheduler: PollScheduler = PollScheduler()
+        self.chart_cache_budget: ChartCacheBudget = ChartCacheBudget()
+        self.chart_render_pool: ChartRenderPool = ChartRenderPool()
+        self.request_metrics: RequestMetrics = RequestMetrics()
+        self.accounts: dict[str, AccountContext] = {}
+        self.poll_scheduler.start()
+        self.sync_accounts()
+        self._app_config.add_change_listener(self.on_config_changed)
+
+    # starts the accounts added to the config since and closes the removed ones, called whenever an app is created,
+    # as only a new app has urls for a new account
+    def sync_accounts(self) -> dict[str, AccountContext]:
+        configured: dict[str, AccountSettings] = configured_accounts(app_config=self._app_config, warn=True)
+        with self._lock:
+            removed: list[AccountContext] = [self.accounts.pop(name) for name in list(self.accounts) if name not in configured]
+            for name, account in configured.items():
+                if name in self.accounts:
+                    self.accounts[name].change_account(account=account)
+                else:
+                    self.accounts[name] = AccountContext(
+                        account=account, config_path=self._app_config.config_path,
+                        poll_scheduler=self.poll_scheduler, chart_cache_budget=self.chart_cache_budget)
+            accounts: dict[str, AccountContext] = dict(self.accounts)
+        for account_context in removed:
+            account_context.close()
+        return accounts
+
+    # drops only what the changed keys make outdated, everything else stays warm. runs on the thread that saved or
+    # reloaded the config. accounts added or removed wait for sync_accounts and the restart that comes with it
+    def on_config_changed(self, changes: frozenset[str]) -> None:
+        configured: dict[str, AccountSettings] = configured_accounts(app_config=self._app_config)
+        with self._lock:
+            accounts: list[AccountContext] = list(self.accounts.values())
+        for account_context in accounts:
+            if touches(changes=changes, keys=CHART_CONFIG_KEYS):
+                account_context.chart_cache.clear()
+            account: AccountSettings | None = configured.get(account_context.account.name)
+            if account is not None:
+                account_context.change_account(account=account)
+
+    def close(self) -> None:
+        self._app_config.remove_change_listener(self.on_config_changed)
+        with self._lock:
+            accounts: list[AccountContext] = list(self.accounts.values())
+            self.accounts.clear()
+        for account_context in accounts:
+            account_context.close()
+        self.poll_scheduler.stop()
+        self.chart_render_pool.shutdown()
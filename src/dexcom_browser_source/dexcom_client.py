@@ -0,0 +1,163 @@
+import importlib.metadata
+import logging
+import random
+import threading
+import time
+from typing import Any, override
+import requests
+from pydexcom.const import MAX_MAX_COUNT, MAX_MINUTES
+from pydexcom.dexcom import Dexcom
+from pydexcom.errors import AccountError
+from pydexcom.glucose_reading import GlucoseReading
+
+from dexcom_browser_source.metrics import Histogram
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# TimeoutDexcom relies on pydexcom internals, the version it was written against is the one pinned in pyproject.toml
+PYDEXCOM_VERSION: str = "0.5.0"
+# connect and read timeout for every dexcom share request
+REQUEST_TIMEOUT: tuple[float, float] = (5.0, 10.0)
+# first retry delay, doubled for every consecutive failure up to the cap
+BACKOFF_BASE: float = 30.0
+BACKOFF_CAP: float = 900.0
+# consecutive failures before the circuit opens and calls fail fast until the backoff has passed
+FAILURE_THRESHOLD: int = 3
+# log in again before dexcom share expires the session rather than after a request fails
+SESSION_REFRESH_INTERVAL: float = 3600.0
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_in: float):
+        super().__init__(f"Dexcom Share is unavailable, retrying in {retry_in:.0f} seconds")
+        self.retry_in: float = retry_in
+
+
+# keeps one connection pool for the lifetime of the client and never waits on share without a timeout
+class TimeoutSession(requests.Session):
+    def __init__(self, timeout: tuple[float, float]):
+        super().__init__()
+        self._timeout: tuple[float, float] = timeout
+
+    @override
+    def request(self, *args: Any, **kwargs: Any) -> requests.Response:
+        _ = kwargs.setdefault('timeout', self._timeout)
+        return super().request(*args, **kwargs)
+
+
+# the one place that touches pydexcom's private attributes, everything else uses its public api. pydexcom 0.5.0
+# creates self._session and picks self._base_url from the region in its constructor, then logs in from there through
+# self._get_session(), which builds every request url as f"{self._base_url}{endpoint}"
+class TimeoutDexcom(Dexcom):
+    def __init__(self, *, username: str, password: str, timeout: tuple[float, float], base_url: str | None = None):
+        self._timeout_session: TimeoutSession = TimeoutSession(timeout=timeout)
+        # pydexcom's own urls end in a slash and the endpoints are appended to them as they are
+        self._custom_base_url: str | None = base_url if base_url is None or base_url.endswith("/") else f"{base_url}/"
+        super().__init__(username=username, password=password)
+
+    # swaps in the timeout session and base url before the constructor's login
+    @override
+    def _get_session(self) -> None:
+        self._session = self._timeout_session
+        if self._custom_base_url is not None:
+            self._base_url = self._custom_base_url
+        super()._get_session()
+
+    def refresh_session(self) -> None:
+        self._get_session()
+
+
+if importlib.metadata.version("pydexcom") != PYDEXCOM_VERSION:
+    logger.warning("pydexcom %s is installed but %s is expected, logging in to Dexcom Share may not work",
+                   importlib.metadata.version("pydexcom"), PYDEXCOM_VERSION)
+
+
+class DexcomClient:
+    def __init__(self, username: str, password: str, base_url: str | None = None, timeout: tuple[float, float] = REQUEST_TIMEOUT):
+        self._username: str = username
+        self._password: str = password
+        self._base_url: str | None = base_url
+        self._timeout: tuple[float, float] = timeout
+        # a single upstream call at a time, however many threads ask
+        self._lock: threading.Lock = threading.Lock()
+        self._dexcom: TimeoutDexcom | None = None
+        self._session_started: float = 0.0
+        self._consecutive_failures: int = 0
+        self._retry_at: float = 0.0
+        self.last_error: str | None = None
+        self.calls: int = 0
+        self.errors: int = 0
+        # every upstream round trip, logins included, successful or not
+        self.latency: Histogram = Histogram()
+
+    @property
+    def healthy(self) -> bool:
+        return self._consecutive_failures == 0
+
+    @property
+    def circuit_open(self) -> bool:
+        return self._consecutive_failures >= FAILURE_THRESHOLD and time.monotonic() < self._retry_at
+
+    # seconds until the next upstream attempt is allowed, 0 when it may happen right away
+    def retry_in(self) -> float:
+        return max(0.0, self._retry_at - time.monotonic())
+
+    # new credentials get a fresh login on the next call, and a fresh chance if the old ones had opened the circuit
+    def set_account(self, username: str, password: str, base_url: str | None = None) -> None:
+        with self._lock:
+            self._username = username
+            self._password = password
+            self._base_url = base_url
+            self._dexcom = None
+            self._consecutive_failures = 0
+            self._retry_at = 0.0
+            self.last_error = None
+
+    def get_glucose_readings(self, minutes: int = MAX_MINUTES, max_count: int = MAX_MAX_COUNT) -> list[GlucoseReading]:
+        with self._lock:
+            if self.circuit_open:
+                raise CircuitOpenError(retry_in=self.retry_in())
+            started: float = time.perf_counter()
+            try:
+                dexcom: TimeoutDexcom = self._session()
+                self.calls += 1
+                readings: list[GlucoseReading] = dexcom.get_glucose_readings(minutes=minutes, max_count=max_count)
+            except Exception as e:
+                self.latency.observe(time.perf_counter() - started)
+                self._record_failure(error=e)
+                raise
+            self.latency.observe(time.perf_counter() - started)
+            self._consecutive_failures = 0
+            self._retry_at = 0.0
+            self.last_error = None
+            return readings
+
+    def _session(self) -> TimeoutDexcom:
+        now: float = time.monotonic()
+        if self._dexcom is None:
+            self.calls += 1
+            self._dexcom = TimeoutDexcom(username=self._username, password=self._password, timeout=self._timeout, base_url=self._base_url)
+            self._session_started = now
+        elif now - self._session_started > SESSION_REFRESH_INTERVAL:
+            self.calls += 1
+            self._dexcom.refresh_session()
+            self._session_started = now
+        return self._dexcom
+
+    def _record_failure(self, error: Exception) -> None:
+        self.errors += 1
+        self._consecutive_failures += 1
+        self.last_error = str(error)
+        if isinstance(error, AccountError):
+            # wrong credentials will not fix themselves and dexcom locks accounts that keep retrying them,
+            # so open the circuit straight away, wait the longest backoff and then log in from scratch
+            self._dexcom = None
+            self._consecutive_failures = max(self._consecutive_failures, FAILURE_THRESHOLD)
+            ceiling: float = BACKOFF_CAP
+        else:
+            ceiling = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (self._consecutive_failures - 1))
+        # half fixed, half jittered, so many clients that failed together do not retry together
+        delay: float = ceiling / 2 + random.uniform(0, ceiling / 2)
+        self._retry_at = time.monotonic() + delay
+        logger.warning("Dexcom Share request failed (%d in a row), next attempt in %.0f seconds: %s",
+                       self._consecutive_failures, delay, error)
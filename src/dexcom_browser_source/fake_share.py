@@ -0,0 +1,196 @@
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, override
+from urllib.parse import parse_qs, urlsplit
+from pydexcom.const import DEXCOM_AUTHENTICATE_ENDPOINT, DEXCOM_GLUCOSE_READINGS_ENDPOINT, DEXCOM_LOGIN_ID_ENDPOINT
+
+# stands in for dexcom share so the server can be tested and benchmarked without an account,
+# point the dexcom.share_url config key at FakeShareServer.url to use it
+
+# same cadence as a real transmitter
+FAKE_READING_INTERVAL: float = 300.0
+# a slow day-long wave, one full swing every six hours
+FAKE_WAVE_PERIOD: float = 6 * 3600.0
+
+# mg/dL per minute thresholds, steepest first, for the trend dexcom would report
+FAKE_TRENDS: list[tuple[float, str]] = [
+    (3.0, "DoubleUp"),
+    (2.0, "SingleUp"),
+    (1.0, "FortyFiveUp"),
+    (-1.0, "Flat"),
+    (-2.0, "FortyFiveDown"),
+    (-3.0, "SingleDown"),
+]
+
+
+def fake_mg_dl(timestamp: float) -> int:
+    wave: float = 60 * math.sin(2 * math.pi * timestamp / FAKE_WAVE_PERIOD)
+    # deterministic wobble so repeated requests for the same reading agree
+    wobble: float = 8 * math.sin(timestamp / 977.0) + 4 * math.sin(timestamp / 331.0)
+    return max(40, min(400, round(140 + wave + wobble)))
+
+
+def fake_trend(timestamp: float, interval: float) -> str:
+    slope: float = (fake_mg_dl(timestamp) - fake_mg_dl(timestamp - interval)) / (interval / 60)
+    for threshold, trend in FAKE_TRENDS:
+        if slope > threshold:
+            return trend
+    return "DoubleDown"
+
+
+class FakeShareServer(ThreadingHTTPServer):
+    daemon_threads: bool = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, interval: float = FAKE_READING_INTERVAL,
+                 latency: float = 0.0, error_rate: float = 0.0, session_lifetime: float | None = None,
+                 password: str | None = None):
+        super().__init__((host, port), FakeShareRequestHandler)
+        self.interval: float = interval
+        self.latency: float = latency
+        self.error_rate: float = error_rate
+        self.session_lifetime: float | None = session_lifetime
+        # any password is accepted unless one is given
+        self.password: str | None = password
+        self.account_id: str = str(uuid.uuid4())
+        self._lock: threading.Lock = threading.Lock()
+        self._sessions: dict[str, float] = {}
+        self._calls: dict[str, int] = {}
+        self._errors: int = 0
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.serve_forever, name="FakeShareServer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"calls": dict(self._calls), "total_calls": sum(self._calls.values()), "errors": self._errors}
+
+    def record_call(self, endpoint: str) -> None:
+        with self._lock:
+            self._calls[endpoint] = self._calls.get(endpoint, 0) + 1
+
+    def should_fail(self) -> bool:
+        failed: bool = random.random() < self.error_rate
+        if failed:
+            with self._lock:
+                self._errors += 1
+        return failed
+
+    def create_session(self) -> str:
+        session_id: str = str(uuid.uuid4())
+        with self._lock:
+            self._sessions[session_id] = time.monotonic()
+        return session_id
+
+    def session_valid(self, session_id: str) -> bool:
+        with self._lock:
+            created: float | None = self._sessions.get(session_id)
+        if created is None:
+            return False
+        return self.session_lifetime is None or time.monotonic() - created < self.session_lifetime
+
+    # newest first, like share, at most max_count readings from the last minutes
+    def readings(self, minutes: int, max_count: int) -> list[dict[str, Any]]:
+        now: float = time.time()
+        newest: float = now - now % self.interval
+        readings: list[dict[str, Any]] = []
+        timestamp: float = newest
+        while len(readings) < max_count and now - timestamp <= minutes * 60:
+            milliseconds: int = int(timestamp * 1000)
+            readings.append({
+                "WT": f"Date({milliseconds})",
+                "ST": f"Date({milliseconds})",
+                "DT": f"Date({milliseconds}+0000)",
+                "Value": fake_mg_dl(timestamp),
+                "Trend": fake_trend(timestamp, self.interval),
+            })
+            timestamp -= self.interval
+        return readings
+
+
+class FakeShareRequestHandler(BaseHTTPRequestHandler):
+    server: FakeShareServer
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        endpoint: str = url.path.removeprefix("/")
+        query: dict[str, list[str]] = parse_qs(url.query)
+        length: int = int(self.headers.get("Content-Length", 0))
+        body: dict[str, Any] = json.loads(self.rfile.read(length) or b"{}")
+
+        self.server.record_call(endpoint)
+        if self.server.latency > 0:
+            time.sleep(self.server.latency)
+        if self.server.should_fail():
+            self.respond(status=500, payload={"Code": "InternalServerError", "Message": "fake share failure"})
+            return
+
+        if endpoint in (DEXCOM_AUTHENTICATE_ENDPOINT, DEXCOM_LOGIN_ID_ENDPOINT):
+            if self.server.password is not None and body.get("password") != self.server.password:
+                self.respond(status=500, payload={"Code": "AccountPasswordInvalid", "Message": "password invalid"})
+            elif endpoint == DEXCOM_AUTHENTICATE_ENDPOINT:
+                self.respond(status=200, payload=self.server.account_id)
+            else:
+                self.respond(status=200, payload=self.server.create_session())
+        elif endpoint == DEXCOM_GLUCOSE_READINGS_ENDPOINT:
+            if not self.server.session_valid(query.get("sessionId", [""])[0]):
+                self.respond(status=500, payload={"Code": "SessionIdNotFound", "Message": "session not found"})
+            else:
+                self.respond(status=200, payload=self.server.readings(
+                    minutes=int(query.get("minutes", ["1440"])[0]), max_count=int(query.get("maxCount", ["288"])[0])))
+        else:
+            self.respond(status=404, payload={"Code": "NotFound", "Message": endpoint})
+
+    def respond(self, status: int, payload: object) -> None:
+        data: bytes = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        _ = self.wfile.write(data)
+
+    @override
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Serve synthetic glucose readings the way Dexcom Share does")
+    _ = parser.add_argument("--host", default="127.0.0.1")
+    _ = parser.add_argument("--port", type=int, default=8081)
+    _ = parser.add_argument("--interval", type=float, default=FAKE_READING_INTERVAL, help="seconds between readings")
+    _ = parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    _ = parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a server error")
+    _ = parser.add_argument("--session-lifetime", type=float, help="seconds before a session id stops being accepted")
+    arguments: argparse.Namespace = parser.parse_args()
+
+    server: FakeShareServer = FakeShareServer(
+        host=arguments.host, port=arguments.port, interval=arguments.interval, latency=arguments.latency,
+        error_rate=arguments.error_rate, session_lifetime=arguments.session_lifetime)
+    print(f"fake Dexcom Share on {server.url}, set dexcom.share_url to it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
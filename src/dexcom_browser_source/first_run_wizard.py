@@ -1,10 +1,13 @@
-from typing import override
+from typing import TYPE_CHECKING, override
 from PySide6.QtCore import Qt
 from PySide6.QtWidgets import QApplication, QCheckBox, QFormLayout, QLabel, QLineEdit, QPushButton, QTextEdit, QVBoxLayout, QWidget, QWizard, QWizardPage
-from pydexcom import Dexcom
 from dexcom_browser_source.config import AppConfig
 from dexcom_browser_source.system_tray import SystemTrayIcon
 
+# pydexcom is only imported when the user actually logs in
+if TYPE_CHECKING:
+    from pydexcom import Dexcom
+
 
 class FirstRunWizard(QWizard):
     def __init__(self, app: QApplication, app_config: AppConfig, system_tray_icon: SystemTrayIcon, parent: QWidget | None = None):
@@ -100,14 +103,17 @@ class DexcomLoginPage(QWizardPage):
         self._layout.addRow(self._login_status_label)
         self.setLayout(self._layout)
 
-    def login(self) -> Dexcom | Exception:
+    def login(self) -> "Dexcom | Exception":
+        from pydexcom import Dexcom
         try:
             dexcom: Dexcom = Dexcom(username=self._username_line_edit.text(), password=self._password_line_edit.text())
             self._login_status_label.setText("Login successful!")
             self._login_status_label.setStyleSheet("QLabel { color: green; }")
             self._login_push_button.setChecked(True)
-            self._app_config.config["dexcom"]["username"] = self._username_line_edit.text()
-            self._app_config.config["dexcom"]["password"] = self._password_line_edit.text()
+            self._app_config.config["dexcom"]["account"] = {
+                "username": self._username_line_edit.text(),
+                "password": self._password_line_edit.text(),
+            }
             return dexcom
         except Exception as e:
             self._login_status_label.setText(str(e))
@@ -152,6 +158,9 @@ class FinishPage(QWizardPage):
     def validatePage(self, /) -> bool:
         if self._save_config_check_box.isChecked():
             self._app_config.save()
+        else:
+            # the running server still picks up the login, it just is not kept for the next start
+            _ = self._app_config.apply_changes()
         if self._open_details_check_box.isChecked():
             self._system_tray_icon.browser_source_details_dialog.show()
         return super().validatePage()
\ No newline at end of file
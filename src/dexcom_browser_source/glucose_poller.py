@@ -0,0 +1,261 @@
+import logging
+import threading
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+from typing import override
+from pydexcom.glucose_reading import GlucoseReading
+
+from dexcom_browser_source.dexcom_client import CircuitOpenError, DexcomClient
+from dexcom_browser_source.history import ReadingHistory
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# dexcom transmitters upload a new reading every 5 minutes
+READING_INTERVAL: timedelta = timedelta(minutes=5)
+# give dexcom share a moment to receive the upload before asking for it
+UPLOAD_GRACE: timedelta = timedelta(seconds=15)
+# how long to wait before asking again when a reading is late or share errored
+RETRY_INTERVAL: timedelta = timedelta(seconds=30)
+# a reading that is still late is asked for half as often each time, down to once per reading interval, so a sensor
+# that is off or a missed upload does not cost two share calls a minute
+OVERDUE_RETRY_MAX: timedelta = READING_INTERVAL
+# same window pydexcom uses for Dexcom.get_current_glucose_reading
+CURRENT_WINDOW: timedelta = timedelta(minutes=10)
+# seconds between two accounts' fetches, so pollers that fall due together do not hit dexcom share in one burst
+POLL_STAGGER: float = 0.25
+# accounts fetched at the same time, a share request that runs into its timeout only holds up one of them
+POLL_WORKERS: int = 4
+# how long stopping a poller waits for its fetch in flight, a share request alone may take REQUEST_TIMEOUT
+POLL_STOP_TIMEOUT: float = 5.0
+
+
+# one thread deciding when every account's poller fetches, however many accounts are served
+class PollScheduler(threading.Thread):
+    def __init__(self, workers: int = POLL_WORKERS, stagger: float = POLL_STAGGER):
+        super().__init__(name="PollScheduler", daemon=True)
+        self._workers: int = workers
+        self._stagger: float = stagger
+        self._lock: threading.Lock = threading.Lock()
+        # notified whenever a fetch finishes, for remove() to wait on
+        self._poll_finished: threading.Condition = threading.Condition(self._lock)
+        self._stop_event: threading.Event = threading.Event()
+        self._wake_event: threading.Event = threading.Event()
+        self._pollers: set[GlucosePoller] = set()
+        # monotonic time each idle poller is next due, a poller that is fetching right now is in _polling instead
+        self._due: dict[GlucosePoller, float] = {}
+        self._polling: set[GlucosePoller] = set()
+        # woken while fetching, due again as soon as that fetch is done
+        self._woken: set[GlucosePoller] = set()
+        self._next_slot: float = 0.0
+
+    def add(self, poller: "GlucosePoller") -> None:
+        with self._lock:
+            self._pollers.add(poller)
+            self._due[poller] = time.monotonic()
+        self._wake_event.set()
+
+    # the poller is not scheduled again, a fetch in flight gets up to timeout seconds to finish. false when it is still running
+    def remove(self, poller: "GlucosePoller", timeout: float | None = None) -> bool:
+        with self._lock:
+            self._pollers.discard(poller)
+            _ = self._due.pop(poller, None)
+            self._woken.discard(poller)
+            return self._poll_finished.wait_for(lambda: poller not in self._polling, timeout=timeout)
+
+    def wake(self, poller: "GlucosePoller") -> None:
+        with self._lock:
+            if poller in self._polling:
+                self._woken.add(poller)
+            elif poller in self._due:
+                self._due[poller] = time.monotonic()
+        self._wake_event.set()
+
+    @property
+    def poller_count(self) -> int:
+        with self._lock:
+            return len(self._pollers)
+
+    @override
+    def run(self, /) -> None:
+        while not self._stop_event.is_set():
+            poller: GlucosePoller | None = None
+            with self._lock:
+                now: float = time.monotonic()
+                start: float | None = None
+                if len(self._due) > 0 and len(self._polling) < self._workers:
+                    next_poller: GlucosePoller = min(self._due, key=self._due.__getitem__)
+                    start = max(self._due[next_poller], self._next_slot)
+                    if start <= now:
+                        poller = next_poller
+                        del self._due[poller]
+                        self._polling.add(poller)
+                        self._next_slot = now + self._stagger
+            if poller is not None:
+                threading.Thread(target=self._poll, args=(poller,), name="GlucosePoll", daemon=True).start()
+                continue
+            # a finished fetch, a new poller or a wake set the event, otherwise sleep until the next one is due
+            _ = self._wake_event.wait(timeout=None if start is None else start - now)
+            self._wake_event.clear()
+
+    def _poll(self, poller: "GlucosePoller") -> None:
+        try:
+            delay: float = poller.poll()
+        except Exception:
+            logger.exception("glucose poller failed")
+            delay = RETRY_INTERVAL.total_seconds()
+        with self._lock:
+            self._polling.discard(poller)
+            self._poll_finished.notify_all()
+            if poller in self._pollers:
+                self._due[poller] = time.monotonic() + (0.0 if poller in self._woken else delay)
+                self._woken.discard(poller)
+        self._wake_event.set()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._wake_event.set()
+
+
+# one account's readings, fetched whenever its PollScheduler says so
+class GlucosePoller:
+    def __init__(self, dexcom: DexcomClient, history: ReadingHistory, scheduler: PollScheduler):
+        self._dexcom: DexcomClient = dexcom
+        self._history: ReadingHistory = history
+        self._scheduler: PollScheduler = scheduler
+        self._lock: threading.Lock = threading.Lock()
+        self._ready_event: threading.Event = threading.Event()
+        # start from whatever was stored before the last shutdown
+        self._latest_reading: GlucoseReading | None = history.latest_reading()
+        self._listeners: list[Callable[[GlucoseReading], None]] = []
+        self._status_listeners: list[Callable[[bool], None]] = []
+        self._stale: bool = False
+        self._pending_account: tuple[str, str, str | None, bool] | None = None
+        # polls in a row that found the next reading overdue, reset when a new one arrives
+        self._overdue_polls: int = 0
+
+    @property
+    def dexcom(self) -> DexcomClient:
+        return self._dexcom
+
+    # true while dexcom share is failing and the readings served are the last known good ones
+    @property
+    def stale(self) -> bool:
+        return self._stale
+
+    @property
+    def history(self) -> ReadingHistory:
+        return self._history
+
+    @property
+    def latest_reading(self) -> GlucoseReading | None:
+        with self._lock:
+            return self._latest_reading
+
+    @property
+    def current_reading(self) -> GlucoseReading | None:
+        reading: GlucoseReading | None = self.latest_reading
+        if reading is None or datetime.now(tz=timezone.utc) - reading.datetime > CURRENT_WINDOW:
+            return None
+        return reading
+
+    # listeners are called on a poller thread whenever a new reading lands
+    def add_listener(self, listener: Callable[[GlucoseReading], None]) -> None:
+        self._listeners.append(listener)
+
+    # status listeners are called on a poller thread whenever the readings turn stale or recover
+    def add_status_listener(self, listener: Callable[[bool], None]) -> None:
+        self._status_listeners.append(listener)
+
+    # the shared poller outlives the apps created around it, each app removes its listeners when it shuts down
+    def remove_listener(self, listener: Callable[[GlucoseReading], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def remove_status_listener(self, listener: Callable[[bool], None]) -> None:
+        if listener in self._status_listeners:
+            self._status_listeners.remove(listener)
+
+    # applied by the poller before its next fetch, so nothing fetched with the old credentials can land after it.
+    # new_account clears the readings, for a different person rather than a changed password
+    def change_account(self, username: str, password: str, base_url: str | None, new_account: bool) -> None:
+        with self._lock:
+            self._pending_account = (username, password, base_url, new_account)
+        self._scheduler.wake(self)
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        return self._ready_event.wait(timeout=timeout)
+
+    # fetch the newest reading and return the number of seconds until the next one is due
+    def poll(self) -> float:
+        with self._lock:
+            pending_account: tuple[str, str, str | None, bool] | None = self._pending_account
+            self._pending_account = None
+        if pending_account is not None:
+            username, password, base_url, new_account = pending_account
+            self._dexcom.set_account(username=username, password=password, base_url=base_url)
+            self._overdue_polls = 0
+            if new_account:
+                self._history.clear()
+                with self._lock:
+                    self._latest_reading = None
+
+        try:
+            new_readings: list[GlucoseReading] = self._history.sync(dexcom=self._dexcom)
+        except CircuitOpenError as e:
+            self._ready_event.set()
+            return max(e.retry_in, 1.0)
+        except Exception:
+            logger.exception("failed to fetch new glucose readings from Dexcom Share")
+            self._set_stale(stale=True)
+            self._ready_event.set()
+            # the client has already worked out a jittered backoff for this failure
+            return max(self._dexcom.retry_in(), 1.0)
+
+        self._set_stale(stale=False)
+
+        with self._lock:
+            if len(new_readings) > 0:
+                self._latest_reading = new_readings[-1]
+            reading: GlucoseReading | None = self._latest_reading
+        self._ready_event.set()
+
+        if len(new_readings) > 0:
+            self._overdue_polls = 0
+            for listener in list(self._listeners):
+                try:
+                    listener(reading)
+                except Exception:
+                    logger.exception("glucose reading listener failed")
+
+        # schedule off the reading's own timestamp rather than a fixed timer, falling back to
+        # the overdue retry when the next reading is already late (missed upload, no signal)
+        if reading is not None:
+            next_due: datetime = reading.datetime + READING_INTERVAL + UPLOAD_GRACE
+            delay: float = (next_due - datetime.now(tz=timezone.utc)).total_seconds()
+            if delay > 0:
+                return delay
+        return self._overdue_retry()
+
+    def _overdue_retry(self) -> float:
+        delay: timedelta = min(RETRY_INTERVAL * 2 ** self._overdue_polls, OVERDUE_RETRY_MAX)
+        if delay < OVERDUE_RETRY_MAX:
+            self._overdue_polls += 1
+        return delay.total_seconds()
+
+    def _set_stale(self, stale: bool) -> None:
+        if stale == self._stale:
+            return
+        self._stale = stale
+        for listener in list(self._status_listeners):
+            try:
+                listener(stale)
+            except Exception:
+                logger.exception("glucose status listener failed")
+
+    def start(self) -> None:
+        self._scheduler.add(self)
+
+    # false when a fetch was still running after timeout seconds, it finishes by itself but stores nothing once the history is closed
+    def stop(self, timeout: float = POLL_STOP_TIMEOUT) -> bool:
+        return self._scheduler.remove(self, timeout=timeout)
@@ -0,0 +1,81 @@
+import logging
+import signal
+import sys
+import threading
+from types import FrameType
+from flask import Flask
+from waitress.server import BaseWSGIServer, MultiSocketServer
+
+from dexcom_browser_source.accounts import configured_accounts
+from dexcom_browser_source.config import AppConfig, touches
+from dexcom_browser_source.server import create_app, create_waitress_server, shutdown_app, stop_waitress_server
+from dexcom_browser_source.server_settings import RESTART_CONFIG_KEYS, ServerSettings
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# how long the requests in flight get to finish on shutdown, before their connections are closed
+HEADLESS_SHUTDOWN_TIMEOUT: float = 5.0
+# how often the main thread checks waitress' loop is still alive
+HEADLESS_WATCH_INTERVAL: float = 1.0
+
+
+# serves the browser source without qt, for dedicated streaming machines and containers
+def run_headless(app_config: AppConfig) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if app_config.first_run or len(configured_accounts(app_config=app_config, warn=True)) == 0:
+        logger.error("no dexcom account configured in %s, run the desktop app once or fill in [dexcom.account]", app_config.config_path)
+        return 1
+
+    app: Flask = create_app(app_config=app_config)
+    waitress_server: MultiSocketServer | BaseWSGIServer = create_waitress_server(
+        app=app, **ServerSettings.from_config(app_config=app_config).waitress_options())
+
+    stop_event: threading.Event = threading.Event()
+
+    # the actual shutdown happens in the main thread once the wait below returns
+    def stop(signum: int, _frame: FrameType | None) -> None:
+        logger.info("received %s, shutting down", signal.Signals(signum).name)
+        stop_event.set()
+
+    # the usual daemon convention, reread the config now rather than at the watcher's next look
+    def reload(_signum: int, _frame: FrameType | None) -> None:
+        logger.info("received SIGHUP, reloading %s", app_config.config_path)
+        _ = app_config.reload()
+
+    # everything else in config.toml is picked up while serving, a changed password or username included
+    served_accounts: frozenset[str] = frozenset(app.extensions['accounts'])
+
+    def warn_restart(changes: frozenset[str]) -> None:
+        restart_changes: list[str] = sorted(change for change in changes if touches(changes=frozenset({change}), keys=RESTART_CONFIG_KEYS))
+        if len(restart_changes) > 0:
+            logger.warning("%s changed, restart to apply", ", ".join(restart_changes))
+        if frozenset(configured_accounts(app_config=app_config)) != served_accounts:
+            logger.warning("accounts were added or removed, restart to serve them")
+
+    app_config.add_change_listener(warn_restart)
+    app_config.start_watching()
+    _ = signal.signal(signal.SIGINT, stop)
+    _ = signal.signal(signal.SIGTERM, stop)
+    if sys.platform != "win32":
+        _ = signal.signal(signal.SIGHUP, reload)
+
+    waitress_server.print_listen("Serving on http://{}:{}")
+    # waitress' loop gets a thread of its own so the main one stays free to handle signals and drain it, as the gui does
+    loop_thread: threading.Thread = threading.Thread(target=waitress_server.run, name="WaitressLoop", daemon=True)
+    loop_thread.start()
+    exit_code: int = 0
+    try:
+        while not stop_event.wait(timeout=HEADLESS_WATCH_INTERVAL):
+            if not loop_thread.is_alive():
+                logger.error("waitress stopped unexpectedly")
+                exit_code = 1
+                break
+    finally:
+        app_config.stop_watching()
+        try:
+            # open /api/stream responses are ended and the requests in flight finish before the sockets close
+            if not stop_waitress_server(app=app, waitress_server=waitress_server, loop_thread=loop_thread, timeout=HEADLESS_SHUTDOWN_TIMEOUT):
+                logger.warning("requests were still in flight after %.0f seconds, closed them", HEADLESS_SHUTDOWN_TIMEOUT)
+        finally:
+            shutdown_app(app)
+    return exit_code
@@ -0,0 +1,186 @@
+import math
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone, tzinfo
+from pathlib import Path
+import numpy as np
+from pydexcom.const import DEXCOM_TREND_DIRECTIONS, MAX_MAX_COUNT, MAX_MINUTES
+from pydexcom.glucose_reading import GlucoseReading
+
+from dexcom_browser_source.dexcom_client import DexcomClient
+
+# how much history is kept on disk and in memory, well past dexcom share's own 24 hour limit
+HISTORY_RETENTION: timedelta = timedelta(days=90)
+# one reading every 5 minutes
+HISTORY_CAPACITY: int = int(HISTORY_RETENTION / timedelta(minutes=5))
+
+TREND_DIRECTIONS: list[str] = list(DEXCOM_TREND_DIRECTIONS.keys())
+
+
+class ReadingHistory:
+    def __init__(self, database_path: Path, capacity: int = HISTORY_CAPACITY):
+        self._database_path: Path = database_path
+        self._capacity: int = capacity
+        self._lock: threading.Lock = threading.Lock()
+
+        # columnar ring buffer, readings are kept oldest to newest starting at self._start
+        self._timestamps: np.ndarray = np.zeros(capacity, dtype=np.int64)
+        self._mg_dl: np.ndarray = np.zeros(capacity, dtype=np.uint16)
+        self._trends: np.ndarray = np.zeros(capacity, dtype=np.uint8)
+        self._utc_offsets: np.ndarray = np.zeros(capacity, dtype=np.int16)
+        self._start: int = 0
+        self._size: int = 0
+        # set by close(), a sync that was still running then keeps what it fetched in memory only
+        self._closed: bool = False
+
+        self._database: sqlite3.Connection = sqlite3.connect(self._database_path, check_same_thread=False)
+        _ = self._database.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            "timestamp INTEGER PRIMARY KEY, mg_dl INTEGER NOT NULL, trend TEXT NOT NULL, utc_offset INTEGER NOT NULL)")
+        self.load()
+
+    def load(self) -> None:
+        cutoff: int = int((datetime.now(tz=timezone.utc) - HISTORY_RETENTION).timestamp() * 1000)
+        with self._lock:
+            rows: list[tuple[int, int, str, int]] = self._database.execute(
+                "SELECT timestamp, mg_dl, trend, utc_offset FROM readings WHERE timestamp >= ? ORDER BY timestamp", (cutoff,)).fetchall()
+            rows = rows[-self._capacity:]
+            size: int = len(rows)
+            self._start = 0
+            self._size = size
+            if size > 0:
+                timestamps, mg_dl, trends, utc_offsets = zip(*rows)
+                self._timestamps[:size] = timestamps
+                self._mg_dl[:size] = mg_dl
+                self._trends[:size] = [DEXCOM_TREND_DIRECTIONS[trend] for trend in trends]
+                self._utc_offsets[:size] = utc_offsets
+
+    # another account's readings must neither be served nor have the new account's merged into them
+    def clear(self) -> None:
+        with self._lock:
+            self._start = 0
+            self._size = 0
+            if self._closed:
+                return
+            with self._database:
+                _ = self._database.execute("DELETE FROM readings")
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._database.close()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def newest_timestamp(self) -> datetime | None:
+        with self._lock:
+            if self._size == 0:
+                return None
+            return datetime.fromtimestamp(int(self._timestamps[self._index(self._size - 1)]) / 1000, tz=timezone.utc)
+
+    def latest_reading(self) -> GlucoseReading | None:
+        with self._lock:
+            if self._size == 0:
+                return None
+            index: int = self._index(self._size - 1)
+            return create_glucose_reading(
+                timestamp=int(self._timestamps[index]), mg_dl=int(self._mg_dl[index]),
+                trend=TREND_DIRECTIONS[self._trends[index]], utc_offset=int(self._utc_offsets[index]))
+
+    # only asks dexcom share for the readings newer than the newest one already stored
+    def sync(self, dexcom: DexcomClient) -> list[GlucoseReading]:
+        newest: datetime | None = self.newest_timestamp
+        minutes: int = MAX_MINUTES
+        if newest is not None:
+            elapsed: float = (datetime.now(tz=timezone.utc) - newest).total_seconds() / 60
+            minutes = max(1, min(MAX_MINUTES, math.ceil(elapsed) + 1))
+        max_count: int = max(1, min(MAX_MAX_COUNT, minutes // 5 + 1))
+
+        readings: list[GlucoseReading] = dexcom.get_glucose_readings(minutes=minutes, max_count=max_count)
+        new_readings: list[GlucoseReading] = sorted(
+            (reading for reading in readings if newest is None or reading.datetime > newest),
+            key=lambda reading: reading.datetime)
+        if len(new_readings) > 0:
+            self.extend(new_readings)
+        return new_readings
+
+    def extend(self, readings: list[GlucoseReading]) -> None:
+        rows: list[tuple[int, int, str, int]] = []
+        for reading in readings:
+            offset: timedelta | None = reading.datetime.utcoffset()
+            rows.append((
+                int(reading.datetime.timestamp() * 1000),
+                reading.mg_dl,
+                reading.trend_direction,
+                int(offset.total_seconds() // 60) if offset is not None else 0,
+            ))
+
+        with self._lock:
+            for timestamp, mg_dl, trend, utc_offset in rows:
+                self._append(timestamp=timestamp, mg_dl=mg_dl, trend=DEXCOM_TREND_DIRECTIONS[trend], utc_offset=utc_offset)
+            if self._closed:
+                return
+            cutoff: int = int(self._timestamps[self._index(0)])
+            with self._database:
+                _ = self._database.executemany("INSERT OR REPLACE INTO readings VALUES (?, ?, ?, ?)", rows)
+                _ = self._database.execute("DELETE FROM readings WHERE timestamp < ?", (cutoff,))
+
+    # (epoch milliseconds, mg/dL) columns for every reading since the given time, oldest first, as copies
+    def window(self, since: datetime) -> tuple[np.ndarray, np.ndarray]:
+        since_timestamp: int = int(since.timestamp() * 1000)
+        with self._lock:
+            first: int = self._bisect(since_timestamp)
+            return self._slice(self._timestamps, first), self._slice(self._mg_dl, first)
+
+    def tzinfo(self) -> tzinfo:
+        reading: GlucoseReading | None = self.latest_reading()
+        return reading.datetime.tzinfo if reading is not None and reading.datetime.tzinfo is not None else timezone.utc
+
+    def _index(self, position: int) -> int:
+        return (self._start + position) % self._capacity
+
+    def _append(self, timestamp: int, mg_dl: int, trend: int, utc_offset: int) -> None:
+        index: int = self._index(self._size)
+        if self._size == self._capacity:
+            self._start = (self._start + 1) % self._capacity
+        else:
+            self._size += 1
+        self._timestamps[index] = timestamp
+        self._mg_dl[index] = mg_dl
+        self._trends[index] = trend
+        self._utc_offsets[index] = utc_offset
+
+    # position of the first reading at or after the timestamp
+    def _bisect(self, timestamp: int) -> int:
+        # the ring is two sorted runs, the older one from self._start to the end of the buffer
+        end: int = self._start + self._size
+        if end <= self._capacity:
+            return int(np.searchsorted(self._timestamps[self._start:end], timestamp))
+        older: np.ndarray = self._timestamps[self._start:]
+        position: int = int(np.searchsorted(older, timestamp))
+        if position < len(older):
+            return position
+        return len(older) + int(np.searchsorted(self._timestamps[:end - self._capacity], timestamp))
+
+    def _slice(self, column: np.ndarray, first: int) -> np.ndarray:
+        begin: int = self._index(first)
+        end: int = self._start + self._size
+        if first >= self._size:
+            return column[0:0].copy()
+        if end <= self._capacity or begin < self._start:
+            return column[begin:self._index(self._size - 1) + 1].copy()
+        return np.concatenate((column[begin:], column[:end - self._capacity]))
+
+
+def create_glucose_reading(timestamp: int, mg_dl: int, trend: str, utc_offset: int) -> GlucoseReading:
+    sign: str = '-' if utc_offset < 0 else '+'
+    hours, minutes = divmod(abs(utc_offset), 60)
+    return GlucoseReading({
+        "WT": f"Date({timestamp})",
+        "ST": f"Date({timestamp})",
+        "DT": f"Date({timestamp}{sign}{hours:02d}{minutes:02d})",
+        "Value": mg_dl,
+        "Trend": trend,
+    })
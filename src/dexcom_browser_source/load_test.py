@@ -0,0 +1,223 @@
+import http.client
+import json
+import random
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from waitress.server import BaseWSGIServer, MultiSocketServer
+
+from dexcom_browser_source.config import AppConfig
+from dexcom_browser_source.fake_share import FakeShareServer
+from dexcom_browser_source.server import create_app, create_waitress_server, shutdown_app, stop_waitress_server
+from dexcom_browser_source.server_settings import ServerSettings
+
+# simulated obs browser sources, the way benchmarks/bench_server.py drives the server, shared by it and the self-test
+
+# the sizes obs browser sources are commonly set to, each client renders the chart at one of them
+CLIENT_CHART_SIZES: list[tuple[int, int]] = [(640, 480), (800, 600), (1280, 720)]
+# the self-test's load, the benchmark's default polling clients plus browser docks listening on /api/stream
+SELF_TEST_CLIENTS: int = 16
+SELF_TEST_STREAM_CLIENTS: int = 4
+SELF_TEST_DURATION: float = 20.0
+# what a browser source waits between polls. the pages poll once a minute, this is a source refreshed every few
+# seconds on top, so the test sees several rounds per client and its verdict is about real traffic, not a flood
+SELF_TEST_THINK_TIME: float = 5.0
+SELF_TEST_READY_TIMEOUT: float = 60.0
+# how often the self-test looks at waitress' task queue
+SELF_TEST_SAMPLE_INTERVAL: float = 0.01
+# every thread busy with requests left waiting in more than this share of the samples means the threads are saturated
+SELF_TEST_QUEUED_LIMIT: float = 0.05
+
+
+# url_prefix is an account's, e.g. /u/<name>, the route names stay the same so results add up across accounts
+def routes(hours: int, app_config: AppConfig, url_prefix: str = "") -> dict[str, str]:
+    # flask redirects /api/last/<hours> to /api/last when hours is the configured default
+    last: str = "/api/last" if hours == app_config.config['graph']['last_hours'] else f"/api/last/{hours}"
+    return {
+        "/api/current": f"{url_prefix}/api/current",
+        "/api/current/mg_dl": f"{url_prefix}/api/current/mg_dl",
+        "/api/current/mmol_l": f"{url_prefix}/api/current/mmol_l",
+        "/api/current/trend_arrow": f"{url_prefix}/api/current/trend_arrow",
+        "/api/last/<hours>": url_prefix + last + "?width={width}&height={height}",
+        "/api/last/<hours>.png": f"{url_prefix}/api/last/{hours}.png?width={{width}}&height={{height}}",
+        "/api/overlay": url_prefix + "/api/overlay?width={width}&height={height}",
+        "/glucose": f"{url_prefix}/glucose",
+        "/chart": f"{url_prefix}/chart",
+    }
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered: list[float] = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# one obs browser source: a keep-alive connection that revalidates what it already has, the way chromium does.
+# without a think time it polls back to back, which is what the benchmark wants to find the server's ceiling
+class SimulatedClient(threading.Thread):
+    def __init__(self, port: int, routes: dict[str, str], chart_size: tuple[int, int], deadline: float,
+                 think_time: float = 0.0):
+        super().__init__(daemon=True)
+        self._port: int = port
+        self._routes: dict[str, str] = routes
+        self._chart_size: tuple[int, int] = chart_size
+        self._deadline: float = deadline
+        self._think_time: float = think_time
+        self._etags: dict[str, str] = {}
+        self.latencies: dict[str, list[float]] = {name: [] for name in routes}
+        self.statuses: dict[str, dict[int, int]] = {name: {} for name in routes}
+
+    def run(self) -> None:
+        connection: http.client.HTTPConnection = http.client.HTTPConnection("127.0.0.1", self._port, timeout=30)
+        width, height = self._chart_size
+        # sources are not opened in lockstep, the first round is spread over one think time
+        time.sleep(random.uniform(0.0, self._think_time))
+        while time.perf_counter() < self._deadline:
+            for name, route in self._routes.items():
+                # a saturated server answers slowly, the round is not finished past the deadline
+                if time.perf_counter() >= self._deadline:
+                    break
+                path: str = route.format(width=width, height=height)
+                headers: dict[str, str] = {"If-None-Match": self._etags[path]} if path in self._etags else {}
+                started: float = time.perf_counter()
+                try:
+                    connection.request("GET", path, headers=headers)
+                    response: http.client.HTTPResponse = connection.getresponse()
+                    _ = response.read()
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    connection = http.client.HTTPConnection("127.0.0.1", self._port, timeout=30)
+                    self.statuses[name][0] = self.statuses[name].get(0, 0) + 1
+                    continue
+                self.latencies[name].append(time.perf_counter() - started)
+                self.statuses[name][response.status] = self.statuses[name].get(response.status, 0) + 1
+                etag: str | None = response.getheader("ETag")
+                if etag is not None:
+                    self._etags[path] = etag
+            time.sleep(max(0.0, min(self._think_time, self._deadline - time.perf_counter())))
+        connection.close()
+
+
+# a browser dock on /api/stream, which keeps one waitress thread busy for as long as it is connected
+class StreamClient(threading.Thread):
+    def __init__(self, port: int):
+        super().__init__(daemon=True)
+        self._port: int = port
+        self.connected: bool = False
+
+    def run(self) -> None:
+        connection: http.client.HTTPConnection = http.client.HTTPConnection("127.0.0.1", self._port, timeout=SELF_TEST_READY_TIMEOUT)
+        try:
+            connection.request("GET", "/api/stream")
+            response: http.client.HTTPResponse = connection.getresponse()
+            self.connected = response.status == 200
+            # until the server ends the stream when it stops
+            while response.fp is not None and response.fp.readline():
+                pass
+        except (OSError, http.client.HTTPException):
+            pass
+        finally:
+            connection.close()
+
+
+def get_json(port: int, path: str) -> dict[str, object]:
+    connection: http.client.HTTPConnection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request("GET", path)
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+
+def wait_until_serving(port: int, timeout: float) -> None:
+    deadline: float = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            connection: http.client.HTTPConnection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/api/current")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("the server did not serve a reading in time")
+
+
+# runs browser sources polling with a think time against a server with the given settings, on a free local port next to the real one
+# and against a fake dexcom share, and reports whether its threads kept up
+def self_test(server_settings: ServerSettings, clients: int = SELF_TEST_CLIENTS, stream_clients: int = SELF_TEST_STREAM_CLIENTS,
+              duration: float = SELF_TEST_DURATION, think_time: float = SELF_TEST_THINK_TIME) -> dict[str, object]:
+    share: FakeShareServer = FakeShareServer()
+    share.start()
+    with tempfile.TemporaryDirectory() as config_path:
+        app_config: AppConfig = AppConfig(custom_config_path=Path(config_path))
+        app_config.config['dexcom']['account'] = {"username": "self-test", "password": "self-test"}
+        app_config.config['dexcom']['share_url'] = share.url
+
+        app = create_app(app_config=app_config)
+        waitress_server: MultiSocketServer | BaseWSGIServer = create_waitress_server(
+            app=app, **{**server_settings.waitress_options(), "listen": "127.0.0.1:0"})
+        port: int = waitress_server.effective_port
+        server_thread: threading.Thread = threading.Thread(target=waitress_server.run, daemon=True)
+        server_thread.start()
+        samples: list[tuple[int, int]] = []
+        try:
+            wait_until_serving(port=port, timeout=SELF_TEST_READY_TIMEOUT)
+            streams: list[StreamClient] = [StreamClient(port=port) for _ in range(stream_clients)]
+            for stream in streams:
+                stream.start()
+
+            client_routes: dict[str, str] = routes(hours=int(app_config.config['graph']['last_hours']), app_config=app_config)
+            deadline: float = time.perf_counter() + duration
+            pollers: list[SimulatedClient] = [
+                SimulatedClient(port=port, routes=client_routes, chart_size=CLIENT_CHART_SIZES[index % len(CLIENT_CHART_SIZES)], deadline=deadline,
+                              think_time=think_time)
+                for index in range(clients)]
+            started: float = time.perf_counter()
+            for client in pollers:
+                client.start()
+            task_dispatcher = waitress_server.task_dispatcher
+            while time.perf_counter() < deadline:
+                samples.append((len(task_dispatcher.queue), task_dispatcher.active_count))
+                time.sleep(SELF_TEST_SAMPLE_INTERVAL)
+            for client in pollers:
+                client.join()
+            elapsed: float = time.perf_counter() - started
+        finally:
+            _ = stop_waitress_server(app=app, waitress_server=waitress_server, loop_thread=server_thread, timeout=5.0)
+            shutdown_app(app)
+            share.stop()
+
+    latencies: list[float] = [latency for client in pollers for route in client.latencies.values() for latency in route]
+    failed: int = sum(count for client in pollers for route in client.statuses.values()
+                      for status, count in route.items() if status == 0 or status >= 500)
+    # a request is queued for a moment even while threads are free, it only counts once all of them are busy
+    queued_fraction: float = sum(1 for queued, active in samples if queued > 0 and active >= server_settings.threads) / max(len(samples), 1)
+    return {
+        "threads": server_settings.threads,
+        "connection_limit": server_settings.connection_limit,
+        "clients": clients,
+        "stream_clients": stream_clients,
+        "think_time_s": think_time,
+        "streams_connected": sum(1 for stream in streams if stream.connected),
+        "duration_s": elapsed,
+        "requests": len(latencies),
+        "failed_requests": failed,
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else None,
+        "max_active_threads": max((active for _, active in samples), default=0),
+        "max_queued_requests": max((queued for queued, _ in samples), default=0),
+        "queued_percent": round(queued_fraction * 100, 1),
+        "saturated": failed > 0 or queued_fraction > SELF_TEST_QUEUED_LIMIT,
+    }
+
+
+def format_self_test(results: dict[str, object]) -> str:
+    verdict: str = "saturated, more threads are needed" if results["saturated"] else "keeps up"
+    p99: str = f"{results['p99_ms']:.1f} ms" if results["p99_ms"] is not None else "n/a"
+    return (f"{results['threads']} threads {verdict} with {results['clients']} browser sources and "
+            f"{results['stream_clients']} streams polling every {results['think_time_s']:g} s: {results['throughput_rps']:.0f} requests/s, p99 {p99}, "
+            f"all threads busy with requests waiting {results['queued_percent']}% of the time, {results['failed_requests']} failed")
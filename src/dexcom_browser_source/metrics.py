@@ -0,0 +1,131 @@
+import bisect
+import math
+import threading
+
+# seconds, from a cached fragment up to a dexcom share request that runs into its timeout
+LATENCY_BUCKETS: tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_PREFIX: str = "dexcom_browser_source_"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self._buckets: tuple[float, ...] = buckets
+        self._lock: threading.Lock = threading.Lock()
+        # one count per bucket plus +Inf, not cumulative until exposed
+        self._counts: list[int] = [0] * (len(buckets) + 1)
+        self._sum: float = 0.0
+        self._count: int = 0
+
+    def observe(self, value: float) -> None:
+        index: int = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    # upper bound of the bucket the quantile falls in, good enough to tell 5 ms from 500 ms
+    def quantile(self, quantile: float) -> float | None:
+        with self._lock:
+            if self._count == 0:
+                return None
+            rank: float = quantile * self._count
+            seen: int = 0
+            for bound, count in zip((*self._buckets, math.inf), self._counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+        return math.inf
+
+    def cumulative(self) -> tuple[list[tuple[float, int]], float, int]:
+        with self._lock:
+            counts: list[int] = list(self._counts)
+            total: float = self._sum
+            count: int = self._count
+        buckets: list[tuple[float, int]] = []
+        seen: int = 0
+        for bound, bucket_count in zip((*self._buckets, math.inf), counts):
+            seen += bucket_count
+            buckets.append((bound, seen))
+        return buckets, total, count
+
+
+# request counts and latencies per flask url rule, not per path, so /api/last/<hours> is one series
+class RequestMetrics:
+    def __init__(self):
+        self._lock: threading.Lock = threading.Lock()
+        self._latencies: dict[str, Histogram] = {}
+        self._counts: dict[tuple[str, int], int] = {}
+        self.all_routes: Histogram = Histogram()
+
+    def observe(self, route: str, status: int, seconds: float) -> None:
+        with self._lock:
+            histogram: Histogram | None = self._latencies.get(route)
+            if histogram is None:
+                histogram = self._latencies[route] = Histogram()
+            self._counts[(route, status)] = self._counts.get((route, status), 0) + 1
+        histogram.observe(seconds)
+        self.all_routes.observe(seconds)
+
+    def latencies(self) -> dict[str, Histogram]:
+        with self._lock:
+            return dict(self._latencies)
+
+    def counts(self) -> dict[tuple[str, int], int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(f"{name}=\"{escape_label(value)}\"" for name, value in labels.items()) + "}"
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# prometheus text exposition format, version 0.0.4
+class MetricsWriter:
+    def __init__(self):
+        self._lines: list[str] = []
+
+    def _header(self, name: str, help_text: str, metric_type: str) -> None:
+        self._lines.append(f"# HELP {METRIC_PREFIX}{name} {help_text}")
+        self._lines.append(f"# TYPE {METRIC_PREFIX}{name} {metric_type}")
+
+    def counter(self, name: str, help_text: str, samples: list[tuple[dict[str, str], float]]) -> None:
+        self._header(name=name, help_text=help_text, metric_type="counter")
+        for labels, value in samples:
+            self._lines.append(f"{METRIC_PREFIX}{name}{format_labels(labels)} {format_value(value)}")
+
+    def gauge(self, name: str, help_text: str, samples: list[tuple[dict[str, str], float]]) -> None:
+        self._header(name=name, help_text=help_text, metric_type="gauge")
+        for labels, value in samples:
+            self._lines.append(f"{METRIC_PREFIX}{name}{format_labels(labels)} {format_value(value)}")
+
+    def histogram(self, name: str, help_text: str, samples: list[tuple[dict[str, str], Histogram]]) -> None:
+        self._header(name=name, help_text=help_text, metric_type="histogram")
+        for labels, histogram in samples:
+            buckets, total, count = histogram.cumulative()
+            for bound, seen in buckets:
+                self._lines.append(f"{METRIC_PREFIX}{name}_bucket{format_labels({**labels, 'le': format_value(bound)})} {seen}")
+            self._lines.append(f"{METRIC_PREFIX}{name}_sum{format_labels(labels)} {format_value(total)}")
+            self._lines.append(f"{METRIC_PREFIX}{name}_count{format_labels(labels)} {count}")
+
+    def text(self) -> str:
+        return "\n".join(self._lines) + "\n"
@@ -0,0 +1,649 @@
+import hashlib
+import html
+import math
+import threading
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from flask import Blueprint, Flask, Response, g, make_response, redirect, request, url_for
+from pydexcom.glucose_reading import GlucoseReading
+from flask.views import ft
+from waitress import wasyncore
+from waitress.server import BaseWSGIServer, MultiSocketServer, create_server
+
+from dexcom_browser_source.accounts import DEFAULT_ACCOUNT
+from dexcom_browser_source.chart import CHART_CONFIG_KEYS, CHART_DEFAULT_DPI, CHART_DEFAULT_HEIGHT, CHART_DEFAULT_WIDTH, CHART_MIMETYPES, ChartCache, ChartRenderTimeout, ChartCacheBudget, ChartRenderPool, ChartSpec, ChartStyle
+from dexcom_browser_source.config import AppConfig, touches
+from dexcom_browser_source.context import AccountContext, ServerContext
+from dexcom_browser_source.dexcom_client import DexcomClient
+from dexcom_browser_source.glucose_poller import GlucosePoller
+from dexcom_browser_source.history import HISTORY_RETENTION, ReadingHistory
+from dexcom_browser_source.metrics import MetricsWriter, RequestMetrics
+from dexcom_browser_source.server_settings import SERVER_DEFAULT_THREADS
+from dexcom_browser_source.stats import StatsThresholds, glucose_ranges, glucose_stats
+from dexcom_browser_source.stream import ReadingStream
+
+# how long a request may wait for the poller's first fetch after the server starts
+POLLER_READY_TIMEOUT: float = 10.0
+# two weeks is the usual window for an ambulatory glucose profile
+AGP_DEFAULT_DAYS: int = 14
+# the config keys the value fragments are rendered from, besides the chart's
+FRAGMENT_CONFIG_KEYS: tuple[str, ...] = ("app.metric", "dexcom.severe_hypoglycemia_level", "dexcom.hypoglycemia_level", "dexcom.hyperglycemia_level")
+# how often stop_waitress_server checks whether the requests in flight have finished
+SHUTDOWN_POLL_INTERVAL: float = 0.01
+# how soon a browser should ask again for a chart whose render timed out
+CHART_RETRY_AFTER_SECONDS: int = 5
+# the pages every account gets, see StaticBlueprint
+STATIC_PAGES: tuple[str, ...] = ("glucose", "chart", "agp")
+
+
+# one per account, the default account's at /api and the others' at /u/<name>/api
+class DexcomAPIBlueprint(Blueprint):
+    def __init__(self, app_config: AppConfig, glucose_poller: GlucosePoller, reading_stream: ReadingStream,
+                 chart_render_pool: ChartRenderPool, chart_cache: ChartCache, chart_cache_budget: ChartCacheBudget | None = None,
+                 name: str = "dexcomapi", url_prefix: str = "/api") -> None:
+        super().__init__(name=name, import_name=__name__, url_prefix=url_prefix)
+        self._app_config: AppConfig = app_config
+        self._glucose_poller: GlucosePoller = glucose_poller
+        self._history: ReadingHistory = glucose_poller.history
+        self._reading_stream: ReadingStream = reading_stream
+        self._chart_cache: ChartCache = chart_cache
+        self._chart_cache_budget: ChartCacheBudget | None = chart_cache_budget
+        self._chart_render_pool: ChartRenderPool = chart_render_pool
+        self._glucose_poller.add_listener(self.publish_glucose_reading)
+        self._glucose_poller.add_status_listener(self.publish_status)
+        self._app_config.add_change_listener(self.on_config_changed)
+
+        self.add_url_rule(rule='/current/trend_arrow', view_func=self.serve_current_glucose_reading_trend_arrow)
+        self.add_url_rule(rule='/current/mg_dl', view_func=self.serve_current_glucose_reading_mg_dl)
+        self.add_url_rule(rule='/current/mmol_l', view_func=self.serve_current_glucose_reading_mmol_l)
+        self.add_url_rule(rule='/current', view_func=self.serve_current_glucose_reading)
+        self.add_url_rule(rule='/last/<int:hours>.<any(png, svg):image_format>', view_func=self.serve_last_readings_image)
+        self.add_url_rule(rule='/last/<int:hours>', view_func=self.serve_last_readings_graph)
+        self.add_url_rule(rule='/last', view_func=self.serve_last_readings_graph, defaults={"hours": self._app_config.config['graph']['last_hours']})
+        self.add_url_rule(rule='/agp/<int:days>.<any(png, svg):image_format>', view_func=self.serve_agp_image)
+        self.add_url_rule(rule='/agp/<int:days>', view_func=self.serve_agp_graph)
+        self.add_url_rule(rule='/agp', view_func=self.serve_agp_graph, defaults={"days": AGP_DEFAULT_DAYS})
+        self.add_url_rule(rule='/overlay', view_func=self.serve_overlay)
+        self.add_url_rule(rule='/stats/<int:hours>', view_func=self.serve_stats)
+        self.add_url_rule(rule='/stats', view_func=self.serve_stats, defaults={"hours": self._app_config.config['graph']['last_hours']})
+        self.add_url_rule(rule='/cache', view_func=self.serve_cache_stats)
+        self.add_url_rule(rule='/renderer', view_func=self.serve_renderer_stats)
+        self.add_url_rule(rule='/upstream', view_func=self.serve_upstream_stats)
+        self.add_url_rule(rule='/stream', view_func=self.serve_stream)
+
+    # while dexcom share is failing the last known good reading is served, marked stale, instead of nothing
+    def current_glucose_reading(self) -> GlucoseReading | None:
+        _ = self._glucose_poller.wait_ready(timeout=POLLER_READY_TIMEOUT)
+        if self._glucose_poller.stale:
+            return self._glucose_poller.latest_reading
+        return self._glucose_poller.current_reading
+
+    def stale_attribute(self) -> str:
+        return ' class="stale"' if self._glucose_poller.stale else ''
+
+    def serve_current_glucose_reading(self) -> ft.ResponseReturnValue:
+        if self._app_config.config['app']['metric']:
+            return self.serve_current_glucose_reading_mmol_l()
+        else:
+            return self.serve_current_glucose_reading_mg_dl()
+
+    def serve_current_glucose_reading_mg_dl(self) -> ft.ResponseReturnValue:
+        glucose_reading: GlucoseReading | None = self.current_glucose_reading()
+        if glucose_reading is None:
+            return '--', 404
+        return conditional_response(
+            etag_parts=('mg_dl', glucose_reading.datetime, self._glucose_poller.stale),
+            last_modified=glucose_reading.datetime,
+            render=lambda: (f'<span{self.stale_attribute()} hx-get="{url_for(".serve_current_glucose_reading")}" hx-trigger="load delay:1m" hx-swap="outerHTML">{glucose_reading.mg_dl}</span>', 200))
+
+    def serve_current_glucose_reading_mmol_l(self) -> ft.ResponseReturnValue:
+        glucose_reading: GlucoseReading | None = self.current_glucose_reading()
+        if glucose_reading is None:
+            return '--', 404
+        return conditional_response(
+            etag_parts=('mmol_l', glucose_reading.datetime, self._glucose_poller.stale),
+            last_modified=glucose_reading.datetime,
+            render=lambda: (f'<span{self.stale_attribute()} hx-get="{url_for(".serve_current_glucose_reading")}" hx-trigger="load delay:1m" hx-swap="outerHTML">{glucose_reading.mmol_l}</span>', 200))
+
+    def serve_current_glucose_reading_trend_arrow(self) -> ft.ResponseReturnValue:
+        glucose_reading: GlucoseReading | None = self.current_glucose_reading()
+        if glucose_reading is None:
+            return '--', 404
+        return conditional_response(
+            etag_parts=('trend_arrow', glucose_reading.datetime, self._glucose_poller.stale),
+            last_modified=glucose_reading.datetime,
+            render=lambda: (f'<span{self.stale_attribute()} hx-get="{url_for(".serve_current_glucose_reading_trend_arrow")}" hx-trigger="load delay:1m" hx-swap="outerHTML">{glucose_reading.trend_arrow}</span>', 200))
+
+    def serve_last_readings_graph(self, hours: int, view: str = 'line') -> ft.ResponseReturnValue:
+        _ = self._glucose_poller.wait_ready(timeout=POLLER_READY_TIMEOUT)
+        newest_reading: GlucoseReading | None = self._glucose_poller.latest_reading
+        chart_spec: ChartSpec | None = requested_chart_spec(hours=hours, image_format='png', view=view)
+        if chart_spec is None:
+            return 'invalid chart size', 400
+        if newest_reading is None:
+            return '--', 404
+
+        # built from the validated arguments rather than echoing the request's query string into the page
+        refresh_url: str = url_for(request.endpoint, **request.view_args, width=chart_spec.width, height=chart_spec.height, dpi=chart_spec.dpi)
+        return conditional_response(
+            etag_parts=('last', request.path, self._glucose_poller.stale, *self.chart_etag_parts(chart_spec=chart_spec, newest_reading=newest_reading)),
+            last_modified=newest_reading.datetime,
+            render=lambda: (self.chart_image_tag(chart_spec=chart_spec, newest_reading=newest_reading,
+                                                 attributes=f'hx-get="{html.escape(refresh_url)}" hx-trigger="load delay:1m" hx-swap="outerHTML"{self.stale_attribute()}'), 200))
+
+    def serve_last_readings_image(self, hours: int, image_format: str, view: str = 'line') -> ft.ResponseReturnValue:
+        _ = self._glucose_poller.wait_ready(timeout=POLLER_READY_TIMEOUT)
+        newest_reading: GlucoseReading | None = self._glucose_poller.latest_reading
+        chart_spec: ChartSpec | None = requested_chart_spec(hours=hours, image_format=image_format, view=view)
+        if chart_spec is None:
+            return 'invalid chart size', 400
+        if newest_reading is None:
+            return '--', 404
+
+        etag_parts: tuple[object, ...] = self.chart_etag_parts(chart_spec=chart_spec, newest_reading=newest_reading)
+
+        def render() -> ft.ResponseReturnValue:
+            try:
+                chart: bytes | None = self.last_readings_graph(chart_spec=chart_spec)
+            except ChartRenderTimeout as e:
+                # the stuck render process is already being replaced, the browser's next request renders again
+                return str(e), 503, {'Retry-After': str(CHART_RETRY_AFTER_SECONDS)}
+            if chart is None:
+                return '--', 404
+            return Response(response=chart, mimetype=CHART_MIMETYPES[chart_spec.image_format])
+
+        response: Response = conditional_response(etag_parts=etag_parts, last_modified=newest_reading.datetime, render=render)
+        # a url carrying the current version never changes, so the browser can keep it without asking again
+        if request.args.get('v') == etag_for(etag_parts=etag_parts) and response.status_code in (200, 304):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = 86400
+            response.cache_control.immutable = True
+        return response
+
+    # the last days folded onto a single day as percentile bands
+    def serve_agp_graph(self, days: int) -> ft.ResponseReturnValue:
+        return self.serve_last_readings_graph(hours=days * 24, view='agp')
+
+    def serve_agp_image(self, days: int, image_format: str) -> ft.ResponseReturnValue:
+        return self.serve_last_readings_image(hours=days * 24, image_format=image_format, view='agp')
+
+    # only the settings the chart is drawn with, so other config changes leave cached charts and browser copies valid
+    def chart_etag_parts(self, chart_spec: ChartSpec, newest_reading: GlucoseReading) -> tuple[object, ...]:
+        return (*chart_spec, newest_reading.datetime, *ChartStyle.from_config(app_config=self._app_config))
+
+    # the image endpoint, versioned so browsers only fetch it again once it changes. built from the url prefix rather
+    # than url_for, stream events are made on a poller thread outside of any request
+    def chart_image_url(self, chart_spec: ChartSpec, newest_reading: GlucoseReading) -> str:
+        version: str = etag_for(etag_parts=self.chart_etag_parts(chart_spec=chart_spec, newest_reading=newest_reading))
+        path: str = f'{self.url_prefix}/agp/{chart_spec.hours // 24}' if chart_spec.view == 'agp' else f'{self.url_prefix}/last/{chart_spec.hours}'
+        return f'{path}.{chart_spec.image_format}?{chart_spec.size_query()}&v={version}'
+
+    def chart_image_tag(self, chart_spec: ChartSpec, newest_reading: GlucoseReading, attributes: str = '') -> str:
+        return (f'<img src="{self.chart_image_url(chart_spec=chart_spec, newest_reading=newest_reading)}" '
+                f'width="{chart_spec.width}" height="{chart_spec.height}" {attributes}/>')
+
+    # everything an overlay shows in one response built from one reading, so the pieces can never disagree.
+    # htmx gets out of band swaps for #glucose, #trend_arrow and #chart, ?format=json gets the same snapshot as json
+    def serve_overlay(self) -> ft.ResponseReturnValue:
+        _ = self._glucose_poller.wait_ready(timeout=POLLER_READY_TIMEOUT)
+        stale: bool = self._glucose_poller.stale
+        reading: GlucoseReading | None = self._glucose_poller.latest_reading if stale else self._glucose_poller.current_reading
+        parts: frozenset[str] = frozenset(request.args.get('parts', 'glucose,trend_arrow,chart').split(','))
+        hours: int = request.args.get('hours', default=int(self._app_config.config['graph']['last_hours']), type=int)
+        chart_spec: ChartSpec | None = requested_chart_spec(hours=hours, image_format='png')
+        if chart_spec is None:
+            return 'invalid chart size', 400
+        if reading is None:
+            return '--', 404
+
+        as_json: bool = request.args.get('format') == 'json' or request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+        snapshot: dict[str, object] = self.overlay_snapshot(reading=reading, stale=stale, parts=parts, chart_spec=chart_spec)
+        response: Response = conditional_response(
+            # the age is part of the snapshot, so a new minute is a new version even without a new reading. json and
+            # html of the same snapshot are different representations and get different etags
+            etag_parts=('overlay', 'json' if as_json else 'html', tuple(sorted(parts)), stale, snapshot['age_seconds'] // 60, snapshot['range'],
+                        *self.chart_etag_parts(chart_spec=chart_spec, newest_reading=reading)),
+            last_modified=reading.datetime,
+            render=lambda: (snapshot, 200) if as_json else (self.overlay_fragment(snapshot=snapshot, parts=parts), 200))
+        # the representation follows the accept header, caches must not hand the html to a client asking for json
+        response.vary.add('Accept')
+        return response
+
+    def overlay_snapshot(self, reading: GlucoseReading, stale: bool, parts: frozenset[str], chart_spec: ChartSpec) -> dict[str, object]:
+        metric: bool = bool(self._app_config.config['app']['metric'])
+        snapshot: dict[str, object] = {
+            "value": reading.mmol_l if metric else reading.mg_dl,
+            "units": "mmol/L" if metric else "mg/dL",
+            "mg_dl": reading.mg_dl,
+            "trend_arrow": reading.trend_arrow,
+            "trend_direction": reading.trend_direction,
+            "timestamp": reading.datetime.isoformat(),
+            "age_seconds": int((datetime.now(tz=timezone.utc) - reading.datetime).total_seconds()),
+            "range": glucose_range(mg_dl=reading.mg_dl, app_config=self._app_config),
+            "stale": stale,
+        }
+        if 'chart' in parts:
+            snapshot["chart"] = {
+                "url": self.chart_image_url(chart_spec=chart_spec, newest_reading=reading),
+                "width": chart_spec.width,
+                "height": chart_spec.height,
+            }
+        return snapshot
+
+    def overlay_fragment(self, snapshot: dict[str, object], parts: frozenset[str]) -> str:
+        classes: str = f"{snapshot['range']} stale" if snapshot['stale'] else str(snapshot['range'])
+        fragment: list[str] = []
+        if 'glucose' in parts:
+            fragment.append(f'<span id="glucose" class="{classes}" hx-swap-oob="true">{snapshot["value"]}</span>')
+        if 'trend_arrow' in parts:
+            fragment.append(f'<span id="trend_arrow" class="{classes}" hx-swap-oob="true">{snapshot["trend_arrow"]}</span>')
+        if 'chart' in parts:
+            chart: dict[str, object] = snapshot['chart']
+            stale_class: str = ' class="stale"' if snapshot['stale'] else ''
+            fragment.append(f'<img id="chart" src="{chart["url"]}" width="{chart["width"]}" height="{chart["height"]}"{stale_class} hx-swap-oob="true"/>')
+        return "\n".join(fragment)
+
+    # recomputed from the history on every new reading, a few milliseconds even for all 90 days
+    def serve_stats(self, hours: int) -> ft.ResponseReturnValue:
+        _ = self._glucose_poller.wait_ready(timeout=POLLER_READY_TIMEOUT)
+        if not 0 < hours <= HISTORY_RETENTION / timedelta(hours=1):
+            return 'invalid hours', 400
+        newest_reading: GlucoseReading | None = self._glucose_poller.latest_reading
+        if newest_reading is None:
+            return '--', 404
+
+        def render() -> ft.ResponseReturnValue:
+            timestamps, mg_dl = self._history.window(since=datetime.now(tz=timezone.utc) - timedelta(hours=hours))
+            return glucose_stats(timestamps=timestamps, mg_dl=mg_dl, thresholds=StatsThresholds.from_config(app_config=self._app_config), hours=hours), 200
+
+        return conditional_response(
+            etag_parts=('stats', hours, newest_reading.datetime, *StatsThresholds.from_config(app_config=self._app_config)),
+            last_modified=newest_reading.datetime,
+            render=render)
+
+    def serve_cache_stats(self) -> ft.ResponseReturnValue:
+        stats: dict[str, object] = {"chart": self._chart_cache.stats()}
+        if self._chart_cache_budget is not None:
+            stats["all_accounts"] = self._chart_cache_budget.stats()
+        return stats, 200
+
+    def serve_renderer_stats(self) -> ft.ResponseReturnValue:
+        return self._chart_render_pool.stats(), 200
+
+    def serve_upstream_stats(self) -> ft.ResponseReturnValue:
+        dexcom: DexcomClient = self._glucose_poller.dexcom
+        return {
+            "healthy": dexcom.healthy,
+            "circuit_open": dexcom.circuit_open,
+            "retry_in": round(dexcom.retry_in(), 1),
+            "calls": dexcom.calls,
+            "errors": dexcom.errors,
+            "last_error": dexcom.last_error,
+        }, 200
+
+    def serve_stream(self) -> ft.ResponseReturnValue:
+        reading: GlucoseReading | None = self.current_glucose_reading()
+        # only the pieces a page asks for are sent, e.g. /api/stream?events=glucose,trend_arrow
+        events: frozenset[str] = frozenset(request.args.get('events', 'glucose,trend_arrow,chart').split(','))
+        # every client learns whether what it is about to show is stale, then hears about each change
+        initial_events: list[tuple[str, str]] = [('status', self.status())]
+        if reading is not None:
+            initial_events.extend(self.stream_events(reading=reading, events=events))
+        return Response(
+            response=self._reading_stream.subscribe(events=events | {'status'}, initial_events=initial_events),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+
+    def publish_glucose_reading(self, reading: GlucoseReading) -> None:
+        for event, data in self.stream_events(reading=reading, events=frozenset({'glucose', 'trend_arrow', 'chart'})):
+            self._reading_stream.publish(event=event, data=data)
+
+    # the poller is shared with the apps created after this one, which register their own listeners
+    def detach(self) -> None:
+        self._glucose_poller.remove_listener(self.publish_glucose_reading)
+        self._glucose_poller.remove_status_listener(self.publish_status)
+        self._app_config.remove_change_listener(self.on_config_changed)
+
+    # pages on /api/stream show new units, ranges or chart colors straight away rather than with the next reading.
+    # polling pages need nothing, their etags are made from the same settings
+    def on_config_changed(self, changes: frozenset[str]) -> None:
+        if not touches(changes=changes, keys=FRAGMENT_CONFIG_KEYS + CHART_CONFIG_KEYS):
+            return
+        reading: GlucoseReading | None = self._glucose_poller.latest_reading
+        if reading is not None:
+            self.publish_glucose_reading(reading=reading)
+
+    def publish_status(self, stale: bool) -> None:
+        self._reading_stream.publish(event='status', data='stale' if stale else 'ok')
+
+    def status(self) -> str:
+        return 'stale' if self._glucose_poller.stale else 'ok'
+
+    def stream_events(self, reading: GlucoseReading, events: frozenset[str]) -> list[tuple[str, str]]:
+        stream_events: list[tuple[str, str]] = []
+        if 'glucose' in events:
+            stream_events.append(('glucose', str(reading.mmol_l if self._app_config.config['app']['metric'] else reading.mg_dl)))
+        if 'trend_arrow' in events:
+            stream_events.append(('trend_arrow', reading.trend_arrow))
+        if 'chart' in events:
+            chart_spec: ChartSpec = ChartSpec(hours=int(self._app_config.config['graph']['last_hours']))
+            # render ahead of time so the browsers' follow-up image requests are cache hits. when that timed out
+            # the tag is still sent, the image requests render it again
+            try:
+                rendered: bool = self.last_readings_graph(chart_spec=chart_spec) is not None
+            except ChartRenderTimeout:
+                rendered = True
+            if rendered:
+                stream_events.append(('chart', self.chart_image_tag(chart_spec=chart_spec, newest_reading=reading)))
+        return stream_events
+
+    def last_readings_graph(self, chart_spec: ChartSpec) -> bytes | None:
+        newest_reading: GlucoseReading | None = self._glucose_poller.latest_reading
+        if newest_reading is None:
+            return None
+        # the chart only changes when a new reading lands or the settings it is drawn from change
+        cache_key: tuple[object, ...] = self.chart_etag_parts(chart_spec=chart_spec, newest_reading=newest_reading)
+        return self._chart_cache.get_or_render(key=cache_key, render=lambda: self.render_last_readings_graph(chart_spec=chart_spec))
+
+    def render_last_readings_graph(self, chart_spec: ChartSpec) -> bytes:
+        timestamps, mg_dl = self._history.window(since=datetime.now(tz=timezone.utc) - timedelta(hours=chart_spec.hours))
+        return self._chart_render_pool.render(
+            style=ChartStyle.from_config(app_config=self._app_config), chart_spec=chart_spec,
+            timestamps=timestamps, mg_dl=mg_dl, chart_timezone=self._history.tzinfo())
+
+# optional ?width=&height=&dpi= so the chart is rendered at the browser source's actual size
+def requested_chart_spec(hours: int, image_format: str, view: str = 'line') -> ChartSpec | None:
+    width: int = request.args.get('width', default=CHART_DEFAULT_WIDTH, type=int)
+    height: int = request.args.get('height', default=CHART_DEFAULT_HEIGHT, type=int)
+    dpi: int = request.args.get('dpi', default=CHART_DEFAULT_DPI, type=int)
+    chart_spec: ChartSpec = ChartSpec(hours=hours, image_format=image_format, width=width, height=height, dpi=dpi, view=view)
+    return chart_spec if chart_spec.is_valid() else None
+
+# the chart's low and high bands, plus dexcom's urgent low, with the same boundaries as /api/stats
+def glucose_range(mg_dl: int, app_config: AppConfig) -> str:
+    return str(glucose_ranges(mg_dl=np.array([mg_dl]), thresholds=StatsThresholds.from_config(app_config=app_config))[0])
+
+def etag_for(etag_parts: tuple[object, ...]) -> str:
+    return hashlib.sha256(repr(etag_parts).encode()).hexdigest()[:32]
+
+# answers revalidation with a 304 before rendering anything when the client already has this version
+def conditional_response(etag_parts: tuple[object, ...], last_modified: datetime, render: Callable[[], ft.ResponseReturnValue]) -> Response:
+    etag: str = etag_for(etag_parts=etag_parts)
+    not_modified: bool = request.if_none_match.contains(etag) if request.if_none_match else (
+        request.if_modified_since is not None and last_modified.replace(microsecond=0) <= request.if_modified_since)
+
+    response: Response = Response(status=304) if not_modified else make_response(render())
+    if response.status_code not in (200, 304):
+        return response
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # cache, but always revalidate so a new reading shows up on the next poll
+    response.cache_control.no_cache = True
+    return response
+
+class MetricsBlueprint(Blueprint):
+    def __init__(self, app: Flask) -> None:
+        super().__init__(name="metrics", import_name=__name__)
+        self._app: Flask = app
+
+        self.add_url_rule(rule='/metrics', view_func=self.serve_metrics)
+
+    def serve_metrics(self) -> ft.ResponseReturnValue:
+        return Response(response=collect_metrics(app=self._app), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# everything /metrics reports, read straight from the objects create_app put in app.extensions. what belongs to one
+# person is labelled with the account, the render pool and the cache budget are shared
+def collect_metrics(app: Flask) -> str:
+    accounts: dict[str, AccountContext] = app.extensions['accounts']
+    chart_render_pool: ChartRenderPool = app.extensions['chart_render_pool']
+    chart_cache_budget: ChartCacheBudget = app.extensions['chart_cache_budget']
+    request_metrics: RequestMetrics = app.extensions['request_metrics']
+    writer: MetricsWriter = MetricsWriter()
+
+    writer.counter(name="http_requests_total", help_text="HTTP requests by route and status.", samples=[
+        ({"route": route, "status": str(status)}, count) for (route, status), count in sorted(request_metrics.counts().items())])
+    writer.histogram(name="http_request_duration_seconds", help_text="Time to produce a response, by route.", samples=[
+        ({"route": route}, histogram) for route, histogram in sorted(request_metrics.latencies().items())])
+
+    writer.counter(name="upstream_requests_total", help_text="Dexcom Share requests, logins included.", samples=[
+        ({"account": name}, account.glucose_poller.dexcom.calls) for name, account in accounts.items()])
+    writer.counter(name="upstream_errors_total", help_text="Failed Dexcom Share fetches.", samples=[
+        ({"account": name}, account.glucose_poller.dexcom.errors) for name, account in accounts.items()])
+    writer.histogram(name="upstream_request_duration_seconds", help_text="Dexcom Share round trip time.", samples=[
+        ({"account": name}, account.glucose_poller.dexcom.latency) for name, account in accounts.items()])
+    writer.gauge(name="upstream_circuit_open", help_text="1 while Dexcom Share calls are failing fast.", samples=[
+        ({"account": name}, int(account.glucose_poller.dexcom.circuit_open)) for name, account in accounts.items()])
+
+    newest_readings: dict[str, GlucoseReading] = {
+        name: reading for name, account in accounts.items() if (reading := account.glucose_poller.latest_reading) is not None}
+    writer.gauge(name="newest_reading_age_seconds", help_text="Age of the newest glucose reading.", samples=[
+        ({"account": name}, (datetime.now(tz=timezone.utc) - reading.datetime).total_seconds()) for name, reading in newest_readings.items()])
+    writer.gauge(name="readings_stale", help_text="1 while the last known good reading is being served.", samples=[
+        ({"account": name}, int(account.glucose_poller.stale)) for name, account in accounts.items()])
+
+    writer.histogram(name="chart_render_duration_seconds", help_text="Time spent drawing a chart in the render process.", samples=[
+        ({}, chart_render_pool.render_time)])
+    writer.histogram(name="chart_render_wait_seconds", help_text="Time a request waited for a chart, queueing included.", samples=[
+        ({}, chart_render_pool.wait_time)])
+    writer.gauge(name="chart_render_queued", help_text="Charts waiting for or being rendered.", samples=[({}, chart_render_pool.queued)])
+    writer.counter(name="chart_cache_hits_total", help_text="Charts served from the cache.", samples=[
+        ({"account": name}, account.chart_cache.hits) for name, account in accounts.items()])
+    writer.counter(name="chart_cache_misses_total", help_text="Charts that had to be rendered or waited for.", samples=[
+        ({"account": name}, account.chart_cache.misses) for name, account in accounts.items()])
+    writer.gauge(name="chart_cache_bytes", help_text="Memory held by every account's cached charts.", samples=[
+        ({}, chart_cache_budget.stats()["bytes"])])
+
+    writer.gauge(name="stream_subscribers", help_text="Connected /api/stream clients.", samples=[
+        ({"account": name}, account.reading_stream.subscriber_count) for name, account in accounts.items()])
+    waitress_server: MultiSocketServer | BaseWSGIServer | None = app.extensions.get('waitress_server')
+    if waitress_server is not None:
+        task_dispatcher = waitress_server.task_dispatcher
+        writer.gauge(name="waitress_threads", help_text="Waitress worker threads.", samples=[({}, len(task_dispatcher.threads))])
+        writer.gauge(name="waitress_active_threads", help_text="Waitress worker threads handling a request.", samples=[({}, task_dispatcher.active_count)])
+        writer.gauge(name="waitress_queued_requests", help_text="Requests waiting for a free waitress thread.", samples=[({}, len(task_dispatcher.queue))])
+        writer.gauge(name="waitress_connections", help_text="Open client connections.", samples=[
+            ({}, connection_count(waitress_server=waitress_server))])
+    return writer.text()
+
+# a few lines for the details dialog, enough to tell whether dexcom, rendering or the server is behind a late overlay.
+# the newest reading is the default account's, or the first named one's without it, dexcom share and the chart cache
+# are totals over every account
+def metrics_summary(app: Flask) -> dict[str, str]:
+    accounts: dict[str, AccountContext] = app.extensions['accounts']
+    # none before the first run wizard has saved a login
+    first_account: AccountContext | None = accounts.get(DEFAULT_ACCOUNT) or next(iter(accounts.values()), None)
+    dexcom_clients: list[DexcomClient] = [account.glucose_poller.dexcom for account in accounts.values()]
+    chart_caches: list[ChartCache] = [account.chart_cache for account in accounts.values()]
+    chart_render_pool: ChartRenderPool = app.extensions['chart_render_pool']
+    chart_cache_budget: ChartCacheBudget = app.extensions['chart_cache_budget']
+    request_metrics: RequestMetrics = app.extensions['request_metrics']
+
+    newest_reading: str = "no account configured"
+    if first_account is not None:
+        glucose_poller: GlucosePoller = first_account.glucose_poller
+        reading: GlucoseReading | None = glucose_poller.latest_reading
+        newest_reading = "none yet" if reading is None else f"{(datetime.now(tz=timezone.utc) - reading.datetime).total_seconds() / 60:.0f} min old"
+        newest_reading += ", stale" if glucose_poller.stale else ""
+    hits: int = sum(chart_cache.hits for chart_cache in chart_caches)
+    lookups: int = hits + sum(chart_cache.misses for chart_cache in chart_caches)
+    circuits_open: int = sum(1 for dexcom in dexcom_clients if dexcom.circuit_open)
+    # the slowest account's, the histograms are not merged
+    upstream_p99s: list[float] = [p99 for dexcom in dexcom_clients if (p99 := dexcom.latency.quantile(0.99)) is not None]
+    summary: dict[str, str] = {
+        "Newest reading": newest_reading,
+        "Requests": (f"{request_metrics.all_routes.count}, p50 {format_milliseconds(request_metrics.all_routes.quantile(0.5))}, "
+                     f"p99 {format_milliseconds(request_metrics.all_routes.quantile(0.99))}"),
+        "Dexcom Share": (f"{sum(dexcom.calls for dexcom in dexcom_clients)} calls, {sum(dexcom.errors for dexcom in dexcom_clients)} errors, "
+                         f"p99 {format_milliseconds(max(upstream_p99s, default=None))}"
+                         + (f", {circuits_open} circuit{'s' if circuits_open > 1 else ''} open" if circuits_open > 0 else "")),
+        "Chart render": (f"{chart_render_pool.render_time.count} renders, p50 {format_milliseconds(chart_render_pool.render_time.quantile(0.5))}, "
+                         f"{chart_render_pool.queued} queued"),
+        "Chart cache": (f"{hits / lookups:.0%} hits of {lookups}, {chart_cache_budget.stats()['bytes'] / 1024 / 1024:.1f} MB"
+                        if lookups > 0 else "no lookups yet"),
+    }
+    if len(accounts) != 1:
+        stale: int = sum(1 for account in accounts.values() if account.glucose_poller.stale)
+        summary["Accounts"] = f"{len(accounts)} served" + (f", {stale} stale" if stale > 0 else "")
+    waitress_server: MultiSocketServer | BaseWSGIServer | None = app.extensions.get('waitress_server')
+    if waitress_server is not None:
+        task_dispatcher = waitress_server.task_dispatcher
+        summary["Waitress"] = (f"{task_dispatcher.active_count}/{len(task_dispatcher.threads)} threads busy, "
+                               f"{len(task_dispatcher.queue)} queued, {connection_count(waitress_server=waitress_server)} connections")
+    return summary
+
+def format_milliseconds(seconds: float | None) -> str:
+    if seconds is None:
+        return "-"
+    if math.isinf(seconds):
+        return "slow"
+    return f"≤{seconds * 1000:g} ms"
+
+# one per page and account. the pages ask for api/... relative to themselves, so the same html serves /glucose
+# from /api and /u/<name>/glucose from /u/<name>/api
+class StaticBlueprint(Blueprint):
+    def __init__(self, name: str, page: str, url_prefix: str, app: Flask, app_config: AppConfig) -> None:
+        super().__init__(name=name, import_name=__name__, url_prefix=url_prefix)
+        self._app: Flask = app
+        self._app_config: AppConfig = app_config
+        self._page: str = page
+
+        self.add_url_rule(rule="/<path:_path>", view_func=self.serve_static_html)
+        self.add_url_rule(rule="", view_func=self.serve_static_html, defaults={'_path': ''})
+
+    def serve_static_html(self, _path: str) -> ft.ResponseReturnValue:
+        # relative urls would resolve against /glucose/..., send those to the page itself
+        if _path != '':
+            return redirect(url_for('.serve_static_html', _path='', **request.args.to_dict()))
+        # ?mode=stream serves the variant that listens on api/stream instead of polling
+        if request.args.get('mode') == 'stream':
+            return self._app.send_static_file(filename=f'{self._page}_stream.html')
+        return self._app.send_static_file(filename=f'{self._page}.html')
+
+# flask app for waitress to serve. the pollers, caches and render pool come from a ServerContext that outlives the
+# app when one is given, so the app and its waitress server can be torn down and rebuilt without losing them.
+# every account the context serves gets its api and pages, the default one at the root and the others under /u/<name>
+def create_app(app_config: AppConfig, context: ServerContext | None = None) -> Flask:
+    app: Flask = Flask(__name__)
+
+    app.extensions['owns_server_context'] = context is None
+    if context is None:
+        context = ServerContext(app_config=app_config)
+    app.extensions['server_context'] = context
+    accounts: dict[str, AccountContext] = context.sync_accounts()
+    app.extensions['accounts'] = accounts
+    chart_render_pool: ChartRenderPool = context.chart_render_pool
+    app.extensions['chart_render_pool'] = chart_render_pool
+    chart_cache_budget: ChartCacheBudget = context.chart_cache_budget
+    app.extensions['chart_cache_budget'] = chart_cache_budget
+    request_metrics: RequestMetrics = context.request_metrics
+    app.extensions['request_metrics'] = request_metrics
+
+    @app.before_request
+    def start_request_timer() -> None:
+        g.request_started = time.perf_counter()
+
+    # streamed responses are timed up to their headers, the rest of a /api/stream connection is not latency
+    @app.after_request
+    def observe_request(response: Response) -> Response:
+        route: str = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        request_metrics.observe(route=route, status=response.status_code, seconds=time.perf_counter() - g.request_started)
+        return response
+
+    dexcom_api_blueprints: dict[str, DexcomAPIBlueprint] = {}
+    for name, account in accounts.items():
+        # blueprint names only need to be unique, the default account keeps the ones it had before
+        name_prefix: str = "" if name == DEFAULT_ACCOUNT else f"{name}_"
+        dexcom_api_blueprint: DexcomAPIBlueprint = DexcomAPIBlueprint(
+            app_config=app_config, glucose_poller=account.glucose_poller, reading_stream=account.reading_stream,
+            chart_render_pool=chart_render_pool, chart_cache=account.chart_cache, chart_cache_budget=chart_cache_budget,
+            name=f"{name_prefix}dexcomapi", url_prefix=f"{account.account.url_prefix}/api")
+        dexcom_api_blueprints[name] = dexcom_api_blueprint
+        app.register_blueprint(blueprint=dexcom_api_blueprint)
+        for page in STATIC_PAGES:
+            app.register_blueprint(blueprint=StaticBlueprint(
+                app=app, app_config=app_config, name=f"{name_prefix}{page}", page=page, url_prefix=f"{account.account.url_prefix}/{page}"))
+    app.extensions['dexcom_api_blueprints'] = dexcom_api_blueprints
+    app.register_blueprint(blueprint=MetricsBlueprint(app=app))
+    return app
+
+# the waitress server for an app from create_app, kept in app.extensions so /metrics can see its threads and queue.
+# kwargs are waitress options, usually ServerSettings.waitress_options()
+def create_waitress_server(app: Flask, **kwargs: object) -> MultiSocketServer | BaseWSGIServer:
+    options: dict[str, object] = {"threads": SERVER_DEFAULT_THREADS, **kwargs}
+    waitress_server: MultiSocketServer | BaseWSGIServer = create_server(application=app, **options)
+    app.extensions['waitress_server'] = waitress_server
+    return waitress_server
+
+# stops what create_app started, the shared context only when the app created its own.
+# the waitress server itself is closed by whoever runs it, see stop_waitress_server
+def shutdown_app(app: Flask) -> None:
+    for dexcom_api_blueprint in app.extensions['dexcom_api_blueprints'].values():
+        dexcom_api_blueprint.detach()
+    close_streams(app)
+    if app.extensions['owns_server_context']:
+        app.extensions['server_context'].close()
+
+
+# waitress has no shutdown of its own and its sockets may only be closed from the thread running its loop.
+# stop accepting, give the requests in flight up to timeout seconds to finish and their responses to be
+# written, then close whatever is left and wait for the loop and worker threads to exit. false when it timed out
+def stop_waitress_server(app: Flask, waitress_server: MultiSocketServer | BaseWSGIServer, loop_thread: threading.Thread,
+                         timeout: float) -> bool:
+    deadline: float = time.monotonic() + timeout
+    listeners: list[BaseWSGIServer] = waitress_listeners(waitress_server=waitress_server)
+    trigger = listeners[0].trigger
+    trigger.pull_trigger(lambda: [wasyncore.dispatcher.close(listener) for listener in listeners])
+
+    # keep-alive connections are closed once their response is out, so browsers reconnect to the next server.
+    # /api/stream responses only end when their subscriber is told to, and one may subscribe while this runs
+    def close_idle_channels() -> None:
+        for listener in listeners:
+            for channel in list(listener.active_channels.values()):
+                if not channel.requests:
+                    channel.close_when_flushed = True
+
+    drained: bool = False
+    while loop_thread.is_alive() and time.monotonic() < deadline:
+        close_streams(app)
+        trigger.pull_trigger(close_idle_channels)
+        if draining_done(waitress_server=waitress_server, listeners=listeners):
+            drained = True
+            break
+        time.sleep(SHUTDOWN_POLL_INTERVAL)
+
+    # an empty socket map ends waitress' loop
+    socket_map: dict[int, wasyncore.dispatcher] = waitress_server.map if isinstance(waitress_server, MultiSocketServer) else waitress_server._map
+    trigger.pull_trigger(lambda: wasyncore.close_all(map=socket_map))
+    loop_thread.join(timeout=max(deadline - time.monotonic(), SHUTDOWN_POLL_INTERVAL))
+    _ = waitress_server.task_dispatcher.shutdown(cancel_pending=True, timeout=max(deadline - time.monotonic(), SHUTDOWN_POLL_INTERVAL))
+    return drained and not loop_thread.is_alive()
+
+
+# ends every account's open /api/stream responses, which would otherwise keep a waitress thread each until the client leaves
+def close_streams(app: Flask) -> None:
+    for account in app.extensions['accounts'].values():
+        account.reading_stream.close()
+
+
+# create_server returns one server per listening socket, or a MultiSocketServer around several sharing one loop
+def waitress_listeners(waitress_server: MultiSocketServer | BaseWSGIServer) -> list[BaseWSGIServer]:
+    if isinstance(waitress_server, BaseWSGIServer):
+        return [waitress_server]
+    return [dispatcher for dispatcher in list(waitress_server.map.values()) if isinstance(dispatcher, BaseWSGIServer)]
+
+
+# the listeners are passed in, a closed one is no longer in a MultiSocketServer's map
+def connection_count(waitress_server: MultiSocketServer | BaseWSGIServer) -> int:
+    return sum(len(listener.active_channels) for listener in waitress_listeners(waitress_server=waitress_server))
+
+
+def draining_done(waitress_server: MultiSocketServer | BaseWSGIServer, listeners: list[BaseWSGIServer]) -> bool:
+    task_dispatcher = waitress_server.task_dispatcher
+    if task_dispatcher.active_count > 0 or len(task_dispatcher.queue) > 0:
+        return False
+    # a finished task may still have its response sitting in a channel's output buffers, the channel closes once it is written
+    return all(len(listener.active_channels) == 0 for listener in listeners)
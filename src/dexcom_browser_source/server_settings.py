@@ -0,0 +1,72 @@
+from typing import TYPE_CHECKING, NamedTuple, Self
+
+# config.py builds its [server] defaults from ServerSettings
+if TYPE_CHECKING:
+    from dexcom_browser_source.config import AppConfig
+
+# waitress' own default address, every interface on port 8080
+SERVER_DEFAULT_LISTEN: tuple[str, ...] = ("0.0.0.0:8080",)
+# every /api/stream client holds on to a waitress thread for as long as it is connected
+SERVER_DEFAULT_THREADS: int = 16
+# waitress' defaults for the rest
+SERVER_DEFAULT_CONNECTION_LIMIT: int = 100
+SERVER_DEFAULT_BACKLOG: int = 1024
+SERVER_DEFAULT_CHANNEL_TIMEOUT: int = 120
+# fixed once the app and its waitress server are created (sockets, threads, the default /api/last and /api/stats
+# routes), a change to these only applies after a restart, which keeps the dexcom session and caches
+RESTART_CONFIG_KEYS: tuple[str, ...] = ("server", "graph.last_hours")
+
+
+# the [server] config section, what create_waitress_server is given. waitress keeps http/1.1 connections alive
+# by itself, channel_timeout is how long an idle one (a browser source between polls) stays open
+class ServerSettings(NamedTuple):
+    listen: tuple[str, ...] = SERVER_DEFAULT_LISTEN
+    threads: int = SERVER_DEFAULT_THREADS
+    connection_limit: int = SERVER_DEFAULT_CONNECTION_LIMIT
+    backlog: int = SERVER_DEFAULT_BACKLOG
+    channel_timeout: int = SERVER_DEFAULT_CHANNEL_TIMEOUT
+
+    @classmethod
+    def from_config(cls, app_config: "AppConfig") -> Self:
+        # config files saved before the section existed fall back to the defaults
+        section: dict[str, object] = app_config.config.get('server') or {}
+        listen: object = section.get('listen', list(SERVER_DEFAULT_LISTEN))
+        return cls(
+            listen=tuple(str(address) for address in (listen.split() if isinstance(listen, str) else listen)),
+            threads=int(section.get('threads', SERVER_DEFAULT_THREADS)),
+            connection_limit=int(section.get('connection_limit', SERVER_DEFAULT_CONNECTION_LIMIT)),
+            backlog=int(section.get('backlog', SERVER_DEFAULT_BACKLOG)),
+            channel_timeout=int(section.get('channel_timeout', SERVER_DEFAULT_CHANNEL_TIMEOUT)),
+        )
+
+    def to_config(self) -> dict[str, object]:
+        return {
+            "listen": list(self.listen),
+            "threads": self.threads,
+            "connection_limit": self.connection_limit,
+            "backlog": self.backlog,
+            "channel_timeout": self.channel_timeout,
+        }
+
+    # keyword arguments for waitress.create_server, several addresses become one server per socket
+    def waitress_options(self) -> dict[str, object]:
+        return {
+            "listen": " ".join(self.listen),
+            "threads": self.threads,
+            "connection_limit": self.connection_limit,
+            "backlog": self.backlog,
+            "channel_timeout": self.channel_timeout,
+        }
+
+    # the checks waitress makes when the server is created, None when it would start with these settings
+    def validate(self) -> str | None:
+        if len(self.listen) == 0:
+            return "at least one listen address is needed"
+        if min(self.threads, self.connection_limit, self.backlog, self.channel_timeout) < 1:
+            return "threads, connection limit, backlog and channel timeout must be at least 1"
+        from waitress.adjustments import Adjustments
+        try:
+            _ = Adjustments(**self.waitress_options())
+        except ValueError as e:
+            return f"{e} ({' '.join(self.listen)})"
+        return None
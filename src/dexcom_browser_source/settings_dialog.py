@@ -0,0 +1,135 @@
+from typing import override
+from PySide6.QtCore import QThread, Signal
+from PySide6.QtGui import QIcon
+from PySide6.QtWidgets import QApplication, QDialog, QFormLayout, QGroupBox, QHBoxLayout, QLabel, QLayout, QLineEdit, QPushButton, QSpinBox, QVBoxLayout, QWidget
+
+from dexcom_browser_source.config import AppConfig
+from dexcom_browser_source.server_settings import ServerSettings
+
+
+# the load test behind the self-test button, a few seconds of simulated browser sources against a throwaway server
+class SelfTestThread(QThread):
+    completed: Signal = Signal(dict)
+    failed: Signal = Signal(str)
+
+    def __init__(self, server_settings: ServerSettings):
+        self._server_settings: ServerSettings = server_settings
+        super().__init__()
+
+    @override
+    def run(self, /) -> None:
+        # flask, waitress and matplotlib are only imported once a self-test is asked for
+        from dexcom_browser_source.load_test import self_test
+        try:
+            self.completed.emit(self_test(server_settings=self._server_settings))
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class SettingsDialog(QDialog):
+    def __init__(self, app: QApplication, app_config: AppConfig, parent: QWidget | None = None):
+        self._app: QApplication = app
+        self._app_config: AppConfig = app_config
+        super().__init__(parent)
+        self._app_icon: QIcon = QIcon("assets/icon.svg")
+        self._app_group: QGroupBox = QGroupBox("General")
+        self._dexcom_group: QGroupBox = QGroupBox("Dexcom")
+        self._graph_group: QGroupBox = QGroupBox("Glucose Reading and Graph")
+        self._server_group: QGroupBox = QGroupBox("Server")
+        self._layout: QVBoxLayout = QVBoxLayout()
+        self._server_layout: QFormLayout = QFormLayout()
+        self._button_layout: QHBoxLayout = QHBoxLayout()
+        self._listen_line_edit: QLineEdit = QLineEdit()
+        self._threads_spin_box: QSpinBox = QSpinBox(minimum=1, maximum=256)
+        self._connection_limit_spin_box: QSpinBox = QSpinBox(minimum=1, maximum=10000)
+        self._backlog_spin_box: QSpinBox = QSpinBox(minimum=1, maximum=65535)
+        self._channel_timeout_spin_box: QSpinBox = QSpinBox(minimum=1, maximum=3600, suffix=" s")
+        self._self_test_button: QPushButton = QPushButton("Run Self-Test")
+        self._save_button: QPushButton = QPushButton("Save")
+        self._status_label: QLabel = QLabel(wordWrap=True)
+        self._self_test_thread: SelfTestThread | None = None
+        self.setWindowTitle("Dexcom Browser Source - Settings")
+        self.setup_layout()
+        self.load_server_settings()
+
+    def setup_layout(self):
+        self._listen_line_edit.setPlaceholderText("0.0.0.0:8080 [::]:8080")
+        self._listen_line_edit.setToolTip("Addresses to listen on as host:port, separated by spaces")
+        self._threads_spin_box.setToolTip("Worker threads, every connected /api/stream page holds on to one")
+        self._connection_limit_spin_box.setToolTip("Open connections accepted before new ones have to wait")
+        self._backlog_spin_box.setToolTip("Connections the operating system queues before they are accepted")
+        self._channel_timeout_spin_box.setToolTip("How long an idle keep-alive connection is held open")
+        self._server_layout.addRow(QLabel("Listen Addresses"), self._listen_line_edit)
+        self._server_layout.addRow(QLabel("Threads"), self._threads_spin_box)
+        self._server_layout.addRow(QLabel("Connection Limit"), self._connection_limit_spin_box)
+        self._server_layout.addRow(QLabel("Backlog"), self._backlog_spin_box)
+        self._server_layout.addRow(QLabel("Keep-Alive Timeout"), self._channel_timeout_spin_box)
+        self._server_group.setLayout(self._server_layout)
+
+        _ = self._self_test_button.clicked.connect(self.run_self_test)
+        _ = self._save_button.clicked.connect(self.save)
+        self._button_layout.addWidget(self._self_test_button)
+        self._button_layout.addWidget(self._save_button)
+
+        self._layout.addWidget(self._server_group)
+        self._layout.addLayout(self._button_layout)
+        self._layout.addWidget(self._status_label)
+        self._layout.setSizeConstraint(QLayout.SizeConstraint.SetFixedSize)
+        self.setLayout(self._layout)
+
+    def load_server_settings(self):
+        server_settings: ServerSettings = ServerSettings.from_config(app_config=self._app_config)
+        self._listen_line_edit.setText(" ".join(server_settings.listen))
+        self._threads_spin_box.setValue(server_settings.threads)
+        self._connection_limit_spin_box.setValue(server_settings.connection_limit)
+        self._backlog_spin_box.setValue(server_settings.backlog)
+        self._channel_timeout_spin_box.setValue(server_settings.channel_timeout)
+
+    def server_settings(self) -> ServerSettings:
+        return ServerSettings(
+            listen=tuple(self._listen_line_edit.text().split()),
+            threads=self._threads_spin_box.value(),
+            connection_limit=self._connection_limit_spin_box.value(),
+            backlog=self._backlog_spin_box.value(),
+            channel_timeout=self._channel_timeout_spin_box.value(),
+        )
+
+    def set_status(self, text: str, color: str):
+        self._status_label.setText(text)
+        self._status_label.setStyleSheet(f"QLabel {{ color: {color}; }}")
+
+    def save(self):
+        server_settings: ServerSettings = self.server_settings()
+        error: str | None = server_settings.validate()
+        if error is not None:
+            self.set_status(text=error, color="red")
+            return
+        self._app_config.config['server'] = server_settings.to_config()
+        self._app_config.save()
+        # saving notifies the config's change listeners, the browser source details dialog restarts the server
+        self.set_status(text="Saved", color="green")
+
+    # tests what is in the form, saved or not, so settings can be tried before the running server is restarted with them
+    def run_self_test(self):
+        server_settings: ServerSettings = self.server_settings()
+        error: str | None = server_settings.validate()
+        if error is not None:
+            self.set_status(text=error, color="red")
+            return
+        self._self_test_button.setEnabled(False)
+        self.set_status(text="Running the self-test...", color="orange")
+        self._self_test_thread = SelfTestThread(server_settings=server_settings)
+        _ = self._self_test_thread.completed.connect(self.on_self_test_completed)
+        _ = self._self_test_thread.failed.connect(self.on_self_test_failed)
+        _ = self._self_test_thread.finished.connect(self.on_self_test_finished)
+        self._self_test_thread.start()
+
+    def on_self_test_completed(self, results: dict[str, object]):
+        from dexcom_browser_source.load_test import format_self_test
+        self.set_status(text=format_self_test(results=results), color="red" if results["saturated"] else "green")
+
+    def on_self_test_failed(self, error: str):
+        self.set_status(text=f"The self-test failed: {error}", color="red")
+
+    def on_self_test_finished(self):
+        self._self_test_button.setEnabled(True)
@@ -0,0 +1,123 @@
+from typing import NamedTuple, Self
+import numpy as np
+from pydexcom.const import MMOL_L_CONVERSION_FACTOR
+
+from dexcom_browser_source.config import AppConfig
+
+# dexcom transmitters upload a new reading every 5 minutes
+READING_MINUTES: float = 5.0
+# readings further apart than this are a gap (no signal, sensor change) rather than a change in glucose
+MAX_RATE_GAP_MINUTES: float = 15.0
+# the current rate of change is fitted over the readings from this many minutes
+RATE_WINDOW_MINUTES: float = 15.0
+
+
+class StatsThresholds(NamedTuple):
+    severe_hypoglycemia: int
+    hypoglycemia: int
+    hyperglycemia: int
+
+    @classmethod
+    def from_config(cls, app_config: AppConfig) -> Self:
+        return cls(
+            severe_hypoglycemia=int(app_config.config['dexcom']['severe_hypoglycemia_level']),
+            hypoglycemia=int(app_config.config['dexcom']['hypoglycemia_level']),
+            hyperglycemia=int(app_config.config['dexcom']['hyperglycemia_level']),
+        )
+
+
+# where each mg/dL value falls, shared by the stats and the overlay so both count a reading on a threshold the same
+# way: below severe_hypoglycemia is urgent low and below hypoglycemia is low, up to and including hyperglycemia is
+# in range, like the consensus 70-180 mg/dL time in range
+def glucose_ranges(mg_dl: np.ndarray, thresholds: StatsThresholds) -> np.ndarray:
+    return np.select(
+        [mg_dl < thresholds.severe_hypoglycemia, mg_dl < thresholds.hypoglycemia, mg_dl > thresholds.hyperglycemia],
+        ["urgent_low", "low", "high"], default="in_range")
+
+
+def percent(mask: np.ndarray) -> float:
+    return round(float(np.count_nonzero(mask)) / len(mask) * 100, 1)
+
+
+# time in ranges, variability and rate of change for the (epoch milliseconds, mg/dL) columns of ReadingHistory.window.
+# every reading stands for the same 5 minutes, so time in a range is the share of readings in it
+def glucose_stats(timestamps: np.ndarray, mg_dl: np.ndarray, thresholds: StatsThresholds, hours: int) -> dict[str, object]:
+    count: int = len(mg_dl)
+    stats: dict[str, object] = {
+        "hours": hours,
+        "readings": count,
+        "coverage_percent": round(min(100.0, count / (hours * 60 / READING_MINUTES) * 100), 1),
+        "thresholds": thresholds._asdict(),
+    }
+    if count == 0:
+        return stats
+
+    values: np.ndarray = mg_dl.astype(np.float64)
+    ranges: np.ndarray = glucose_ranges(mg_dl=values, thresholds=thresholds)
+    mean: float = float(values.mean())
+    sd: float = float(values.std(ddof=1)) if count > 1 else 0.0
+    stats.update({
+        "mean_mg_dl": round(mean, 1),
+        "mean_mmol_l": round(mean * MMOL_L_CONVERSION_FACTOR, 1),
+        "sd_mg_dl": round(sd, 1),
+        "sd_mmol_l": round(sd * MMOL_L_CONVERSION_FACTOR, 1),
+        "cv_percent": round(sd / mean * 100, 1),
+        # glucose management indicator, bergenstal et al. 2018
+        "gmi_percent": round(3.31 + 0.02392 * mean, 1),
+        "min_mg_dl": int(values.min()),
+        "max_mg_dl": int(values.max()),
+        "time_very_low_percent": percent(ranges == "urgent_low"),
+        "time_low_percent": percent(ranges == "low"),
+        "time_in_range_percent": percent(ranges == "in_range"),
+        "time_high_percent": percent(ranges == "high"),
+    })
+    stats["time_below_range_percent"] = round(stats["time_very_low_percent"] + stats["time_low_percent"], 1)
+
+    minutes: np.ndarray = (timestamps - timestamps[-1]) / 60000.0
+    gaps: np.ndarray = np.diff(minutes)
+    contiguous: np.ndarray = gaps <= MAX_RATE_GAP_MINUTES
+    rates: np.ndarray = np.diff(values)[contiguous] / gaps[contiguous]
+    stats["mean_absolute_rate_mg_dl_per_minute"] = round(float(np.abs(rates).mean()), 2) if len(rates) > 0 else None
+
+    # least squares slope over the last few readings, steadier than the difference of the last two
+    recent: np.ndarray = minutes >= -RATE_WINDOW_MINUTES
+    if np.count_nonzero(recent) > 1:
+        slope: float = float(np.polyfit(minutes[recent], values[recent], deg=1)[0])
+        stats["rate_of_change_mg_dl_per_minute"] = round(slope, 2)
+        stats["rate_of_change_mmol_l_per_minute"] = round(slope * MMOL_L_CONVERSION_FACTOR, 3)
+    else:
+        stats["rate_of_change_mg_dl_per_minute"] = None
+        stats["rate_of_change_mmol_l_per_minute"] = None
+    return stats
+
+
+# ambulatory glucose profile: every day in the window folded onto one 24 hour day, in local time
+AGP_BINS: int = 96
+AGP_PERCENTILES: tuple[float, ...] = (0.05, 0.25, 0.5, 0.75, 0.95)
+MILLISECONDS_PER_DAY: int = 86_400_000
+
+
+# (bin start in hours since local midnight, one row of mg/dL per percentile), nan where a bin has no readings.
+# sorted once by (bin, value) so every percentile of every bin is read off in a single pass, no per-bin loop
+def ambulatory_glucose_profile(timestamps: np.ndarray, mg_dl: np.ndarray, utc_offset_ms: int,
+                               bins: int = AGP_BINS, percentiles: tuple[float, ...] = AGP_PERCENTILES) -> tuple[np.ndarray, np.ndarray]:
+    hours: np.ndarray = np.arange(bins) * (24 / bins)
+    profile: np.ndarray = np.full((len(percentiles), bins), np.nan)
+    if len(mg_dl) == 0:
+        return hours, profile
+
+    bin_of: np.ndarray = ((timestamps + utc_offset_ms) % MILLISECONDS_PER_DAY) * bins // MILLISECONDS_PER_DAY
+    order: np.ndarray = np.lexsort((mg_dl, bin_of))
+    ordered: np.ndarray = mg_dl[order].astype(np.float64)
+    counts: np.ndarray = np.bincount(bin_of, minlength=bins)
+    starts: np.ndarray = np.cumsum(counts) - counts
+    filled: np.ndarray = counts > 0
+
+    for row, percentile in enumerate(percentiles):
+        # linear interpolation between the two closest ranks, like numpy.percentile's default
+        position: np.ndarray = starts[filled] + percentile * (counts[filled] - 1)
+        lower: np.ndarray = np.floor(position).astype(np.int64)
+        upper: np.ndarray = np.minimum(lower + 1, starts[filled] + counts[filled] - 1)
+        fraction: np.ndarray = position - lower
+        profile[row, filled] = ordered[lower] * (1 - fraction) + ordered[upper] * fraction
+    return hours, profile
@@ -0,0 +1,80 @@
+import queue
+import threading
+from collections.abc import Iterator
+
+# comment lines keep idle connections open through proxies and let waitress notice dropped clients
+HEARTBEAT_INTERVAL: float = 15.0
+# a subscriber this far behind is dropped rather than allowed to grow without bound
+SUBSCRIBER_BACKLOG: int = 16
+
+
+def format_event(event: str, data: str) -> str:
+    lines: str = "".join(f"data: {line}\n" for line in data.splitlines() or [""])
+    return f"event: {event}\n{lines}\n"
+
+
+class ReadingStream:
+    def __init__(self):
+        self._lock: threading.Lock = threading.Lock()
+        # each subscriber only receives the events it asked for
+        self._subscribers: dict[queue.Queue[str | None], frozenset[str]] = {}
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    # the puts never block, so they are made under the lock and a disconnect can never race one of them
+    def publish(self, event: str, data: str) -> None:
+        message: str = format_event(event=event, data=data)
+        with self._lock:
+            for subscriber, events in list(self._subscribers.items()):
+                if event not in events:
+                    continue
+                try:
+                    subscriber.put_nowait(message)
+                except queue.Full:
+                    self._disconnect(subscriber)
+
+    # wakes every connected client so their responses finish and waitress can shut down
+    def close(self) -> None:
+        with self._lock:
+            for subscriber in list(self._subscribers):
+                self._disconnect(subscriber)
+
+    def subscribe(self, events: frozenset[str], initial_events: list[tuple[str, str]]) -> Iterator[str]:
+        subscriber: queue.Queue[str | None] = queue.Queue(maxsize=SUBSCRIBER_BACKLOG)
+        with self._lock:
+            self._subscribers[subscriber] = events
+        return self._events(subscriber=subscriber, initial_events=initial_events)
+
+    def _events(self, subscriber: queue.Queue[str | None], initial_events: list[tuple[str, str]]) -> Iterator[str]:
+        try:
+            for event, data in initial_events:
+                yield format_event(event=event, data=data)
+            while True:
+                try:
+                    message: str | None = subscriber.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self._unsubscribe(subscriber)
+
+    def _unsubscribe(self, subscriber: queue.Queue[str | None]) -> None:
+        with self._lock:
+            _ = self._subscribers.pop(subscriber, None)
+
+    # drop whatever is still queued for the subscriber and tell its response to finish. called with the lock held,
+    # once the subscriber is gone from _subscribers nothing else puts to it, so the emptied queue has room for the None
+    def _disconnect(self, subscriber: queue.Queue[str | None]) -> None:
+        _ = self._subscribers.pop(subscriber, None)
+        while True:
+            try:
+                _ = subscriber.get_nowait()
+            except queue.Empty:
+                break
+        subscriber.put_nowait(None)
@@ -0,0 +1,19 @@
+from collections.abc import Iterator
+from pathlib import Path
+import pytest
+
+from dexcom_browser_source.config import AppConfig
+from dexcom_browser_source.fake_share import FakeShareServer
+
+
+@pytest.fixture
+def app_config(tmp_path: Path) -> AppConfig:
+    return AppConfig(custom_config_path=tmp_path)
+
+
+@pytest.fixture
+def fake_share() -> Iterator[FakeShareServer]:
+    share: FakeShareServer = FakeShareServer()
+    share.start()
+    yield share
+    share.stop()
@@ -0,0 +1,25 @@
+from dexcom_browser_source.accounts import DEFAULT_ACCOUNT, AccountSettings, configured_accounts
+from dexcom_browser_source.config import AppConfig
+
+
+def test_default_account_waits_for_credentials(app_config: AppConfig) -> None:
+    app_config.config['dexcom']['account'] = {"username": None, "password": None}
+    assert configured_accounts(app_config=app_config) == {}
+
+    app_config.config['dexcom']['account'] = {"username": "username", "password": "password"}
+    assert list(configured_accounts(app_config=app_config)) == [DEFAULT_ACCOUNT]
+
+
+def test_named_accounts_share_the_default_url(app_config: AppConfig) -> None:
+    app_config.config['dexcom']['share_url'] = "http://share.example/"
+    app_config.config['accounts'] = {
+        "alice": {"username": "alice", "password": "password"},
+        "bob": {"username": "bob", "password": "password", "share_url": "http://other.example/"},
+        "no-password": {"username": "carol"},
+        "not a name": {"username": "dave", "password": "password"},
+    }
+    accounts: dict[str, AccountSettings] = configured_accounts(app_config=app_config)
+    assert [name for name in accounts if name != DEFAULT_ACCOUNT] == ["alice", "bob"]
+    assert accounts["alice"].share_url == "http://share.example/"
+    assert accounts["alice"].url_prefix == "/u/alice"
+    assert accounts["bob"].share_url == "http://other.example/"
@@ -0,0 +1,168 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import timezone
+import numpy as np
+import pytest
+from matplotlib.dates import DateFormatter, DayLocator, HourLocator
+
+from dexcom_browser_source.chart import CHART_MAX_HOURS, MILLISECONDS_PER_DAY, ChartCache, ChartCacheBudget, ChartRenderPool, ChartRenderTimeout, ChartRenderer, ChartSpec, ChartStyle, date_axis, kill_executor, min_max_downsample
+from dexcom_browser_source.config import AppConfig
+
+
+FIVE_MINUTES_MS: int = 5 * 60_000
+
+
+def test_downsample_leaves_short_windows_alone() -> None:
+    timestamps: np.ndarray = np.arange(100) * FIVE_MINUTES_MS
+    values: np.ndarray = np.arange(100)
+    sampled_timestamps, sampled_values = min_max_downsample(timestamps=timestamps, values=values, buckets=50)
+    assert sampled_timestamps is timestamps
+    assert sampled_values is values
+
+
+def test_downsample_keeps_every_buckets_extremes() -> None:
+    rng: np.random.Generator = np.random.default_rng(seed=2)
+    timestamps: np.ndarray = np.arange(90 * 288) * FIVE_MINUTES_MS
+    values: np.ndarray = rng.integers(40, 400, size=len(timestamps))
+    buckets: int = 640
+    sampled_timestamps, sampled_values = min_max_downsample(timestamps=timestamps, values=values, buckets=buckets)
+
+    assert len(sampled_timestamps) <= 2 * buckets
+    assert np.all(np.diff(sampled_timestamps) > 0)
+    bucket_of: np.ndarray = (timestamps - timestamps[0]) * buckets // (int(timestamps[-1] - timestamps[0]) + 1)
+    sampled_bucket_of: np.ndarray = (sampled_timestamps - timestamps[0]) * buckets // (int(timestamps[-1] - timestamps[0]) + 1)
+    for bucket in range(buckets):
+        in_bucket: np.ndarray = values[bucket_of == bucket]
+        kept: np.ndarray = sampled_values[sampled_bucket_of == bucket]
+        assert kept.min() == in_bucket.min()
+        assert kept.max() == in_bucket.max()
+
+
+def test_date_axis_hours_then_days() -> None:
+    locator, formatter = date_axis(hours=3, chart_timezone=timezone.utc)
+    assert isinstance(locator, HourLocator)
+    assert isinstance(formatter, DateFormatter) and formatter.fmt == '%I %p'
+    locator, formatter = date_axis(hours=48, chart_timezone=timezone.utc)
+    assert isinstance(locator, HourLocator)
+    locator, formatter = date_axis(hours=14 * 24, chart_timezone=timezone.utc)
+    assert isinstance(locator, DayLocator)
+    assert isinstance(formatter, DateFormatter) and formatter.fmt == '%b %d'
+
+
+def test_chart_spec_allows_the_whole_history() -> None:
+    assert ChartSpec(hours=CHART_MAX_HOURS).is_valid()
+    assert not ChartSpec(hours=CHART_MAX_HOURS + 1).is_valid()
+
+
+def test_renderer_x_limits_follow_the_window(app_config: AppConfig) -> None:
+    renderer: ChartRenderer = ChartRenderer(style=ChartStyle.from_config(app_config=app_config), width=320, height=240, dpi=100)
+    timestamps: np.ndarray = 1_700_000_000_000 + np.arange(3) * FIVE_MINUTES_MS
+    _ = renderer.render(timestamps=timestamps, mg_dl=np.array([100, 110, 120]), chart_timezone=timezone.utc, hours=6, image_format="png")
+    left, right = renderer._axis.get_xlim()
+    assert right == timestamps[-1] / MILLISECONDS_PER_DAY
+    assert right - left == pytest.approx(6 / 24)
+
+    _ = renderer.render(timestamps=timestamps[:0], mg_dl=np.zeros(0, dtype=np.uint16), chart_timezone=timezone.utc, hours=24, image_format="png")
+    left, right = renderer._axis.get_xlim()
+    assert right - left == pytest.approx(1.0)
+
+
+def test_cache_evicts_least_recently_used_entry() -> None:
+    cache: ChartCache = ChartCache(max_entries=2)
+    _ = cache.get_or_render(key="a", render=lambda: b"a")
+    _ = cache.get_or_render(key="b", render=lambda: b"b")
+    _ = cache.get_or_render(key="a", render=lambda: b"not rendered")
+    _ = cache.get_or_render(key="c", render=lambda: b"c")
+
+    assert cache.get_or_render(key="a", render=lambda: b"rendered again") == b"a"
+    assert cache.get_or_render(key="b", render=lambda: b"rendered again") == b"rendered again"
+    assert cache.stats()["entries"] == 2
+
+
+def test_budget_evicts_across_caches() -> None:
+    budget: ChartCacheBudget = ChartCacheBudget(max_bytes=10)
+    first: ChartCache = ChartCache(budget=budget)
+    second: ChartCache = ChartCache(budget=budget)
+    _ = first.get_or_render(key="old", render=lambda: b"1234")
+    _ = second.get_or_render(key="other", render=lambda: b"1234")
+    # a hit makes first's chart the most recently used, so second's goes
+    _ = first.get_or_render(key="old", render=lambda: b"")
+    _ = first.get_or_render(key="new", render=lambda: b"1234")
+
+    assert budget.stats() == {"entries": 2, "bytes": 8, "max_bytes": 10}
+    assert first.stats()["entries"] == 2
+    assert second.stats()["entries"] == 0
+
+    first.clear()
+    assert budget.stats()["bytes"] == 0
+
+
+def test_render_in_flight_during_clear_is_not_cached() -> None:
+    cache: ChartCache = ChartCache()
+    started: threading.Event = threading.Event()
+    finish: threading.Event = threading.Event()
+    results: list[bytes] = []
+
+    def slow_render() -> bytes:
+        started.set()
+        _ = finish.wait(timeout=10)
+        return b"old"
+
+    thread: threading.Thread = threading.Thread(target=lambda: results.append(cache.get_or_render(key="chart", render=slow_render)))
+    thread.start()
+    _ = started.wait(timeout=10)
+    cache.clear()
+    # a request after the clear renders again rather than waiting for the stale render
+    assert cache.get_or_render(key="chart", render=lambda: b"new") == b"new"
+    finish.set()
+    thread.join(timeout=10)
+
+    assert results == [b"old"]
+    assert cache.get_or_render(key="chart", render=lambda: b"rendered again") == b"new"
+
+
+def test_waiting_on_a_stuck_render_times_out() -> None:
+    cache: ChartCache = ChartCache(timeout=0.1)
+    started: threading.Event = threading.Event()
+    finish: threading.Event = threading.Event()
+
+    def stuck_render() -> bytes:
+        started.set()
+        _ = finish.wait(timeout=10)
+        return b"late"
+
+    thread: threading.Thread = threading.Thread(target=lambda: cache.get_or_render(key="chart", render=stuck_render))
+    thread.start()
+    _ = started.wait(timeout=10)
+    with pytest.raises(ChartRenderTimeout):
+        _ = cache.get_or_render(key="chart", render=lambda: b"not rendered")
+    finish.set()
+    thread.join(timeout=10)
+
+
+# the first render has to start a render process, which takes far longer than the timeout
+def test_render_timeout_raises(app_config: AppConfig) -> None:
+    pool: ChartRenderPool = ChartRenderPool(timeout=0.01)
+    try:
+        with pytest.raises(ChartRenderTimeout):
+            _ = pool.render(style=ChartStyle.from_config(app_config=app_config), chart_spec=ChartSpec(hours=3),
+                            timestamps=np.array([], dtype=np.int64), mg_dl=np.array([], dtype=np.int64), chart_timezone=timezone.utc)
+        assert pool.stats()["queued"] == 0
+    finally:
+        pool.shutdown()
+
+
+def test_kill_executor_stops_a_running_task() -> None:
+    executor: ProcessPoolExecutor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    future: Future[None] = executor.submit(time.sleep, 60)
+    deadline: float = time.monotonic() + 30
+    while not future.running() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    kill_executor(executor=executor)
+
+    deadline = time.monotonic() + 5
+    while len(multiprocessing.active_children()) > 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert multiprocessing.active_children() == []
@@ -0,0 +1,44 @@
+from pathlib import Path
+import toml
+
+from dexcom_browser_source.config import AppConfig, diff_config, touches
+
+
+def test_diff_config_nested_and_one_sided_keys() -> None:
+    old: dict[str, object] = {"app": {"metric": False}, "graph": {"colors": {"normal": "grey", "high": "red"}}}
+    new: dict[str, object] = {"app": {"metric": False}, "graph": {"colors": {"normal": "green"}}, "server": {"threads": 8}}
+    assert diff_config(old, new) == frozenset({"graph.colors.normal", "graph.colors.high", "server.threads"})
+    assert diff_config(new, new) == frozenset()
+
+
+def test_touches_keys_and_sections() -> None:
+    changes: frozenset[str] = frozenset({"graph.colors.normal"})
+    assert touches(changes=changes, keys=("graph.colors",))
+    assert touches(changes=changes, keys=("graph",))
+    assert touches(changes=changes, keys=("graph.colors.normal",))
+    assert not touches(changes=changes, keys=("graph.color",))
+    assert not touches(changes=changes, keys=("app.metric",))
+
+
+def test_reload_reports_changed_keys(app_config: AppConfig) -> None:
+    app_config.config["dexcom"]["account"] = {"username": "username", "password": "password"}
+    app_config.save()
+    seen: list[frozenset[str]] = []
+    app_config.add_change_listener(seen.append)
+    config_file: Path = Path(app_config.config_path, "config.toml")
+    edited: dict[str, object] = toml.load(config_file)
+    edited["app"]["metric"] = not edited["app"]["metric"]
+    _ = config_file.write_text(toml.dumps(edited))
+
+    assert app_config.reload() == frozenset({"app.metric"})
+    assert seen == [frozenset({"app.metric"})]
+    # nothing changed on disk since
+    assert app_config.reload() == frozenset()
+
+
+def test_save_is_not_reloaded_and_leaves_no_temporary_files(app_config: AppConfig) -> None:
+    app_config.config["graph"]["height_limit"] = 300
+    app_config.save()
+    assert app_config.reload() == frozenset()
+    assert [path.name for path in app_config.config_path.iterdir() if path.suffix == ".toml"] == ["config.toml"]
+    assert toml.load(Path(app_config.config_path, "config.toml"))["graph"]["height_limit"] == 300
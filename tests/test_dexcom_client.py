@@ -0,0 +1,12 @@
+from pydexcom.glucose_reading import GlucoseReading
+
+from dexcom_browser_source.dexcom_client import REQUEST_TIMEOUT, TimeoutDexcom
+from dexcom_browser_source.fake_share import FakeShareServer
+
+
+# pydexcom appends its endpoints to the base url as it is
+def test_base_url_without_trailing_slash(fake_share: FakeShareServer) -> None:
+    dexcom: TimeoutDexcom = TimeoutDexcom(username="username", password="password", timeout=REQUEST_TIMEOUT,
+                                          base_url=fake_share.url.rstrip("/"))
+    reading: GlucoseReading | None = dexcom.get_current_glucose_reading()
+    assert reading is not None
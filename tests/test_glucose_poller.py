@@ -0,0 +1,114 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from pydexcom.glucose_reading import GlucoseReading
+
+from dexcom_browser_source.glucose_poller import READING_INTERVAL, RETRY_INTERVAL, UPLOAD_GRACE, GlucosePoller, PollScheduler
+from dexcom_browser_source.history import ReadingHistory, create_glucose_reading
+
+
+# answers with whatever the test put in readings, the way DexcomClient answers for the poller
+class ScriptedDexcom:
+    def __init__(self):
+        self.readings: list[GlucoseReading] = []
+        self.calls: int = 0
+
+    def get_glucose_readings(self, minutes: int, max_count: int) -> list[GlucoseReading]:
+        self.calls += 1
+        return self.readings
+
+    def retry_in(self) -> float:
+        return 0.0
+
+
+# holds every fetch until the test releases it
+class BlockingDexcom(ScriptedDexcom):
+    def __init__(self):
+        super().__init__()
+        self.fetching: threading.Event = threading.Event()
+        self.release: threading.Event = threading.Event()
+
+    def get_glucose_readings(self, minutes: int, max_count: int) -> list[GlucoseReading]:
+        self.fetching.set()
+        _ = self.release.wait(timeout=10)
+        return super().get_glucose_readings(minutes=minutes, max_count=max_count)
+
+
+def reading(age: timedelta, mg_dl: int = 100) -> GlucoseReading:
+    timestamp: int = int((datetime.now(tz=timezone.utc) - age).timestamp() * 1000)
+    return create_glucose_reading(timestamp=timestamp, mg_dl=mg_dl, trend="Flat", utc_offset=0)
+
+
+def test_overdue_retries_back_off_and_reset(tmp_path: Path) -> None:
+    dexcom: ScriptedDexcom = ScriptedDexcom()
+    history: ReadingHistory = ReadingHistory(database_path=Path(tmp_path, "history.sqlite3"))
+    # the scheduler is never started, poll() is called directly
+    poller: GlucosePoller = GlucosePoller(dexcom=dexcom, history=history, scheduler=PollScheduler())
+
+    # the sensor stopped uploading twenty minutes ago
+    dexcom.readings = [reading(age=timedelta(minutes=20))]
+    delays: list[float] = [poller.poll() for _ in range(6)]
+    assert delays == [30.0, 60.0, 120.0, 240.0, 300.0, 300.0]
+
+    # a fresh reading is scheduled off its own timestamp again
+    dexcom.readings = [reading(age=timedelta(seconds=10), mg_dl=110)]
+    assert 0 < poller.poll() <= (READING_INTERVAL + UPLOAD_GRACE).total_seconds()
+    assert poller.latest_reading.mg_dl == 110
+
+    # and the next time one is late the retries start over from the short interval
+    history.clear()
+    dexcom.readings = [reading(age=timedelta(minutes=7))]
+    assert poller.poll() == RETRY_INTERVAL.total_seconds()
+    history.close()
+
+
+def test_empty_history_backs_off_as_well(tmp_path: Path) -> None:
+    history: ReadingHistory = ReadingHistory(database_path=Path(tmp_path, "history.sqlite3"))
+    poller: GlucosePoller = GlucosePoller(dexcom=ScriptedDexcom(), history=history, scheduler=PollScheduler())
+    assert [poller.poll() for _ in range(3)] == [30.0, 60.0, 120.0]
+    assert poller.wait_ready(timeout=0)
+    history.close()
+
+
+def test_stop_waits_for_the_fetch_in_flight(tmp_path: Path) -> None:
+    dexcom: BlockingDexcom = BlockingDexcom()
+    dexcom.readings = [reading(age=timedelta(minutes=1))]
+    history: ReadingHistory = ReadingHistory(database_path=Path(tmp_path, "history.sqlite3"))
+    scheduler: PollScheduler = PollScheduler()
+    scheduler.start()
+    poller: GlucosePoller = GlucosePoller(dexcom=dexcom, history=history, scheduler=scheduler)
+    poller.start()
+    assert dexcom.fetching.wait(timeout=10)
+
+    stopped: list[bool] = []
+    stopper: threading.Thread = threading.Thread(target=lambda: stopped.append(poller.stop(timeout=10)))
+    stopper.start()
+    stopper.join(timeout=0.2)
+    assert stopped == []
+    dexcom.release.set()
+    stopper.join(timeout=10)
+    assert stopped == [True]
+    history.close()
+    scheduler.stop()
+
+    assert len(ReadingHistory(database_path=Path(tmp_path, "history.sqlite3"))) == 1
+
+
+def test_fetch_finishing_after_close_stores_nothing(tmp_path: Path) -> None:
+    dexcom: BlockingDexcom = BlockingDexcom()
+    dexcom.readings = [reading(age=timedelta(minutes=1))]
+    history: ReadingHistory = ReadingHistory(database_path=Path(tmp_path, "history.sqlite3"))
+    scheduler: PollScheduler = PollScheduler()
+    scheduler.start()
+    poller: GlucosePoller = GlucosePoller(dexcom=dexcom, history=history, scheduler=scheduler)
+    poller.start()
+    assert dexcom.fetching.wait(timeout=10)
+
+    assert not poller.stop(timeout=0.05)
+    history.close()
+    dexcom.release.set()
+    assert scheduler.remove(poller, timeout=10)
+    scheduler.stop()
+
+    assert not poller.stale
+    assert len(ReadingHistory(database_path=Path(tmp_path, "history.sqlite3"))) == 0
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import numpy as np
+from pydexcom.glucose_reading import GlucoseReading
+
+from dexcom_browser_source.history import ReadingHistory, create_glucose_reading
+
+FIVE_MINUTES_MS: int = 5 * 60_000
+
+
+# count readings five minutes apart, the newest one a few minutes ago
+def readings(count: int, first_mg_dl: int = 100) -> list[GlucoseReading]:
+    newest: int = int(datetime.now(tz=timezone.utc).timestamp() * 1000) // FIVE_MINUTES_MS * FIVE_MINUTES_MS
+    return [create_glucose_reading(timestamp=newest - (count - 1 - index) * FIVE_MINUTES_MS, mg_dl=first_mg_dl + index, trend="Flat", utc_offset=-300)
+            for index in range(count)]
+
+
+def test_ring_keeps_the_newest_readings_in_order(tmp_path: Path) -> None:
+    history: ReadingHistory = ReadingHistory(database_path=Path(tmp_path, "history.sqlite3"), capacity=4)
+    history.extend(readings(count=7))
+
+    timestamps, mg_dl = history.window(since=datetime.fromtimestamp(0, tz=timezone.utc))
+    assert len(history) == 4
+    assert mg_dl.tolist() == [103, 104, 105, 106]
+    assert np.all(np.diff(timestamps) == FIVE_MINUTES_MS)
+    assert history.latest_reading().mg_dl == 106
+    history.close()
+
+
+def test_window_bisects_across_the_wrap(tmp_path: Path) -> None:
+    history: ReadingHistory = ReadingHistory(database_path=Path(tmp_path, "history.sqlite3"), capacity=5)
+    added: list[GlucoseReading] = readings(count=8)
+    history.extend(added)
+
+    # the ring now starts in the middle of the buffer, readings 3 to 7 are kept
+    for first in range(3, 8):
+        _, mg_dl = history.window(since=added[first].datetime)
+        assert mg_dl.tolist() == [100 + index for index in range(first, 8)]
+    _, mg_dl = history.window(since=added[-1].datetime + timedelta(minutes=1))
+    assert len(mg_dl) == 0
+    history.close()
+
+
+def test_reload_from_sqlite(tmp_path: Path) -> None:
+    database_path: Path = Path(tmp_path, "history.sqlite3")
+    history: ReadingHistory = ReadingHistory(database_path=database_path, capacity=6)
+    history.extend(readings(count=9))
+    expected: tuple[np.ndarray, np.ndarray] = history.window(since=datetime.fromtimestamp(0, tz=timezone.utc))
+    newest: GlucoseReading | None = history.latest_reading()
+    history.close()
+
+    # the rows the ring dropped were deleted from the database as well
+    reloaded: ReadingHistory = ReadingHistory(database_path=database_path, capacity=6)
+    timestamps, mg_dl = reloaded.window(since=datetime.fromtimestamp(0, tz=timezone.utc))
+    assert timestamps.tolist() == expected[0].tolist()
+    assert mg_dl.tolist() == expected[1].tolist()
+    assert reloaded.latest_reading().datetime == newest.datetime
+    assert reloaded.latest_reading().trend_direction == "Flat"
+    assert reloaded.tzinfo().utcoffset(None) == timedelta(minutes=-300)
+    reloaded.close()
+
+
+def test_reload_into_a_smaller_ring_keeps_the_newest(tmp_path: Path) -> None:
+    database_path: Path = Path(tmp_path, "history.sqlite3")
+    history: ReadingHistory = ReadingHistory(database_path=database_path, capacity=10)
+    history.extend(readings(count=10))
+    history.close()
+
+    reloaded: ReadingHistory = ReadingHistory(database_path=database_path, capacity=3)
+    reloaded.extend(readings(count=11)[-1:])
+    _, mg_dl = reloaded.window(since=datetime.fromtimestamp(0, tz=timezone.utc))
+    assert mg_dl.tolist() == [108, 109, 110]
+    reloaded.close()
+
+
+# remembers what the history asked for and answers with readings
+class RecordingDexcom:
+    def __init__(self, readings: list[GlucoseReading]):
+        self.readings: list[GlucoseReading] = readings
+        self.requests: list[tuple[int, int]] = []
+
+    def get_glucose_readings(self, minutes: int, max_count: int) -> list[GlucoseReading]:
+        self.requests.append((minutes, max_count))
+        return self.readings
+
+
+def test_sync_only_fetches_and_stores_the_delta(tmp_path: Path) -> None:
+    history: ReadingHistory = ReadingHistory(database_path=Path(tmp_path, "history.sqlite3"))
+    added: list[GlucoseReading] = readings(count=6)
+    # an empty history asks for everything share has
+    dexcom: RecordingDexcom = RecordingDexcom(readings=added[:3])
+    assert history.sync(dexcom=dexcom) == added[:3]
+    assert dexcom.requests == [(1440, 288)]
+
+    # share answers newest first and overlapping what is stored, only the newer readings are added
+    dexcom.readings = list(reversed(added))
+    new_readings: list[GlucoseReading] = history.sync(dexcom=dexcom)
+    assert [reading.mg_dl for reading in new_readings] == [103, 104, 105]
+    minutes, max_count = dexcom.requests[-1]
+    assert minutes < 30 and max_count <= minutes // 5 + 1
+    _, mg_dl = history.window(since=datetime.fromtimestamp(0, tz=timezone.utc))
+    assert mg_dl.tolist() == [100, 101, 102, 103, 104, 105]
+    history.close()
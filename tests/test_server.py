@@ -0,0 +1,118 @@
+from collections.abc import Iterator
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Response
+from flask.testing import FlaskClient
+from werkzeug.test import TestResponse
+import pytest
+
+from dexcom_browser_source.chart import ChartRenderTimeout
+from dexcom_browser_source.config import AppConfig
+from dexcom_browser_source.fake_share import FakeShareServer
+from dexcom_browser_source.metrics import METRIC_PREFIX
+from dexcom_browser_source.server import conditional_response, create_app, etag_for, shutdown_app
+
+LAST_MODIFIED: datetime = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def never_render() -> tuple[str, int]:
+    raise AssertionError("a 304 must not render")
+
+
+def test_conditional_response_renders_and_tags() -> None:
+    with Flask(__name__).test_request_context("/"):
+        response: Response = conditional_response(etag_parts=("reading", 1), last_modified=LAST_MODIFIED, render=lambda: ("body", 200))
+    assert response.status_code == 200
+    assert response.get_etag()[0] == etag_for(etag_parts=("reading", 1))
+    assert response.last_modified == LAST_MODIFIED
+    assert response.cache_control.no_cache
+
+
+def test_conditional_response_304_on_matching_etag() -> None:
+    etag: str = etag_for(etag_parts=("reading", 1))
+    with Flask(__name__).test_request_context("/", headers={"If-None-Match": f'"{etag}"'}):
+        response: Response = conditional_response(etag_parts=("reading", 1), last_modified=LAST_MODIFIED, render=never_render)
+    assert response.status_code == 304
+    assert response.get_etag()[0] == etag
+
+
+def test_conditional_response_304_on_if_modified_since() -> None:
+    headers: dict[str, str] = {"If-Modified-Since": (LAST_MODIFIED + timedelta(seconds=1)).strftime("%a, %d %b %Y %H:%M:%S GMT")}
+    with Flask(__name__).test_request_context("/", headers=headers):
+        response: Response = conditional_response(etag_parts=("reading", 1), last_modified=LAST_MODIFIED, render=never_render)
+    assert response.status_code == 304
+
+
+def test_conditional_response_etag_wins_over_date() -> None:
+    headers: dict[str, str] = {"If-None-Match": '"outdated"', "If-Modified-Since": LAST_MODIFIED.strftime("%a, %d %b %Y %H:%M:%S GMT")}
+    with Flask(__name__).test_request_context("/", headers=headers):
+        response: Response = conditional_response(etag_parts=("reading", 2), last_modified=LAST_MODIFIED, render=lambda: ("body", 200))
+    assert response.status_code == 200
+
+
+@pytest.fixture
+def client(app_config: AppConfig, fake_share: FakeShareServer) -> Iterator[FlaskClient]:
+    app_config.config['dexcom']['account'] = {"username": "username", "password": "password"}
+    app_config.config['dexcom']['share_url'] = fake_share.url
+    app: Flask = create_app(app_config=app_config)
+    yield app.test_client()
+    shutdown_app(app)
+
+
+def test_chart_image_endpoint(client: FlaskClient) -> None:
+    chart: TestResponse = client.get("/api/last/3.png?width=320&height=240")
+    assert chart.status_code == 200
+    assert chart.content_type == "image/png"
+    assert chart.data.startswith(b"\x89PNG")
+    assert client.get("/api/last/3.png?width=320&height=240", headers={"If-None-Match": chart.headers["ETag"]}).status_code == 304
+    assert client.get("/api/last/3.svg?width=320&height=240").content_type.startswith("image/svg+xml")
+
+
+def test_graph_fragment_does_not_echo_the_query_string(client: FlaskClient) -> None:
+    fragment: TestResponse = client.get('/api/last/3?width=320&height=240&x="><script>alert(1)</script>')
+    assert fragment.status_code == 200
+    text: str = fragment.get_data(as_text=True)
+    assert "<script>" not in text and "alert" not in text
+    assert 'hx-get="/api/last/3?width=320&amp;height=240&amp;dpi=100"' in text
+
+
+# /api/renderer and /metrics read the same histogram
+def test_renderer_stats_match_metrics(client: FlaskClient) -> None:
+    assert client.get("/api/last/3.png?width=320&height=240").status_code == 200
+    renders: int = client.get("/api/renderer").get_json()["renders"]
+    assert renders >= 1
+    assert f"{METRIC_PREFIX}chart_render_duration_seconds_count {renders}\n" in client.get("/metrics").get_data(as_text=True)
+
+
+def test_chart_render_timeout_is_a_503(client: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    def render_timeout(**kwargs: object) -> bytes:
+        raise ChartRenderTimeout(timeout=0.0)
+
+    monkeypatch.setattr(client.application.extensions['chart_render_pool'], "render", render_timeout)
+    chart: TestResponse = client.get("/api/last/3.png?width=320&height=240")
+    assert chart.status_code == 503
+    assert chart.headers["Retry-After"] == "5"
+    assert "ETag" not in chart.headers
+
+
+# the whole stack against the fake share server, every request answered from what the poller fetched
+def test_create_app_end_to_end(client: FlaskClient, fake_share: FakeShareServer) -> None:
+    current: TestResponse = client.get("/api/current")
+    assert current.status_code == 200
+    assert client.get("/api/current", headers={"If-None-Match": current.headers["ETag"]}).status_code == 304
+    assert client.get("/api/last/3.png?width=320&height=240").status_code == 200
+    assert fake_share.stats()["calls"]["Publisher/ReadPublisherLatestGlucoseValues"] == 1
+
+
+def test_overlay_varies_on_accept(client: FlaskClient) -> None:
+    html: TestResponse = client.get("/api/overlay?parts=glucose")
+    snapshot: TestResponse = client.get("/api/overlay?parts=glucose", headers={"Accept": "application/json"})
+    assert html.content_type.startswith("text/html")
+    assert snapshot.get_json()["value"] is not None
+    assert html.headers["Vary"] == snapshot.headers["Vary"] == "Accept"
+    assert html.headers["ETag"] != snapshot.headers["ETag"]
+    assert client.get("/api/overlay?parts=glucose", headers={"Accept": "application/json", "If-None-Match": html.headers["ETag"]}).status_code == 200
+
+
+def test_stats_endpoint(client: FlaskClient) -> None:
+    stats: dict[str, object] = client.get("/api/stats/6").get_json()
+    assert stats["readings"] > 0
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from dexcom_browser_source.stats import AGP_BINS, AGP_PERCENTILES, MILLISECONDS_PER_DAY, StatsThresholds, ambulatory_glucose_profile, glucose_ranges, glucose_stats
+
+THRESHOLDS: StatsThresholds = StatsThresholds(severe_hypoglycemia=55, hypoglycemia=70, hyperglycemia=180)
+FIVE_MINUTES_MS: int = 5 * 60_000
+
+
+def test_ranges_on_the_thresholds() -> None:
+    mg_dl: np.ndarray = np.array([40, 54, 55, 69, 70, 180, 181, 400])
+    assert glucose_ranges(mg_dl=mg_dl, thresholds=THRESHOLDS).tolist() == [
+        "urgent_low", "urgent_low", "low", "low", "in_range", "in_range", "high", "high"]
+
+
+def test_time_in_ranges_adds_up() -> None:
+    mg_dl: np.ndarray = np.array([50, 60, 100, 120, 150, 170, 200, 250])
+    stats: dict[str, object] = glucose_stats(timestamps=np.arange(8) * FIVE_MINUTES_MS, mg_dl=mg_dl, thresholds=THRESHOLDS, hours=1)
+
+    assert stats["time_very_low_percent"] == 12.5
+    assert stats["time_low_percent"] == 12.5
+    assert stats["time_below_range_percent"] == 25.0
+    assert stats["time_in_range_percent"] == 50.0
+    assert stats["time_high_percent"] == 25.0
+    assert stats["mean_mg_dl"] == pytest.approx(mg_dl.mean(), abs=0.05)
+    assert stats["sd_mg_dl"] == pytest.approx(mg_dl.std(ddof=1), abs=0.05)
+    assert stats["min_mg_dl"] == 50
+    assert stats["max_mg_dl"] == 250
+    assert stats["coverage_percent"] == pytest.approx(8 / 12 * 100, abs=0.05)
+
+
+def test_rate_of_change_skips_gaps() -> None:
+    # rising 1 mg/dL a minute, then a gap of an hour across which glucose dropped
+    timestamps: np.ndarray = np.array([0, 5, 10, 15, 75, 80, 85, 90]) * 60_000
+    mg_dl: np.ndarray = np.array([100, 105, 110, 115, 60, 65, 70, 75])
+    stats: dict[str, object] = glucose_stats(timestamps=timestamps, mg_dl=mg_dl, thresholds=THRESHOLDS, hours=2)
+
+    assert stats["mean_absolute_rate_mg_dl_per_minute"] == 1.0
+    assert stats["rate_of_change_mg_dl_per_minute"] == 1.0
+
+
+def test_no_readings() -> None:
+    stats: dict[str, object] = glucose_stats(timestamps=np.zeros(0, dtype=np.int64), mg_dl=np.zeros(0, dtype=np.uint16), thresholds=THRESHOLDS, hours=24)
+    assert stats["readings"] == 0
+    assert "mean_mg_dl" not in stats
+
+
+def test_agp_matches_numpy_percentiles() -> None:
+    rng: np.random.Generator = np.random.default_rng(seed=1)
+    # two weeks of readings at random times, so bins hold different numbers of them
+    timestamps: np.ndarray = np.sort(rng.integers(0, 14 * MILLISECONDS_PER_DAY, size=4000))
+    mg_dl: np.ndarray = rng.integers(40, 400, size=len(timestamps)).astype(np.uint16)
+    hours, profile = ambulatory_glucose_profile(timestamps=timestamps, mg_dl=mg_dl, utc_offset_ms=0)
+
+    assert hours.tolist() == [index * 24 / AGP_BINS for index in range(AGP_BINS)]
+    bin_of: np.ndarray = (timestamps % MILLISECONDS_PER_DAY) * AGP_BINS // MILLISECONDS_PER_DAY
+    for index in range(AGP_BINS):
+        expected: np.ndarray = np.percentile(mg_dl[bin_of == index], [percentile * 100 for percentile in AGP_PERCENTILES])
+        assert profile[:, index] == pytest.approx(expected)
+
+
+def test_agp_folds_onto_local_time() -> None:
+    # 00:50 utc is 23:50 an hour west of it, in the last bin, and every other bin stays empty
+    hours, profile = ambulatory_glucose_profile(timestamps=np.array([50 * 60_000]), mg_dl=np.array([123]), utc_offset_ms=-3_600_000)
+    assert profile[:, -1].tolist() == [123.0] * len(AGP_PERCENTILES)
+    assert np.isnan(profile[:, :-1]).all()
@@ -0,0 +1,52 @@
+import threading
+from collections.abc import Iterator
+
+from dexcom_browser_source.stream import SUBSCRIBER_BACKLOG, ReadingStream, format_event
+
+
+def test_subscriber_only_gets_its_events() -> None:
+    stream: ReadingStream = ReadingStream()
+    events: Iterator[str] = stream.subscribe(events=frozenset({"reading"}), initial_events=[("reading", "100")])
+    assert next(events) == format_event(event="reading", data="100")
+    stream.publish(event="status", data="stale")
+    stream.publish(event="reading", data="105")
+    assert next(events) == "event: reading\ndata: 105\n\n"
+    stream.close()
+    assert list(events) == []
+    assert stream.subscriber_count == 0
+
+
+def test_backlogged_subscriber_is_dropped() -> None:
+    stream: ReadingStream = ReadingStream()
+    events: Iterator[str] = stream.subscribe(events=frozenset({"reading"}), initial_events=[])
+    for value in range(SUBSCRIBER_BACKLOG + 1):
+        stream.publish(event="reading", data=str(value))
+    assert stream.subscriber_count == 0
+    # what was queued is dropped and the response ends
+    assert list(events) == []
+
+
+def test_publish_racing_close_always_ends_the_stream() -> None:
+    for _ in range(20):
+        stream: ReadingStream = ReadingStream()
+        subscribers: list[Iterator[str]] = [stream.subscribe(events=frozenset({"reading"}), initial_events=[]) for _ in range(8)]
+        errors: list[BaseException] = []
+
+        def publish() -> None:
+            try:
+                for value in range(200):
+                    stream.publish(event="reading", data=str(value))
+            except BaseException as e:
+                errors.append(e)
+
+        publishers: list[threading.Thread] = [threading.Thread(target=publish) for _ in range(4)]
+        for publisher in publishers:
+            publisher.start()
+        stream.close()
+        for publisher in publishers:
+            publisher.join()
+
+        assert errors == []
+        # every subscriber was closed and its response ends once it has read the sentinel
+        for events in subscribers:
+            assert all(message.startswith("event: reading") for message in events)